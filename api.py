@@ -1,7 +1,12 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 import databases
 from fastapi import FastAPI, Depends, Header, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import json
+import logging
 from os import urandom
 from pydantic import BaseModel, StrictBool, StringConstraints, PositiveInt
 import random
@@ -13,15 +18,15 @@ from slowapi.extension import Limiter
 from slowapi.util import get_remote_address
 import time
 from typing import Optional
-
-match_video_id = re.compile(r'^(?:<)?(?:http(?:s)?://)?(?:www\.)?(?:youtu\.be/)?(?:youtube\.com/watch\?v=)?([A-Za-z0-9_-]{10}[AEIMQUYcgkosw048])(?:>)?$')
-match_channel_id = re.compile(r'^(?:<)?(?:http(?:s)?://)?(?:www\.)?(?:youtube\.com/channel/)?(?:UC)?([A-Za-z0-9_-]{21}[AQgw])(?:>)?$')
+from yt_ids import match_video_id, match_channel_id, video_id_to_int, pack_video_ids
+import zlib
 
 def get_api_key(request):
     return request.headers.get('Authorization') or get_remote_address(request)
 
 limiter = Limiter(key_func=get_api_key)
 app = FastAPI(root_path='/api', docs_url=None, redoc_url=None)
+logger = logging.getLogger(__name__)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -31,15 +36,737 @@ if isfile(configfile):
         config = json.loads(f.read())
 else:
     password = 'default_password'
-database = databases.Database(f'postgresql+asyncpg://{config["user"]}:{config["password"]}@{config["host"]}:{config["port"]}/{config["table"]}')
+# pool is opened once in startup_event, every gunicorn worker gets its own (max db connections = workers * pool_max_size)
+database = databases.Database(f'postgresql+asyncpg://{config["user"]}:{config["password"]}@{config["host"]}:{config["port"]}/{config["table"]}',
+    min_size=config.get('pool_min_size', 2),
+    max_size=config.get('pool_max_size', 10),
+    statement_cache_size=config.get('statement_cache_size', 1024),
+    command_timeout=config.get('command_timeout', 60))
+
+class PoolBusy(Exception):
+    pass
+
+class PoolGate:
+    # bounds the connections routes have checked out of the pool so they queue here (where the wait can be timed out and
+    # counted) instead of inside asyncpg's pool.acquire(), which `databases` doesn't expose a timeout for
+    # streamed exports keep their connection for as long as the client takes to download, so they get a few slots of their own
+    def __init__(self, size, stream_size, timeout):
+        self.semaphores = {'in_use': asyncio.Semaphore(size), 'streams': asyncio.Semaphore(stream_size)}
+        self.timeout = timeout
+        self.holders = {} # task -> nesting depth, a task already holding a slot (transaction, connection block) doesn't take another
+        self.counters = {'in_use': 0, 'streams': 0, 'waiting': 0, 'timeouts': 0}
+    
+    @asynccontextmanager
+    async def slot(self, kind='in_use'):
+        task = asyncio.current_task()
+        depth = self.holders.get(task, 0)
+        if not depth:
+            self.counters['waiting'] += 1
+            try:
+                await asyncio.wait_for(self.semaphores[kind].acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.counters['timeouts'] += 1
+                logger.warning(f'pool acquire timed out after {self.timeout}s: {json.dumps(pool_stats())}')
+                raise PoolBusy()
+            finally:
+                self.counters['waiting'] -= 1
+            self.counters[kind] += 1
+        self.holders[task] = depth + 1
+        try:
+            yield
+        finally:
+            if depth:
+                self.holders[task] = depth
+            else:
+                del self.holders[task]
+                self.counters[kind] -= 1
+                self.semaphores[kind].release()
+
+class GatedDatabase:
+    # what routes get as `db`, each use of a pool connection waits for a PoolGate slot first and gives it back right after,
+    # so cache hits, 304s and routes that never touch the db don't queue behind the pool
+    def __init__(self, database, gate):
+        self.database = database
+        self.gate = gate
+    
+    async def fetch_all(self, *args, **kwargs):
+        async with self.gate.slot():
+            return await self.database.fetch_all(*args, **kwargs)
+    
+    async def fetch_one(self, *args, **kwargs):
+        async with self.gate.slot():
+            return await self.database.fetch_one(*args, **kwargs)
+    
+    async def fetch_val(self, *args, **kwargs):
+        async with self.gate.slot():
+            return await self.database.fetch_val(*args, **kwargs)
+    
+    async def execute(self, *args, **kwargs):
+        async with self.gate.slot():
+            return await self.database.execute(*args, **kwargs)
+    
+    async def execute_many(self, *args, **kwargs):
+        async with self.gate.slot():
+            return await self.database.execute_many(*args, **kwargs)
+    
+    async def iterate(self, *args, **kwargs):
+        async with self.gate.slot('streams'):
+            async for row in self.database.iterate(*args, **kwargs):
+                yield row
+    
+    @asynccontextmanager
+    async def connection(self):
+        async with self.gate.slot():
+            async with self.database.connection() as connection:
+                yield connection
+    
+    @asynccontextmanager
+    async def transaction(self):
+        async with self.gate.slot():
+            async with self.database.transaction() as transaction:
+                yield transaction
+
+# ingest workers use the pool directly and hold a connection of their own while merging, keep one free for each
+pool_stream_slots = config.get('pool_stream_slots', 2)
+pool_gate = PoolGate(max(1, config.get('pool_max_size', 10) - config.get('ingest_workers', 1) - pool_stream_slots), pool_stream_slots,
+    config.get('pool_acquire_timeout', 10))
+gated_database = GatedDatabase(database, pool_gate)
+
+async def pool_busy_handler(request, exc):
+    return JSONResponse({'error': 'database busy, try again later'}, status_code=503)
+app.add_exception_handler(PoolBusy, pool_busy_handler)
+
+def pool_stats():
+    # `databases` doesn't expose its asyncpg pool, read it if it's where 0.9 keeps it
+    pool = getattr(getattr(database, '_backend', None), '_pool', None)
+    return {
+        'pool': {
+            'size': pool.get_size() if pool else 0,
+            'idle': pool.get_idle_size() if pool else 0,
+            'min_size': pool.get_min_size() if pool else None,
+            'max_size': pool.get_max_size() if pool else None
+        },
+        'requests': dict(pool_gate.counters)
+    }
 
 def get_database():
-    return database
+    return gated_database
+
+class TTLCache:
+    # bounded LRU cache with per-entry expiry, entries can be tagged with entities
+    # (e.g. ('channel', id)) so a write can drop every cached page touching that entity
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (expires, tags, value)
+        self.tagged = {} # tag -> set of keys
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+    
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.counters['misses'] += 1
+            return None
+        if entry[0] < time.monotonic():
+            self.drop(key); self.counters['expirations'] += 1; self.counters['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return entry[2]
+    
+    def set(self, key, value, tags=()):
+        self.drop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, tuple(tags), value)
+        for tag in tags:
+            self.tagged.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self.drop(next(iter(self.entries))); self.counters['evictions'] += 1
+    
+    def drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys: del self.tagged[tag]
+    
+    def invalidate(self, tags):
+        for tag in tags:
+            for key in list(self.tagged.get(tag, ())):
+                self.drop(key); self.counters['invalidations'] += 1
+    
+    def clear(self):
+        self.counters['invalidations'] += len(self.entries)
+        self.entries.clear(); self.tagged.clear()
+    
+    def stats(self):
+        return {'entries': len(self.entries), 'max_entries': self.max_entries, 'ttl': self.ttl, **self.counters}
+
+# read endpoint payloads, per worker; writes in this worker invalidate, other workers rely on the ttl
+response_cache = TTLCache(config.get('response_cache_max_entries', 20000), config.get('response_cache_ttl', 60))
+
+# full api_keys rows by key, unknown keys are cached as {} so bad keys don't hit the db either
+# keep the ttl short, a key deleted through another worker stays valid here until it expires
+api_key_cache = TTLCache(config.get('api_key_cache_max_entries', 10000), config.get('api_key_cache_ttl', 30))
 
 async def verify_api_key(db, key, perm):
-    await db.connect()
-    row = await db.fetch_one(query=f'SELECT {perm} FROM api_keys WHERE api_key = :key', values={'key': key})
-    return dict(row or {}).get(perm, False)
+    row = api_key_cache.get(key)
+    if row is None:
+        row = await db.fetch_one(query='SELECT * FROM api_keys WHERE api_key = :key', values={'key': key})
+        row = dict(row or {})
+        api_key_cache.set(key, row)
+    return row.get(perm, False)
+
+async def fetch_video_contributions(db, video_ids):
+    # pull contributions/contributors for a set of videos (db ids) with a single join
+    contributions = {vid: [] for vid in video_ids}
+    if not contributions:
+        return contributions
+    
+    rows = await db.fetch_all(query='''
+        SELECT contributions_v.video_id, formats.format_string, contributions_v.filesize,
+            contributors.name, contributors.discord_id, contributors.alternative_contact_info
+        FROM contributions_v
+        JOIN contributors ON contributors.id = contributions_v.contributor_id
+        LEFT JOIN formats ON formats.id = contributions_v.format_id
+        WHERE contributions_v.video_id = ANY(:video_ids)''', values={'video_ids': list(contributions.keys())})
+    for r in rows:
+        contributions[r['video_id']].append({
+            'format_string': r['format_string'],
+            'filesize': r['filesize'],
+            'contributor': {
+                'name': r['name'],
+                'discord_id': r['discord_id'] if (not r['alternative_contact_info']) else None,
+                'alternative_contact_info': r['alternative_contact_info']
+            }
+        })
+    return contributions
+
+async def refresh_video_titles(db, video_ids):
+    # copy the newest titles_v row onto videos.title so reads don't need a titles_v subquery
+    # titles added in the same second are ordered by id, so the pick doesn't depend on the plan
+    await db.execute(query='''
+        UPDATE videos SET title = latest.title FROM (
+            SELECT DISTINCT ON (video_id) video_id, title FROM titles_v
+            WHERE video_id = ANY(:ids) ORDER BY video_id, time_added DESC, id DESC
+        ) latest WHERE videos.id = latest.video_id AND videos.title IS DISTINCT FROM latest.title''', values={'ids': video_ids})
+
+async def refresh_channel_titles(db, channel_ids):
+    # copy the newest titles_c row onto channels.title
+    await db.execute(query='''
+        UPDATE channels SET title = latest.title FROM (
+            SELECT DISTINCT ON (channel_id) channel_id, title FROM titles_c
+            WHERE channel_id = ANY(:ids) ORDER BY channel_id, time_added DESC, id DESC
+        ) latest WHERE channels.id = latest.channel_id AND channels.title IS DISTINCT FROM latest.title''', values={'ids': channel_ids})
+
+# the merge_* statements read rows from `source`, a from-item aliased as t: an unnest() of arrays bound
+# through `values` (regular submits) or a staging table (bulk uploads)
+VIDEO_SOURCE = '''unnest(CAST(:vids AS CHAR(11)[]), CAST(:cids AS CHAR(22)[]), CAST(:cnids AS INT[]), CAST(:titles AS TEXT[]),
+    CAST(:ctitles AS TEXT[]), CAST(:fs AS TEXT[]), CAST(:sizes AS BIGINT[])) AS t(vid, cid, cnid, title, ctitle, fs, size)'''
+CHANNEL_SOURCE = '''unnest(CAST(:cids AS CHAR(22)[]), CAST(:cnids AS INT[]), CAST(:ctitles AS TEXT[]), CAST(:notes AS TEXT[]))
+    AS t(cid, cnid, ctitle, note)'''
+
+async def merge_channel_titles(db, source, values={}):
+    # insert channel ids and any new channel titles from a source with (cid, cnid, ctitle) columns
+    # everything is inserted in key order so concurrent ingests lock index entries in the same order
+    await db.execute(query=f'''
+        INSERT INTO channels (channel_id) SELECT DISTINCT t.cid FROM {source} WHERE t.cid IS NOT NULL
+        ORDER BY 1 ON CONFLICT DO NOTHING''', values=values)
+    rows = await db.fetch_all(query=f'''
+        INSERT INTO titles_c (time_added, channel_id, contributor_id, title)
+        SELECT DISTINCT CAST(:ta AS INT), channels.id, t.cnid, t.ctitle FROM {source}
+        JOIN channels ON channels.channel_id = t.cid WHERE t.ctitle IS NOT NULL
+        ORDER BY 2 ON CONFLICT DO NOTHING RETURNING channel_id''', values={**values, 'ta': int(time.time())})
+    if rows:
+        await refresh_channel_titles(db, list({r['channel_id'] for r in rows}))
+
+async def merge_channels(db, source, values={}):
+    # channel contributions from a source with (cid, cnid, ctitle, note) columns, returns the number of new contributions_c rows
+    await merge_channel_titles(db, source, values)
+    return await db.fetch_val(query=f'''
+        WITH inserted AS (
+            INSERT INTO contributions_c (channel_id, contributor_id, note)
+            SELECT channels.id, t.cnid, t.note FROM {source}
+            JOIN channels ON channels.channel_id = t.cid
+            ORDER BY channels.id ON CONFLICT DO NOTHING RETURNING 1
+        ) SELECT count(*) FROM inserted''', values=values)
+
+async def merge_videos(db, source, values={}):
+    # video contributions from a source with (vid, cid, cnid, title, ctitle, fs, size) columns
+    # natural ids are mapped to serial ids with joins inside each statement instead of per-row lookups,
+    # so a batch costs a fixed handful of statements no matter its size (or how many contributors it mixes)
+    # returns the number of new contributions_v rows
+    await merge_channel_titles(db, source, values)
+    
+    await db.execute(query=f'''
+        INSERT INTO formats (format_string) SELECT DISTINCT left(t.fs, 255) FROM {source} WHERE t.fs IS NOT NULL
+        ORDER BY 1 ON CONFLICT DO NOTHING''', values=values)
+    
+    await db.execute(query=f'''
+        INSERT INTO videos (video_id, channel_id)
+        SELECT t.vid, channels.id FROM {source}
+        LEFT JOIN channels ON channels.channel_id = t.cid
+        ORDER BY t.vid ON CONFLICT DO NOTHING''', values=values)
+    
+    rows = await db.fetch_all(query=f'''
+        INSERT INTO titles_v (time_added, video_id, contributor_id, title)
+        SELECT DISTINCT CAST(:ta AS INT), videos.id, t.cnid, t.title FROM {source}
+        JOIN videos ON videos.video_key = video_id_key(t.vid) WHERE t.title IS NOT NULL
+        ORDER BY 2 ON CONFLICT DO NOTHING RETURNING video_id''', values={**values, 'ta': int(time.time())})
+    if rows:
+        await refresh_video_titles(db, list({r['video_id'] for r in rows}))
+    
+    return await db.fetch_val(query=f'''
+        WITH inserted AS (
+            INSERT INTO contributions_v (video_id, contributor_id, format_id, filesize)
+            SELECT videos.id, t.cnid, formats.id, t.size FROM {source}
+            JOIN videos ON videos.video_key = video_id_key(t.vid)
+            LEFT JOIN formats ON formats.format_string = left(t.fs, 255)
+            ORDER BY videos.id ON CONFLICT DO NOTHING RETURNING 1
+        ) SELECT count(*) FROM inserted''', values=values)
+
+def parse_submitted_video(v, i=0):
+    # validate/normalize one /submit_videos item, returns (video, None) or (None, error message)
+    if type(v) != dict or not 'id' in v:
+        return None, f'video at position `{i}` is missing `id` key'
+    
+    # test video and channel ids
+    v_id = match_video_id.match(v['id']) if type(v['id']) == str else None
+    if not v_id:
+        return None, f'invalid video id {v["id"]}'
+    v_id = v_id[1]
+    
+    if v.get('channel_id'):
+        c_id = match_channel_id.match(v['channel_id']) if type(v['channel_id']) == str else None
+        if not c_id:
+            return None, f'invalid channel id `{v["channel_id"]}`'
+        c_id = c_id[1]
+    else:
+        c_id = None
+    
+    # assert filesize is int (ik this is so dumb and I should be using pydantic)
+    if v.get('filesize') and type(v.get('filesize')) == str:
+        if not v['filesize'].isdigit():
+            return None, 'filesize should be int, digit str, or null'
+    elif v.get('filesize') and type(v.get('filesize')) != int:
+        return None, 'filesize should be int, digit str, or null'
+    for field in ['title', 'channel_title', 'format_id']:
+        if v.get(field) and type(v[field]) != str:
+            return None, f'{field} should be str or null'
+        elif v.get(field) and '\x00' in v[field]:
+            return None, f'{field} contains a null character'
+    
+    return {
+        'id': v_id,
+        'title': v.get('title') or None,
+        'channel_id': c_id,
+        'channel_title': (v.get('channel_title') or None) if c_id else None,
+        'filesize': int(v.get('filesize') or 0) or None,
+        'format_id': v.get('format_id') or None}, None
+
+def parse_submitted_channel(c, i=0):
+    # validate/normalize one /submit_channels item, returns (channel, None) or (None, error message)
+    if type(c) != dict or not 'id' in c:
+        return None, f'channel at position `{i}` is missing `id` key'
+    
+    c_id = match_channel_id.match(c['id']) if type(c['id']) == str else None
+    if not c_id:
+        return None, f'invalid channel id {c["id"]}'
+    for field in ['title', 'note']:
+        if c.get(field) and type(c[field]) != str:
+            return None, f'{field} should be str or null'
+        elif c.get(field) and '\x00' in c[field]:
+            return None, f'{field} contains a null character'
+    
+    return {
+        'id': c_id[1],
+        'title': c.get('title') or None,
+        'note': c.get('note') or None}, None
+
+async def iter_upload_lines(request, max_line=1 << 20):
+    # yield the lines of a (optionally gzipped) request body as it arrives, memory is bounded by max_line
+    decompressor = None
+    pending = b''
+    head = b''
+    async for chunk in request.stream():
+        if head is not None:
+            # sniff gzip from the first 2 bytes, however the body happens to be split
+            head += chunk
+            if len(head) < 2:
+                continue
+            chunk, head = head, None
+            if chunk[:2] == b'\x1f\x8b':
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while chunk:
+            if decompressor:
+                if decompressor.eof:
+                    # concatenated gzip members (e.g. `cat a.gz b.gz`), each one gets a fresh decompressor
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data = decompressor.decompress(chunk, max_line)
+                # input past the end of a member is in unused_data (and might be in unconsumed_tail too)
+                chunk = decompressor.unused_data if decompressor.eof else decompressor.unconsumed_tail
+            else:
+                data, chunk = chunk, b''
+            pending += data
+            if b'\n' in data:
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    yield line
+            if len(pending) > max_line:
+                raise ValueError(f'line longer than {max_line} bytes')
+    if decompressor and not decompressor.eof:
+        raise ValueError('gzip body is truncated')
+    pending += head or b''
+    for line in pending.split(b'\n'):
+        yield line
+
+async def iter_upload_items(request, summary):
+    # parse a streamed upload, either ndjson of /submit_videos items or a compile_videos.py tsv
+    # yields ('video', video) and ('channel', {'id', 'title'}) for tsv channel titles, bad and excluded lines are counted in summary
+    skipped_channels = set()
+    mode, section, fields = None, None, None
+    
+    def invalid(error):
+        summary['invalid'] += 1
+        if len(summary['errors']) < 100:
+            summary['errors'].append({'line': summary['lines'], 'error': error})
+    
+    async for line in iter_upload_lines(request):
+        summary['lines'] += 1
+        try:
+            line = line.decode('utf-8').rstrip('\r')
+        except UnicodeDecodeError:
+            invalid('line is not valid utf-8'); continue
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if mode is None:
+            mode = 'ndjson' if stripped.startswith('{') else 'tsv'
+        
+        if mode == 'ndjson':
+            try:
+                v = json.loads(stripped)
+            except json.decoder.JSONDecodeError:
+                invalid('malformed json'); continue
+        elif stripped in ['[CHANNELS]', '[VIDEOS]']:
+            section, fields = stripped, None; continue
+        elif fields is None:
+            fields = [(c.split() or [''])[0] for c in line.split('\t')] # header, e.g. `include (y/n, blank is y)` -> `include`
+            continue
+        else:
+            row = dict(zip(fields, [c.strip() for c in line.split('\t')]))
+            if section == '[CHANNELS]':
+                if row.get('include') == 'n' or row.get('channel_id') == 'UNSET_CHANNEL_ID':
+                    skipped_channels.add(row.get('channel_id')); summary['excluded'] += 1
+                    continue
+                channel, error = parse_submitted_channel({'id': row.get('channel_id') or '', 'title': row.get('title')}, summary['lines'])
+                if error:
+                    invalid(error)
+                elif channel['title']:
+                    yield 'channel', channel
+                continue
+            elif section != '[VIDEOS]':
+                invalid('tsv row outside of a [CHANNELS] or [VIDEOS] section'); continue
+            if row.get('include') == 'n' or (row.get('channel_id') or 'UNSET_CHANNEL_ID') in skipped_channels:
+                summary['excluded'] += 1; continue
+            v = {
+                'id': row.get('video_id') or '',
+                'channel_id': row.get('channel_id') if row.get('channel_id') != 'UNSET_CHANNEL_ID' else None,
+                'format_id': row.get('format_id'),
+                'title': row.get('title'),
+                'filesize': row.get('filesize')}
+        
+        video, error = parse_submitted_video(v, summary['lines'])
+        if error:
+            invalid(error); continue
+        yield 'video', video
+
+async def flush_bulk_videos(db, rows):
+    # COPY rows (tuples in VIDEO_SOURCE column order) into a per-transaction staging table and merge from it
+    async with db.connection() as connection:
+        async with connection.transaction():
+            await connection.execute(query='''
+                CREATE TEMP TABLE bulk_videos (vid CHAR(11), cid CHAR(22), cnid INT, title TEXT, ctitle TEXT, fs TEXT, size BIGINT)
+                ON COMMIT DROP''')
+            await connection.raw_connection.copy_records_to_table('bulk_videos', records=rows, columns=['vid', 'cid', 'cnid', 'title', 'ctitle', 'fs', 'size'])
+            await connection.execute(query='ANALYZE bulk_videos')
+            return await merge_videos(connection, 'bulk_videos AS t')
+
+async def apply_video_sync(db, contributor_id, session_id):
+    # diff a staged manifest against the contributor's contributions_v rows and write only what changed
+    # returns None for an empty manifest, else counts and the added/removed video ids
+    values = {'sid': session_id, 'cnid': contributor_id}
+    async with db.connection() as connection:
+        async with connection.transaction():
+            # the session row stays locked until the diff is committed, stale session cleanup can't drop it halfway
+            if not await connection.fetch_val(query='SELECT id FROM sync_sessions WHERE id = :sid FOR UPDATE', values={'sid': session_id}):
+                return None
+            manifest_count = await connection.fetch_val(query='SELECT count(DISTINCT vid) FROM sync_manifests WHERE session_id = :sid', values={
+                'sid': session_id})
+            if not manifest_count:
+                return None
+            
+            # channel lines are staged too, their titles are only written along with the diff
+            await merge_channel_titles(connection, '''
+                (SELECT DISTINCT cid, CAST(:cnid AS INT) AS cnid, ctitle FROM sync_manifest_channels WHERE session_id = :sid) AS t''', values)
+            
+            await connection.execute(query='''
+                CREATE TEMP TABLE sync_added (vid CHAR(11), cid CHAR(22), cnid INT, title TEXT, ctitle TEXT, fs TEXT, size BIGINT)
+                ON COMMIT DROP''')
+            await connection.execute(query='''
+                INSERT INTO sync_added
+                SELECT DISTINCT ON (s.vid) s.vid, s.cid, CAST(:cnid AS INT), s.title, s.ctitle, s.fs, s.size FROM sync_manifests s
+                WHERE s.session_id = :sid AND NOT EXISTS (
+                    SELECT 1 FROM videos JOIN contributions_v ON contributions_v.video_id = videos.id AND contributions_v.contributor_id = :cnid
+                    WHERE videos.video_key = video_id_key(s.vid))
+                ORDER BY s.vid''', values=values)
+            await connection.execute(query='ANALYZE sync_added')
+            added = [r['vid'] for r in await connection.fetch_all(query='SELECT vid FROM sync_added')]
+            if added:
+                await merge_videos(connection, 'sync_added AS t')
+            
+            # videos still waiting in the contributor's async submit jobs aren't in contributions_v yet, they're kept too
+            await connection.execute(query='''
+                CREATE TEMP TABLE sync_queued ON COMMIT DROP AS
+                SELECT DISTINCT item->>'id' as vid FROM ingest_jobs CROSS JOIN jsonb_array_elements(items) item
+                WHERE contributor_id = :cnid AND status = 'queued' AND kind = 'videos'
+                ''', values={'cnid': contributor_id})
+            removed = await connection.fetch_all(query='''
+                DELETE FROM contributions_v USING videos
+                WHERE contributions_v.contributor_id = :cnid AND videos.id = contributions_v.video_id
+                AND NOT EXISTS (SELECT 1 FROM sync_manifests s WHERE s.session_id = :sid AND s.vid = videos.video_id)
+                AND NOT EXISTS (SELECT 1 FROM sync_queued q WHERE q.vid = videos.video_id)
+                RETURNING videos.video_id''', values=values)
+            removed = [r['video_id'] for r in removed]
+            
+            # staged rows go with the session (ON DELETE CASCADE)
+            await connection.execute(query='DELETE FROM sync_sessions WHERE id = :sid', values={'sid': session_id})
+    
+    return {'manifest': manifest_count, 'added': added, 'removed': removed}
+
+async def ingest_channels(db, channels):
+    # channels: list of {'contributor_id', 'id', 'title', 'note'}, run inside a transaction
+    return await merge_channels(db, CHANNEL_SOURCE, {
+        'cids': [c['id'] for c in channels],
+        'cnids': [c['contributor_id'] for c in channels],
+        'ctitles': [c['title'] for c in channels],
+        'notes': [c['note'] for c in channels]})
+
+async def ingest_videos(db, videos):
+    # videos: list of {'contributor_id', 'id', 'title', 'channel_id', 'channel_title', 'format_id', 'filesize'}, run inside a transaction
+    return await merge_videos(db, VIDEO_SOURCE, {
+        'vids': [v['id'] for v in videos],
+        'cids': [v['channel_id'] for v in videos],
+        'cnids': [v['contributor_id'] for v in videos],
+        'titles': [v['title'] for v in videos],
+        'ctitles': [v.get('channel_title') for v in videos],
+        'fs': [v['format_id'] for v in videos],
+        'sizes': [v['filesize'] for v in videos]})
+
+# async submits (?async=true) are validated and stored in ingest_jobs, then answered with a 202
+# ingest_worker tasks (started in every gunicorn worker) merge queued jobs from any number of contributors
+# together, claiming them with SKIP LOCKED so workers never wait on each other
+ingest_wakeup = asyncio.Event()
+ingest_tasks = []
+
+async def enqueue_ingest_job(db, contributor_id, kind, items, errors):
+    job_id = await db.fetch_val(query='''
+        INSERT INTO ingest_jobs (contributor_id, kind, items, item_count, errors, time_added)
+        VALUES (:cnid, :kind, CAST(:items AS JSONB), :count, CAST(:errors AS JSONB), :ta) RETURNING id''', values={
+        'cnid': contributor_id, 'kind': kind, 'items': json.dumps(items), 'count': len(items), 'errors': json.dumps(errors), 'ta': int(time.time())})
+    ingest_wakeup.set()
+    return job_id
+
+async def merge_ingest_jobs(db, jobs):
+    # merge the items of several jobs with one set of statements per kind, returns cache tags touched
+    videos, channels = [], []
+    for job in jobs:
+        items = json.loads(job['items']) if type(job['items']) == str else job['items']
+        (videos if job['kind'] == 'videos' else channels).extend({**i, 'contributor_id': job['contributor_id']} for i in items)
+    if channels:
+        await ingest_channels(db, channels)
+    if videos:
+        await ingest_videos(db, videos)
+    return [('channel', c['id']) for c in channels] + [('video', v['id']) for v in videos] + [('channel', v['channel_id']) for v in videos if v['channel_id']]
+
+async def run_ingest_batch(db, max_jobs, max_items):
+    # claim, merge and finish a batch of queued jobs in one transaction, a crash just leaves them queued
+    # returns the number of jobs finished
+    async with db.connection() as connection:
+        async with connection.transaction():
+            claimed = await connection.fetch_all(query='''
+                SELECT id, item_count FROM ingest_jobs WHERE status = 'queued'
+                ORDER BY id LIMIT :n FOR UPDATE SKIP LOCKED''', values={'n': max_jobs})
+            job_ids, total = [], 0
+            for row in claimed:
+                if job_ids and total + row['item_count'] > max_items:
+                    break
+                job_ids.append(row['id']); total += row['item_count']
+            if not job_ids:
+                return 0
+            jobs = await connection.fetch_all(query='SELECT id, contributor_id, kind, items FROM ingest_jobs WHERE id = ANY(:ids) ORDER BY id', values={
+                'ids': job_ids})
+            
+            failed = {}
+            try:
+                async with connection.transaction():
+                    tags = await merge_ingest_jobs(connection, jobs)
+            except Exception:
+                # one bad job shouldn't fail everyone else's, retry them one by one
+                tags = []
+                for job in jobs:
+                    try:
+                        async with connection.transaction():
+                            tags += await merge_ingest_jobs(connection, [job])
+                    except Exception as e:
+                        failed[job['id']] = str(e)
+                        logger.warning(f'ingest job {job["id"]} failed: {e}', exc_info=True)
+            
+            await connection.execute(query='''
+                UPDATE ingest_jobs SET
+                    status = CASE WHEN f.error IS NULL THEN 'done' ELSE 'failed' END,
+                    error = f.error,
+                    items = CASE WHEN f.error IS NULL THEN NULL ELSE ingest_jobs.items END,
+                    time_finished = :tf
+                FROM unnest(CAST(:ids AS BIGINT[]), CAST(:errors AS TEXT[])) AS f(id, error)
+                WHERE ingest_jobs.id = f.id''', values={
+                'ids': job_ids, 'errors': [failed.get(i) for i in job_ids], 'tf': int(time.time())})
+    response_cache.invalidate(set(tags))
+    return len(job_ids)
+
+async def ingest_worker(db):
+    max_jobs, max_items = config.get('ingest_batch_jobs', 50), config.get('ingest_batch_items', 50000)
+    poll_interval, retention = config.get('ingest_poll_interval', 2), config.get('ingest_job_retention', 7 * 86400)
+    last_cleanup = 0
+    while True:
+        try:
+            finished = await run_ingest_batch(db, max_jobs, max_items)
+            if not finished and time.time() - last_cleanup > 3600:
+                await db.execute(query="DELETE FROM ingest_jobs WHERE status <> 'queued' AND time_finished < :t", values={
+                    't': int(time.time()) - retention})
+                await prune_changes(db, config.get('change_retention', 30 * 86400))
+                last_cleanup = time.time()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('ingest worker error')
+            finished = 0
+        
+        # jobs queued through this worker wake it up straight away, jobs from other workers are found by polling
+        if not finished:
+            ingest_wakeup.clear()
+            try:
+                await asyncio.wait_for(ingest_wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+CHANGES_LOCK_KEY = 0x6479615f636867 # arbitrary, 'dya_chg'
+CHANGES_SEQUENCE_BATCH = 100000
+
+async def sequence_changes(db):
+    # changes rows get their feed seq here, in commit order: only committed rows are visible and the advisory lock keeps
+    # sequencers from overlapping, so a new seq is always above every seq a reader could already have seen
+    # a reader that finds the lock taken just skips, the other sequencer's rows show up on its next read
+    # returns the number of rows sequenced, None if another sequencer holds the lock
+    async with db.transaction():
+        if not await db.fetch_val(query='SELECT pg_try_advisory_xact_lock(:key)', values={'key': CHANGES_LOCK_KEY}):
+            return None
+        return await db.fetch_val(query='''
+            WITH sequenced AS (
+                UPDATE changes SET seq = pending.seq FROM (
+                    SELECT id, nextval('changes_seq') AS seq FROM (SELECT id FROM changes WHERE seq IS NULL ORDER BY id LIMIT :n) ordered
+                ) pending WHERE changes.id = pending.id RETURNING 1
+            ) SELECT count(*) FROM sequenced''', values={'n': CHANGES_SEQUENCE_BATCH})
+
+async def prune_changes(db, retention):
+    # the feed is only sequenced when a mirror reads it, so sequence everything first: old rows are pruned whether or not
+    # anyone read them and min(seq) still moves past them, a mirror that was behind gets the 410 instead of a silent gap
+    # the newest row is always kept so min(seq) exists even if nothing changed within the retention window
+    while await sequence_changes(db) == CHANGES_SEQUENCE_BATCH:
+        pass
+    await db.execute(query='''
+        DELETE FROM changes WHERE seq IS NOT NULL AND time_added < :t AND seq < (SELECT max(seq) FROM changes)''', values={
+        't': int(time.time()) - retention})
+
+def tsv_field(value):
+    # tabs/newlines would break the row, same as compile_videos strips them
+    return '' if value is None else re.sub(r'[\t\r\n]', ' ', str(value))
+
+async def stream_export(db, queries, compress=False, chunk_size=1 << 16):
+    # queries is a list of (text before rows, query, values, row -> line), rows come from a server side cursor
+    # and are sent in ~64KB chunks so memory stays flat no matter how many rows the export has
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buf, size = [], 0
+    
+    def pack(final=False):
+        data = ''.join(buf).encode('utf-8')
+        buf.clear()
+        if compressor:
+            data = compressor.compress(data) + (compressor.flush() if final else b'')
+        return data
+    
+    for prefix, query, values, line in queries:
+        if prefix:
+            buf.append(prefix); size += len(prefix)
+        async for row in db.iterate(query=query, values=values):
+            l = line(row)
+            buf.append(l); size += len(l)
+            if size >= chunk_size:
+                size = 0
+                if data := pack():
+                    yield data
+    if data := pack(final=True):
+        yield data
+
+async def start_stream(chunks):
+    # pull the first chunk before the response starts, so a pool timeout (PoolBusy) is still a 503 instead of a cut off 200
+    first = await anext(chunks, None)
+    async def stream():
+        if first is not None:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+    return stream()
+
+def etag_matches(request, etag):
+    # If-None-Match can hold several (possibly weak) tags
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    return header.strip() == '*' or etag in [t.strip().removeprefix('W/') for t in header.split(',')]
+
+async def fetch_video_version(db, video_id):
+    # one index lookup per table, the ETag covers the video's contributions/titles, its channel's title and contributor info
+    row = await db.fetch_one(query='''
+        SELECT videos.id, coalesce(video_versions.version, 0) AS video_version, coalesce(channel_versions.version, 0) AS channel_version,
+            (SELECT epoch FROM contributors_epoch) AS epoch
+        FROM videos
+        LEFT JOIN video_versions ON video_versions.video_id = videos.id
+        LEFT JOIN channel_versions ON channel_versions.channel_id = videos.channel_id
+        WHERE videos.video_key = :key''', values={'key': video_id_to_int(video_id)})
+    return f'"v{row["video_version"]}.{row["channel_version"]}.{row["epoch"]}"' if row else None
+
+async def fetch_channel_version(db, channel_id):
+    # the channel row the channel endpoints need anyway plus the ETag covering its videos, maintainers, titles and contributor info
+    row = await db.fetch_one(query='''
+        SELECT channels.id, channels.title, coalesce(channel_versions.version, 0) AS version, (SELECT epoch FROM contributors_epoch) AS epoch
+        FROM channels LEFT JOIN channel_versions ON channel_versions.channel_id = channels.id
+        WHERE channels.channel_id = :id''', values={'id': channel_id})
+    return (row, f'"c{row["version"]}.{row["epoch"]}"') if row else (None, None)
+
+def encode_cursor(kind, last_id):
+    # opaque keyset pagination token, tagged with endpoint so tokens can't be mixed up
+    return urlsafe_b64encode(f'{kind}:{last_id}'.encode('utf-8')).decode('utf-8').rstrip('=')
+
+def decode_cursor(kind, cursor):
+    try:
+        cursor_kind, last_id = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8').split(':')
+        last_id = int(last_id)
+    except Exception:
+        return None
+    return last_id if cursor_kind == kind else None
 
 def generate_random(length):
     key = b''
@@ -52,9 +779,6 @@ def generate_random(length):
 @app.get('/video/{videopath:path}')
 @limiter.limit('80/minute')
 async def fetch_video(request: Request, videopath: str, v: str = None, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     # if not await verify_api_key(db, get_api_key(request), 'allow_videos_query'):
         # return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
     
@@ -66,55 +790,98 @@ async def fetch_video(request: Request, videopath: str, v: str = None, db: datab
     else:
         video_id = vid_reg[1]
     
+    # unchanged since the client's copy: 304 after a single version lookup
+    etag = await fetch_video_version(db, video_id)
+    if not etag:
+        return JSONResponse({'error': 'video not in db'}, status_code=404)
+    elif etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    # cached payloads are only served while their version is current, which also covers writes through other workers
+    cached = response_cache.get(('video', video_id))
+    if cached and cached[0] == etag:
+        return JSONResponse(cached[1], status_code=200, headers={'ETag': etag})
+    
     # pull video id, channel id, and title from db
     video = await db.fetch_one(query='''
-            SELECT id,
-           (SELECT channel_id FROM channels WHERE id = videos.channel_id),
-           (SELECT title FROM titles_v WHERE video_id = videos.id ORDER BY time_added DESC LIMIT 1) as title,
-           (SELECT title FROM titles_c WHERE channel_id = videos.channel_id ORDER BY time_added DESC LIMIT 1) as channel_title
-            FROM videos WHERE video_id = :id''', values={'id': video_id})
+            SELECT videos.id, channels.channel_id, videos.title, channels.title as channel_title
+            FROM videos LEFT JOIN channels ON channels.id = videos.channel_id
+            WHERE videos.video_key = :key''', values={'key': video_id_to_int(video_id)})
     if not video:
         return JSONResponse({'error': 'video not in db'}, status_code=404)
     
-    # pull video contributions from db
-    contributions = await db.fetch_all(query='''
-            SELECT contributor_id,
-           (SELECT format_string FROM formats WHERE id = contributions_v.format_id), filesize
-            FROM contributions_v WHERE video_id = :video_id''', values={'video_id': video['id']})
-    contributions = {c['contributor_id']: dict(c) for c in contributions}
+    # pull video contributions/contributors from db
+    contributions = await fetch_video_contributions(db, [video['id']])
     
-    # pull contributor info from db
-    # idfk how to fetch multiple rows with `id IN ()` with this lib, I give up..
-    for cid in contributions.keys():
-        row = await db.fetch_one(query='SELECT id as contributor_id, name, discord_id, alternative_contact_info FROM contributors WHERE id = (:id)', values={'id': cid})
-        contributions[row['contributor_id']].update(dict(row))
-    
-    return JSONResponse({
-        'contributions': [
-            {
-                'format_string': c.get('format_string'),
-                'filesize': c.get('filesize'),
-                'contributor': {
-                    'name': c['name'],
-                    'discord_id': c['discord_id'] if (not c['alternative_contact_info']) else None,
-                    'alternative_contact_info': c['alternative_contact_info']
-                }
-            } for c in contributions.values()
-        ],
+    payload = {
+        'contributions': contributions[video['id']],
         'video': {
             'id': video_id,
             'title': video['title'],
             'channel_id': video['channel_id'],
             'channel_title': video['channel_title']
         }
+    }
+    response_cache.set(('video', video_id), (etag, payload), tags=[('video', video_id)] + ([('channel', video['channel_id'])] if video['channel_id'] else []))
+    
+    return JSONResponse(payload, status_code=200, headers={'ETag': etag})
+
+@app.post('/videos/lookup')
+@limiter.limit('10/minute')
+async def lookup_videos(request: Request, db: databases.Database = Depends(get_database)):
+    # validate body
+    try:
+        jsonDat = await request.json()
+    except json.decoder.JSONDecodeError:
+        return JSONResponse({'error': 'malformed body'}, status_code=400)
+    
+    if type(jsonDat) != dict or list(jsonDat.keys()) != ['videos'] or type(jsonDat['videos']) != list:
+        return JSONResponse({'error': 'missing `videos` key or invalid keys present'}, status_code=400)
+    elif len(jsonDat['videos']) > 10000:
+        return JSONResponse({'error': 'maximum of 10000 videos per api call'}, status_code=400)
+    
+    # match video ids/urls, dedupe while keeping request order
+    video_ids = {}
+    invalid = []
+    for v in jsonDat['videos']:
+        vid_reg = match_video_id.match(v) if type(v) == str else None
+        if not vid_reg:
+            invalid.append(v); continue
+        video_ids[vid_reg[1]] = None
+    
+    # pull every requested video in one query
+    if video_ids:
+        rows = await db.fetch_all(query='''
+            SELECT videos.id, videos.video_id, channels.channel_id, videos.title, channels.title as channel_title
+            FROM videos LEFT JOIN channels ON channels.id = videos.channel_id
+            WHERE videos.video_key = ANY(CAST(:keys AS BIGINT[]))''', values={'keys': list(pack_video_ids(video_ids.keys()))})
+    else:
+        rows = []
+    found = {r['video_id']: r for r in rows}
+    
+    # pull contributions for all found videos in one query
+    contributions = await fetch_video_contributions(db, [r['id'] for r in rows])
+    
+    return JSONResponse({
+        'count': len(found),
+        'videos': [
+            {
+                'contributions': contributions[found[vid]['id']],
+                'video': {
+                    'id': vid,
+                    'title': found[vid]['title'],
+                    'channel_id': found[vid]['channel_id'],
+                    'channel_title': found[vid]['channel_title']
+                }
+            } for vid in video_ids.keys() if vid in found
+        ],
+        'misses': [vid for vid in video_ids.keys() if not vid in found],
+        'invalid': invalid
     }, status_code=200)
 
 @app.get('/channelmaintainers/{channelpath:path}')
 @limiter.limit('80/minute')
 async def fetch_channel_maintainers(request: Request, channelpath: str, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     # if not await verify_api_key(db, get_api_key(request), 'allow_channelmaintainers_query'):
         # return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
     
@@ -125,13 +892,16 @@ async def fetch_channel_maintainers(request: Request, channelpath: str, db: data
     else:
         channel_id = chn_reg[1]
     
-    # pull channel id from db
-    channel = await db.fetch_one(query='''
-        SELECT id,
-        (SELECT title FROM titles_c WHERE channel_id = channels.id ORDER BY time_added DESC LIMIT 1)
-        FROM channels WHERE channel_id = :id''', values={'id': channel_id})
+    # pull channel id from db, unchanged since the client's copy: 304
+    channel, etag = await fetch_channel_version(db, channel_id)
     if not channel:
         return JSONResponse({'error': 'channel not in db'}, status_code=404)
+    elif etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    cached = response_cache.get(('channelmaintainers', channel_id))
+    if cached and cached[0] == etag:
+        return JSONResponse(cached[1], status_code=200, headers={'ETag': etag})
     
     # pull channel contributions from db
     contributions = await db.fetch_all(query='SELECT contributor_id, note FROM contributions_c WHERE channel_id = :channel_id', values={'channel_id': channel['id']})
@@ -142,7 +912,7 @@ async def fetch_channel_maintainers(request: Request, channelpath: str, db: data
         row = await db.fetch_one(query='SELECT id as contributor_id, name, discord_id, alternative_contact_info, allow_channel_queries FROM contributors WHERE id = (:id)', values={'id': cid})
         contributions[row['contributor_id']].update(dict(row))
     
-    return JSONResponse({
+    payload = {
         'contributions': [
             {
                 'note': c.get('note'),
@@ -157,18 +927,60 @@ async def fetch_channel_maintainers(request: Request, channelpath: str, db: data
             'id': channel_id,
             'title': channel['title']
         },
-    }, status_code=200)
+    }
+    response_cache.set(('channelmaintainers', channel_id), (etag, payload), tags=[('channel', channel_id)])
+    
+    return JSONResponse(payload, status_code=200, headers={'ETag': etag})
+
+@app.get('/channelvideos/stream/{channelpath:path}')
+@limiter.limit('10/minute')
+async def stream_channel_videos(request: Request, channelpath: str, db: databases.Database = Depends(get_database), gzip: bool = False):
+    # match channel id
+    chn_reg = match_channel_id.match(channelpath)
+    if not chn_reg:
+        return JSONResponse({'error': 'invalid channel id'}, status_code=400)
+    else:
+        channel_id = chn_reg[1]
+    
+    channel, etag = await fetch_channel_version(db, channel_id)
+    if not channel:
+        return JSONResponse({'error': 'channel not in db'}, status_code=404)
+    elif etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    # one line per video, walked in id order off videos_channel_id_idx with the contributors aggregated per video,
+    # so rows leave the cursor as they're found and nothing is sorted/buffered for the whole channel
+    # videos without a contributor that allows channel queries are left out, same as /channelvideos
+    query = '''
+        SELECT CAST(json_build_object('id', videos.video_id, 'title', videos.title, 'contributors', c.contributors) AS TEXT) as line
+        FROM videos
+        CROSS JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                'name', contributors.name,
+                'discord_id', CASE WHEN contributors.alternative_contact_info IS NULL THEN contributors.discord_id END,
+                'alternative_contact_info', contributors.alternative_contact_info) ORDER BY contributions_v.contributor_id) as contributors
+            FROM contributions_v JOIN contributors ON contributors.id = contributions_v.contributor_id
+            WHERE contributions_v.video_id = videos.id AND contributors.allow_channel_queries IS TRUE
+        ) c
+        WHERE videos.channel_id = :cid AND c.contributors IS NOT NULL
+        ORDER BY videos.id'''
+    return StreamingResponse(await start_stream(stream_export(db, [(None, query, {'cid': channel['id']}, lambda r: r['line'] + '\n')], compress=gzip)),
+        media_type='application/gzip' if gzip else 'application/x-ndjson', headers={'ETag': etag})
 
 @app.get('/channelvideos/{channelpath:path}')
 @limiter.limit('80/minute')
-async def fetch_channel_videos(request: Request, channelpath: str, db: databases.Database = Depends(get_database), limit: int = 500, offset: int = 0):
+async def fetch_channel_videos(request: Request, channelpath: str, db: databases.Database = Depends(get_database), limit: int = 500, offset: int = 0, cursor: str = None):
     if limit > 500 or limit < 1:
         return JSONResponse({'error': '`limit` allowed range is 1-500'}, status_code=400)
     elif offset < 0:
         return JSONResponse({'error': '`offset` must not be negative'}, status_code=400)
+    elif offset and cursor:
+        return JSONResponse({'error': '`offset` and `cursor` cannot be used together'}, status_code=400)
     
-    # assert db conn
-    await db.connect()
+    # cursor pages start after the last video id of the previous page
+    after = decode_cursor('channelvideos', cursor) if cursor else 0
+    if after is None:
+        return JSONResponse({'error': 'invalid cursor'}, status_code=400)
     
     # if not await verify_api_key(db, get_api_key(request), 'allow_channelvideos_query'):
         # return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -180,29 +992,35 @@ async def fetch_channel_videos(request: Request, channelpath: str, db: databases
     else:
         channel_id = chn_reg[1]
     
-    # pull channel id from db
-    channel = await db.fetch_one(query='''
-        SELECT id, (SELECT title FROM titles_c WHERE channel_id = channels.id ORDER BY time_added DESC LIMIT 1) FROM channels WHERE channel_id = :id''',
-        values={'id': channel_id})
+    # pull channel id from db, unchanged since the client's copy: 304 (any of the channel's videos changing moves the version)
+    channel, etag = await fetch_channel_version(db, channel_id)
     if not channel:
         return JSONResponse({'error': 'channel not in db'}, status_code=404)
+    elif etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    cache_key = ('channelvideos', channel_id, limit, offset, after)
+    cached = response_cache.get(cache_key)
+    if cached and cached[0] == etag:
+        return JSONResponse(cached[1], status_code=200, headers={'ETag': etag})
     
     # pull list of videos from `videos`
     rows = await db.fetch_all(query='''
             SELECT
                 id,
                 video_id,
-                (SELECT title FROM titles_v WHERE video_id = videos.id ORDER BY time_added DESC LIMIT 1) as title
+                title
             FROM videos
-            WHERE channel_id = :cid
+            WHERE channel_id = :cid AND id > :after
             AND (
                 SELECT TRUE FROM contributions_v WHERE video_id = videos.id AND (
                     SELECT allow_channel_queries FROM contributors WHERE id = contributions_v.contributor_id
                 ) IS TRUE LIMIT 1
             ) IS TRUE
             ORDER BY id ASC LIMIT :limit OFFSET :offset
-        ''', values={'cid': channel['id'], 'limit': limit, 'offset': offset})
+        ''', values={'cid': channel['id'], 'after': after, 'limit': limit, 'offset': offset})
     videos = {r['id']: {'v_id': r['video_id'], 'title': r['title'], 'contributors': {}} for r in rows}
+    next_cursor = encode_cursor('channelvideos', rows[-1]['id']) if len(rows) == limit else None
     
     # fetch contributions / contributors
     if len(videos) > 0:
@@ -226,9 +1044,10 @@ async def fetch_channel_videos(request: Request, channelpath: str, db: databases
         videos[r['video_id']]['contributors'].update({r['contributor_id']: {'name': r['contributor_name'], 'discord_id': r['contributor_discord_id'], 'alternative_contact_info': r['contributor_alternative_contact_info']}})
     videos = {k: v for k, v in videos.items() if len(v['contributors']) > 0}
     
-    return JSONResponse({
+    payload = {
         'count': len(videos),
-        'nextOffset': offset + len(videos) if len(videos) == limit else None,
+        'nextOffset': offset + len(videos) if len(videos) == limit and not cursor else None,
+        'nextCursor': next_cursor,
         'channel': {
             'id': channel_id,
             'title': channel['title']
@@ -248,14 +1067,15 @@ async def fetch_channel_videos(request: Request, channelpath: str, db: databases
             }
         for v in videos.values()
     ]
-    }, status_code=200)
+    }
+    # tag pages with their videos too, a video's title/contributions can change without its channel being submitted
+    response_cache.set(cache_key, (etag, payload), tags=[('channel', channel_id)] + [('video', v['v_id']) for v in videos.values()])
+    
+    return JSONResponse(payload, status_code=200, headers={'ETag': etag})
 
 @app.post('/submit_channels')
 @limiter.limit('80/minute')
 async def submit_channels(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -266,77 +1086,50 @@ async def submit_channels(request: Request, db: databases.Database = Depends(get
     except json.decoder.JSONDecodeError:
         return JSONResponse({'error': 'malformed body'}, status_code=400)
     
-    if type(jsonDat) != dict or list(jsonDat.keys()) != ['channels']:
+    # async mode queues the channels as a job, invalid items are reported on the job instead of failing the call
+    async_mode = request.query_params.get('async', '').lower() in ['1', 'true']
+    max_channels = config.get('ingest_job_max_items', 10000) if async_mode else 500
+    
+    if type(jsonDat) != dict or list(jsonDat.keys()) != ['channels'] or type(jsonDat['channels']) != list:
         return JSONResponse({'error': 'missing `channels` key or invalid keys present'}, status_code=400)
-    elif len(jsonDat['channels']) > 500:
-        return JSONResponse({'error': 'maxiumum of 500 channels per api call'}, status_code=400)
+    elif len(jsonDat['channels']) > max_channels:
+        return JSONResponse({'error': f'maxiumum of {max_channels} channels per api call'}, status_code=400)
     
     # process channels
     fields = {'id', 'title', 'note'}
     channels = {}
+    errors = []
     missing_fields = {f: 0 for f in fields}
-    for c in jsonDat['channels']:
-        if not 'id' in c:
-            return JSONResponse({'error': 'channel missing `id` key'}, status_code=400)
+    for c, i in zip(jsonDat['channels'], range(len(jsonDat['channels']))):
+        channel, error = parse_submitted_channel(c, i)
+        if error and not async_mode:
+            return JSONResponse({'error': error}, status_code=400)
+        elif error:
+            errors.append({'index': i, 'error': error}); continue
         for field in fields:
             if not field in c:
                 missing_fields[field] += 1
         
-        # test channel ids
-        c_id = match_channel_id.match(c['id'])
-        if not c_id:
-            return JSONResponse({'error': f'invalid channel id {c["id"]}'}, status_code=400)
-        c_id = c_id[1]
-        
-        channels[c_id] = {
-            'id': c_id,
-            'title': c.get('title') or None,
-            'note': c.get('note') or None}
-    
-    channel_id_lookup = {}
-    if len(channels) > 0:
-        # insert channel ids
-        await db.execute_many(query='INSERT INTO channels (channel_id) VALUES (:cid) ON CONFLICT DO NOTHING', values=[{'cid': cid} for cid in channels.keys()])
-        
-        # fetch channel ids
-        for c in channels.keys():
-            row = await db.fetch_one(query='SELECT id as dbid, channel_id FROM channels WHERE channel_id = :cid', values={'cid': c})
-            channel_id_lookup[row.channel_id] = row.dbid
+        channels[channel['id']] = channel
     
-        # insert channel titles
-        titled_channels = [
-            {
-                'ta': time.time(),
-                'chid': channel_id_lookup[c['id']],
-                'cnid': contributor_id,
-                'title': c.get('title')
-            } for c in channels.values() if c.get('title')]
-        if titled_channels:
-            await db.execute_many(query='INSERT INTO titles_c (time_added, channel_id, contributor_id, title) VALUES (:ta, :chid, :cnid, :title) ON CONFLICT DO NOTHING', values=titled_channels)
-    
-    # insert contributions_c
-    await db.execute_many(query='INSERT INTO contributions_c (channel_id, contributor_id, note) VALUES (:chid, :cnid, :note) ON CONFLICT DO NOTHING',values=[
-            {
-                'chid': channel_id_lookup[c['id']],
-                'cnid': contributor_id,
-                'note': c['note']
-            } for c in channels.values()
-        ])
+    if async_mode:
+        job_id = await enqueue_ingest_job(db, contributor_id, 'channels', list(channels.values()), errors)
+        jresp = {'success': True, 'job_id': job_id, 'status': 'queued', 'item_count': len(channels), 'invalid_count': len(errors)}
+    else:
+        # insert channels, titles and contributions_c in one transaction
+        async with db.transaction():
+            await ingest_channels(db, [{'contributor_id': contributor_id, **c} for c in channels.values()])
+        response_cache.invalidate([('channel', cid) for cid in channels.keys()])
+        jresp = {'success': True}
     
-    jresp = {
-        'warning': {'missing_field_counts': {k: v for k, v in missing_fields.items() if v > 0}},
-        'success': True}
-    if not jresp['warning']['missing_field_counts']:
-        del jresp['warning']
+    if any(missing_fields.values()):
+        jresp['warning'] = {'missing_field_counts': {k: v for k, v in missing_fields.items() if v > 0}}
     
-    return JSONResponse(jresp, status_code=200)
+    return JSONResponse(jresp, status_code=202 if async_mode else 200)
 
 @app.post('/submit_videos')
 @limiter.limit('80/minute')
 async def submit_videos(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -347,136 +1140,216 @@ async def submit_videos(request: Request, db: databases.Database = Depends(get_d
     except json.decoder.JSONDecodeError:
         return JSONResponse({'error': 'malformed body'}, status_code=400)
     
-    if type(jsonDat) != dict or list(jsonDat.keys()) != ['videos']:
+    # async mode queues the videos as a job, invalid items are reported on the job instead of failing the call
+    async_mode = request.query_params.get('async', '').lower() in ['1', 'true']
+    max_videos = config.get('ingest_job_max_items', 10000) if async_mode else 500
+    
+    if type(jsonDat) != dict or list(jsonDat.keys()) != ['videos'] or type(jsonDat['videos']) != list:
         return JSONResponse({'error': 'missing `videos` key or invalid keys present'}, status_code=400)
-    elif len(jsonDat['videos']) > 500:
-        return JSONResponse({'error': 'maxiumum of 500 videos per api call'}, status_code=400)
+    elif len(jsonDat['videos']) > max_videos:
+        return JSONResponse({'error': f'maxiumum of {max_videos} videos per api call'}, status_code=400)
     
     # process videos
     fields = {'id', 'title', 'channel_id', 'channel_title', 'filesize', 'format_id'}
     videos = {}
-    channels = {}
+    channel_titles = {}
+    errors = []
     missing_fields = {f: 0 for f in fields}
     for v, i in zip(jsonDat['videos'], range(len(jsonDat['videos']))):
-        if not 'id' in v:
-            return JSONResponse({'error': f'video at position `{i}` is missing `id` key'}, status_code=400)
+        video, error = parse_submitted_video(v, i)
+        if error and not async_mode:
+            return JSONResponse({'error': error}, status_code=400)
+        elif error:
+            errors.append({'index': i, 'error': error}); continue
         for field in fields:
             if not field in v:
                 missing_fields[field] += 1
         
-        # test video and channel ids
-        v_id = match_video_id.match(v['id'])
-        if not v_id:
-            return JSONResponse({'error': f'invalid video id {v["id"]}'}, status_code=400)
-        v_id = v_id[1]
-        
-        if v.get('channel_id'):
-            c_id = match_channel_id.match(v['channel_id'] or '')
-            if not c_id:
-                return JSONResponse({'error': f'invalid channel id `{v["channel_id"]}`'}, status_code=400)
-            c_id = c_id[1]
-        else:
-            c_id = None
-        
-        # assert filesize is int (ik this is so dumb and I should be using pydantic)
-        if v.get('filesize') and type(v.get('filesize')) == str:
-            if not v['filesize'].isdigit():
-                return JSONResponse({'error': 'filesize should be int, digit str, or null'}, status_code=400)
-        
-        videos[v_id] = {
-            'id': v_id,
-            'title': v.get('title') or None,
-            'channel_id': c_id or None,
-            'filesize': int(v.get('filesize') or 0) or None,
-            'format_id': v.get('format_id') or None}
-        
-        if (c_id not in channels) and c_id:
-            channels[c_id] = {'id': c_id}
-        if v.get('channel_title') and c_id:
-            channels[c_id]['title'] = v.get('channel_title')
-    
-    channel_id_lookup = {}
-    if len(channels) > 0:
-        # insert channel ids
-        await db.execute_many(query='INSERT INTO channels (channel_id) VALUES (:cid) ON CONFLICT DO NOTHING', values=[{'cid': cid} for cid in channels.keys()])
-        
-        # fetch channel ids
-        for c in channels.keys():
-            row = await db.fetch_one(query='SELECT id as dbid, channel_id FROM channels WHERE channel_id = :cid', values={'cid': c})
-            channel_id_lookup[row.channel_id] = row.dbid
-        
-        # insert channel titles
-        titled_channels = [
-            {
-                'ta': time.time(),
-                'chid': channel_id_lookup[c['id']],
-                'cnid': contributor_id,
-                'title': c.get('title')
-            } for c in channels.values() if c.get('title')]
-        if titled_channels:
-            await db.execute_many(query='INSERT INTO titles_c (time_added, channel_id, contributor_id, title) VALUES (:ta, :chid, :cnid, :title) ON CONFLICT DO NOTHING', values=titled_channels)
-    
-    format_ids = {v.get('format_id') for v in videos.values() if v.get('format_id')}
-    format_id_lookup = {}
-    if format_ids:
-        # insert format ids
-        await db.execute_many(query='INSERT INTO formats (format_string) VALUES (:fs) ON CONFLICT DO NOTHING', values=[{'fs': fs[:255]} for fs in format_ids])
-        
-        # fetch format ids
-        for fs in format_ids:
-            row = await db.fetch_one(query='SELECT id FROM formats WHERE format_string = :fs', values={'fs': fs[:255]})
-            format_id_lookup[fs] = row.id
-    
-    # insert video ids
-    await db.execute_many(query='INSERT INTO videos (video_id, channel_id) VALUES (:vid, :cid) ON CONFLICT DO NOTHING', values=[
-        {'vid': v['id'], 'cid': channel_id_lookup.get(v['channel_id'])} for v in videos.values()])
-    
-    # fetch video ids
-    video_id_lookup = {}
-    for vid in videos.keys():
-        row = await db.fetch_one(query='SELECT id FROM videos WHERE video_id = :vid', values={'vid': vid})
-        video_id_lookup[vid] = row.id
-    
-    # insert video titles
-    titled_videos = {vk: vv for vk, vv in videos.items() if vv['title']}
-    if titled_videos:
-        await db.execute_many(query='INSERT INTO titles_v (time_added, video_id, contributor_id, title) VALUES (:ta, :vid, :cnid, :title) ON CONFLICT DO NOTHING', values=[
-            {
-                'ta': time.time(),
-                'vid': video_id_lookup[v['id']],
-                'cnid': contributor_id,
-                'title': v['title']
-            } for v in titled_videos.values()
-        ])
-    
-    # insert contributions_v
-    await db.execute_many(query='INSERT INTO contributions_v (video_id, contributor_id, format_id, filesize) VALUES (:vid, :cid, :fid, :size) ON CONFLICT DO NOTHING',values=[
-            {
-                'vid': video_id_lookup[v['id']],
-                'cid': contributor_id,
-                'fid': format_id_lookup.get(v['format_id']),
-                'size': v['filesize']
-            } for v in videos.values()
-        ])
+        videos[video['id']] = video
+        if video['channel_id'] and (video['channel_title'] or not video['channel_id'] in channel_titles):
+            channel_titles[video['channel_id']] = video['channel_title']
+    
+    videos = [{**v, 'channel_title': channel_titles.get(v['channel_id'])} for v in videos.values()]
+    
+    if async_mode:
+        job_id = await enqueue_ingest_job(db, contributor_id, 'videos', videos, errors)
+        jresp = {'success': True, 'job_id': job_id, 'status': 'queued', 'item_count': len(videos), 'invalid_count': len(errors)}
+    else:
+        # insert channels, formats, videos, titles and contributions_v in one transaction
+        async with db.transaction():
+            await ingest_videos(db, [{**v, 'contributor_id': contributor_id} for v in videos])
+        response_cache.invalidate([('video', v['id']) for v in videos] + [('channel', cid) for cid in channel_titles.keys()])
+        jresp = {'success': True}
+    
+    if any(missing_fields.values()):
+        jresp['warning'] = {'missing_field_counts': {k: v for k, v in missing_fields.items() if v > 0}}
+    
+    return JSONResponse(jresp, status_code=202 if async_mode else 200)
+
+@app.get('/jobs/{job_id}')
+@limiter.limit('60/minute')
+async def fetch_ingest_job(request: Request, job_id: int, db: databases.Database = Depends(get_database)):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    job = await db.fetch_one(query='''
+        SELECT id, kind, status, item_count, errors, error, time_added, time_finished FROM ingest_jobs
+        WHERE id = :id AND contributor_id = :cnid''', values={'id': job_id, 'cnid': contributor_id})
+    if not job:
+        return JSONResponse({'error': 'job not found'}, status_code=404)
+    
+    job = dict(job)
+    job['errors'] = json.loads(job['errors']) if type(job['errors']) == str else (job['errors'] or [])
+    job['invalid_count'] = len(job['errors'])
+    if job['status'] == 'queued':
+        # jobs are merged roughly in id order
+        job['queue_position'] = await db.fetch_val(query="SELECT count(*) FROM ingest_jobs WHERE status = 'queued' AND id < :id", values={
+            'id': job_id})
+    
+    return JSONResponse(job, status_code=200)
+
+@app.post('/submit_videos/bulk')
+@limiter.limit('5/minute')
+async def submit_videos_bulk(request: Request, db: databases.Database = Depends(get_database)):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    # rows are merged every `flush_rows` rows so memory stays flat no matter the upload size
+    flush_rows = 20000
+    summary = {'lines': 0, 'inserted': 0, 'duplicate': 0, 'invalid': 0, 'excluded': 0, 'errors': []}
+    videos, channels = [], []
+    
+    async def flush():
+        if channels:
+            await merge_channel_titles(db, CHANNEL_SOURCE, {
+                'cids': [c[0] for c in channels], 'cnids': [c[1] for c in channels], 'ctitles': [c[2] for c in channels], 'notes': [None for c in channels]})
+            channels.clear()
+        if videos:
+            inserted = await flush_bulk_videos(db, videos)
+            summary['inserted'] += inserted
+            summary['duplicate'] += len(videos) - inserted
+            videos.clear()
+    
+    try:
+        async for kind, item in iter_upload_items(request, summary):
+            if kind == 'channel':
+                channels.append((item['id'], contributor_id, item['title']))
+            else:
+                videos.append((item['id'], item['channel_id'], contributor_id, item['title'], item['channel_title'], item['format_id'], item['filesize']))
+            
+            if len(videos) >= flush_rows or len(channels) >= flush_rows:
+                await flush()
+        await flush()
+    except (ValueError, zlib.error) as e:
+        response_cache.clear()
+        return JSONResponse({'error': f'bad upload body: {e}', **summary}, status_code=400)
+    
+    # a bulk upload can touch any number of cached entities
+    response_cache.clear()
+    
+    return JSONResponse({'success': True, **summary}, status_code=200)
+
+@app.post('/sync_videos')
+@limiter.limit('10/minute')
+async def sync_videos(request: Request, db: databases.Database = Depends(get_database), session: int = None, done: bool = True, delta: bool = False):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    # the body is the contributor's complete current manifest in any /submit_videos/bulk format, sent in one call or
+    # split over several: `done=false` only stages the chunk and the returned `session` is passed to the next call
+    if session is None:
+        # abandoned sessions are dropped with their staged rows (ON DELETE CASCADE)
+        await db.execute(query='DELETE FROM sync_sessions WHERE time_added < :t', values={'t': int(time.time()) - 86400})
+        session = await db.fetch_val(query='INSERT INTO sync_sessions (contributor_id, time_added) VALUES (:cnid, :ta) RETURNING id', values={
+            'cnid': contributor_id, 'ta': int(time.time())})
+    elif not await db.fetch_val(query='SELECT id FROM sync_sessions WHERE id = :sid AND contributor_id = :cnid', values={
+        'sid': session, 'cnid': contributor_id}):
+        return JSONResponse({'error': 'sync session not found'}, status_code=404)
+    
+    flush_rows = 20000
+    summary = {'session': session, 'lines': 0, 'invalid': 0, 'excluded': 0, 'errors': []}
+    videos, channels = [], []
+    
+    async def flush():
+        # only staged here, nothing outside the session is written until the diff is applied
+        async with db.transaction():
+            async with db.connection() as connection:
+                if channels:
+                    await connection.raw_connection.copy_records_to_table('sync_manifest_channels', records=channels, columns=['session_id', 'cid', 'ctitle'])
+                if videos:
+                    await connection.raw_connection.copy_records_to_table('sync_manifests', records=videos, columns=['session_id', 'vid', 'cid', 'title', 'ctitle', 'fs', 'size'])
+        channels.clear(); videos.clear()
+    
+    try:
+        async for kind, item in iter_upload_items(request, summary):
+            if kind == 'channel':
+                channels.append((session, item['id'], item['title']))
+            else:
+                videos.append((session, item['id'], item['channel_id'], item['title'], item['channel_title'], item['format_id'], item['filesize']))
+            
+            if len(videos) >= flush_rows or len(channels) >= flush_rows:
+                await flush()
+        await flush()
+    except (ValueError, zlib.error) as e:
+        # rows staged before the error stay in the session, resending the whole chunk is fine (manifests are sets)
+        return JSONResponse({'error': f'bad upload body: {e}', **summary}, status_code=400)
+    
+    # invalid lines are never staged, so they'd read as videos the contributor no longer has: counted over every chunk
+    session_row = await db.fetch_one(query='''
+        UPDATE sync_sessions SET
+            invalid = invalid + :invalid,
+            excluded = excluded + :excluded,
+            errors = CASE WHEN jsonb_array_length(errors) < 100 THEN errors || CAST(:errors AS JSONB) ELSE errors END
+        WHERE id = :sid RETURNING invalid, excluded, errors''', values={
+        'sid': session, 'invalid': summary['invalid'], 'excluded': summary['excluded'], 'errors': json.dumps(summary['errors'])})
+    
+    if not done:
+        return JSONResponse({'success': True, 'done': False, **summary}, status_code=200)
+    elif session_row['invalid']:
+        # nothing is applied, the session is dropped so the fixed manifest can be sent again from scratch
+        await db.execute(query='DELETE FROM sync_sessions WHERE id = :sid', values={'sid': session})
+        return JSONResponse({
+            'error': f'manifest has {session_row["invalid"]} invalid lines, fix them and sync again (nothing was applied)',
+            **summary, 'invalid': session_row['invalid'], 'excluded': session_row['excluded'], 'errors': json.loads(session_row['errors'])[:100]}, status_code=400)
+    summary['invalid'], summary['excluded'] = session_row['invalid'], session_row['excluded']
+    
+    result = await apply_video_sync(db, contributor_id, session)
+    if result is None:
+        return JSONResponse({'error': 'manifest is empty, use /delete_all to remove all contributions', **summary}, status_code=400)
+    
+    # a sync can touch any number of cached entities
+    response_cache.clear()
     
     jresp = {
-        'warning': {'missing_field_counts': {k: v for k, v in missing_fields.items() if v > 0}},
-        'success': True}
-    if not jresp['warning']['missing_field_counts']:
-        del jresp['warning']
+        'success': True,
+        'done': True,
+        **summary,
+        'manifest': result['manifest'],
+        'added': len(result['added']),
+        'removed': len(result['removed']),
+        'unchanged': result['manifest'] - len(result['added'])}
+    if delta:
+        jresp['delta'] = {'added': result['added'], 'removed': result['removed']}
     
     return JSONResponse(jresp, status_code=200)
 
 @app.get('/my_channels')
 @limiter.limit('80/minute')
-async def query_contributor_channels(request: Request, db: databases.Database = Depends(get_database), limit: int = 500, offset: int = 0):
+async def query_contributor_channels(request: Request, db: databases.Database = Depends(get_database), limit: int = 500, offset: int = 0, cursor: str = None):
     if limit > 500 or limit < 1:
         return JSONResponse({'error': '`limit` allowed range is 1-500'}, status_code=400)
     elif offset < 0:
         return JSONResponse({'error': '`offset` must not be negative'}, status_code=400)
+    elif offset and cursor:
+        return JSONResponse({'error': '`offset` and `cursor` cannot be used together'}, status_code=400)
     
-    # assert db conn
-    await db.connect()
+    # cursor pages start after the last channel_id of the previous page
+    after = decode_cursor('my_channels', cursor) if cursor else 0
+    if after is None:
+        return JSONResponse({'error': 'invalid cursor'}, status_code=400)
     
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
@@ -484,30 +1357,38 @@ async def query_contributor_channels(request: Request, db: databases.Database =
     
     rows = await db.fetch_all(query='''
         SELECT
-            (SELECT channel_id FROM channels WHERE id = contributions_c.channel_id) as channel_id,
-            (SELECT title FROM titles_c WHERE channel_id = contributions_c.channel_id LIMIT 1) as channel_title,
-            note
-        FROM contributions_c WHERE contributor_id = :cnid ORDER BY contributions_c.channel_id LIMIT :limit OFFSET :offset''', values={
+            channels.channel_id,
+            channels.title as channel_title,
+            note,
+            contributions_c.channel_id as cursor_id
+        FROM contributions_c JOIN channels ON channels.id = contributions_c.channel_id
+        WHERE contributor_id = :cnid AND contributions_c.channel_id > :after ORDER BY contributions_c.channel_id LIMIT :limit OFFSET :offset''', values={
         'cnid': contributor_id,
+        'after': after,
         'limit': limit,
         'offset': offset})
     
     return JSONResponse({
         'count': len(rows),
-        'nextOffset': offset + len(rows) if len(rows) == limit else None,
-        'channels': [dict(r) for r in rows]
+        'nextOffset': offset + len(rows) if len(rows) == limit and not cursor else None,
+        'nextCursor': encode_cursor('my_channels', rows[-1]['cursor_id']) if len(rows) == limit else None,
+        'channels': [{k: v for k, v in dict(r).items() if k != 'cursor_id'} for r in rows]
         }, status_code=200)
 
 @app.get('/my_videos')
 @limiter.limit('80/minute')
-async def query_contributor_videos(request: Request, db: databases.Database = Depends(get_database), limit: int = 500, offset: int = 0):
+async def query_contributor_videos(request: Request, db: databases.Database = Depends(get_database), limit: int = 500, offset: int = 0, cursor: str = None):
     if limit > 500 or limit < 1:
         return JSONResponse({'error': '`limit` allowed range is 1-500'}, status_code=400)
     elif offset < 0:
         return JSONResponse({'error': '`offset` must not be negative'}, status_code=400)
+    elif offset and cursor:
+        return JSONResponse({'error': '`offset` and `cursor` cannot be used together'}, status_code=400)
     
-    # assert db conn
-    await db.connect()
+    # cursor pages start after the last video_id of the previous page
+    after = decode_cursor('my_videos', cursor) if cursor else 0
+    if after is None:
+        return JSONResponse({'error': 'invalid cursor'}, status_code=400)
     
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
@@ -515,23 +1396,108 @@ async def query_contributor_videos(request: Request, db: databases.Database = De
     
     rows = await db.fetch_all(query='''
         SELECT
-            (SELECT video_id FROM videos WHERE id = contributions_v.video_id) as id,
-            (SELECT title FROM titles_v WHERE video_id = contributions_v.video_id LIMIT 1) as title,
-            (SELECT (SELECT channel_id FROM channels WHERE id = videos.channel_id) FROM videos WHERE id = contributions_v.video_id) as channel_id,
-            (SELECT (SELECT title FROM titles_c WHERE channel_id = videos.channel_id LIMIT 1) FROM videos WHERE id = contributions_v.video_id) as channel_title,
-            (SELECT format_string FROM formats WHERE id = contributions_v.format_id) as format_id,
-            filesize
-        FROM contributions_v WHERE contributor_id = :cnid ORDER BY contributions_v.video_id LIMIT :limit OFFSET :offset''', values={
+            videos.video_id as id,
+            videos.title,
+            channels.channel_id,
+            channels.title as channel_title,
+            formats.format_string as format_id,
+            filesize,
+            contributions_v.video_id as cursor_id
+        FROM contributions_v
+        JOIN videos ON videos.id = contributions_v.video_id
+        LEFT JOIN channels ON channels.id = videos.channel_id
+        LEFT JOIN formats ON formats.id = contributions_v.format_id
+        WHERE contributor_id = :cnid AND contributions_v.video_id > :after ORDER BY contributions_v.video_id LIMIT :limit OFFSET :offset''', values={
         'cnid': contributor_id,
+        'after': after,
         'limit': limit,
         'offset': offset})
     
     return JSONResponse({
         'count': len(rows),
-        'nextOffset': offset + len(rows) if len(rows) == limit else None,
-        'videos': [dict(r) for r in rows]
+        'nextOffset': offset + len(rows) if len(rows) == limit and not cursor else None,
+        'nextCursor': encode_cursor('my_videos', rows[-1]['cursor_id']) if len(rows) == limit else None,
+        'videos': [{k: v for k, v in dict(r).items() if k != 'cursor_id'} for r in rows]
         }, status_code=200)
 
+@app.get('/my_channels/export')
+@limiter.limit('2/minute')
+async def export_contributor_channels(request: Request, db: databases.Database = Depends(get_database), format: str = 'ndjson', gzip: bool = False):
+    if format not in ('ndjson', 'tsv'):
+        return JSONResponse({'error': '`format` must be ndjson or tsv'}, status_code=400)
+    
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    query = '''
+        SELECT
+            channels.channel_id,
+            channels.title as channel_title,
+            note
+        FROM contributions_c JOIN channels ON channels.id = contributions_c.channel_id
+        WHERE contributor_id = :cnid ORDER BY contributions_c.channel_id'''
+    if format == 'tsv':
+        # `import_videos.py --channels` reads this as is
+        queries = [(
+            '[CHANNELS]\n' + '\t'.join(['channel_id', 'title', 'video_count', 'include (y/n, blank is y)', 'note (added to db)']) + '\n',
+            query, {'cnid': contributor_id},
+            lambda r: '\t'.join(['UC' + r['channel_id'], tsv_field(r['channel_title']), '', '', tsv_field(r['note'])]) + '\n')]
+    else:
+        queries = [(None, query, {'cnid': contributor_id}, lambda r: json.dumps(dict(r)) + '\n')]
+    
+    filename = f'my_channels.{format}' + ('.gz' if gzip else '')
+    return StreamingResponse(await start_stream(stream_export(db, queries, compress=gzip)),
+        media_type='application/gzip' if gzip else ('text/tab-separated-values' if format == 'tsv' else 'application/x-ndjson'),
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.get('/my_videos/export')
+@limiter.limit('2/minute')
+async def export_contributor_videos(request: Request, db: databases.Database = Depends(get_database), format: str = 'ndjson', gzip: bool = False):
+    if format not in ('ndjson', 'tsv'):
+        return JSONResponse({'error': '`format` must be ndjson or tsv'}, status_code=400)
+    
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    query = '''
+        SELECT
+            videos.video_id as id,
+            videos.title,
+            channels.channel_id,
+            channels.title as channel_title,
+            formats.format_string as format_id,
+            filesize
+        FROM contributions_v
+        JOIN videos ON videos.id = contributions_v.video_id
+        LEFT JOIN channels ON channels.id = videos.channel_id
+        LEFT JOIN formats ON formats.id = contributions_v.format_id
+        WHERE contributor_id = :cnid ORDER BY contributions_v.video_id'''
+    if format == 'tsv':
+        # same layout as compile_videos.py output, so import_videos.py and /submit_videos/bulk read it as is
+        # channels go first so the videos' channel titles survive a re-import
+        queries = [(
+            '[CHANNELS]\n' + '\t'.join(['channel_id', 'title', 'video_count', 'include (y/n, blank is y)', 'note (added to db)']) + '\n',
+            '''
+            SELECT channels.channel_id, channels.title, count(*) as video_count
+            FROM contributions_v
+            JOIN videos ON videos.id = contributions_v.video_id
+            JOIN channels ON channels.id = videos.channel_id
+            WHERE contributor_id = :cnid GROUP BY channels.id ORDER BY video_count DESC''', {'cnid': contributor_id},
+            lambda r: '\t'.join(['UC' + r['channel_id'], tsv_field(r['title']), str(r['video_count']), '', '']) + '\n'), (
+            '\n[VIDEOS]\n' + '\t'.join(['video_id', 'channel_id', 'format_id (max 20 chars)', 'include (y/n, blank is y)', 'title', 'filesize']) + '\n',
+            query, {'cnid': contributor_id},
+            lambda r: '\t'.join([r['id'], 'UC' + r['channel_id'] if r['channel_id'] else '', tsv_field(r['format_id']), '', tsv_field(r['title']), tsv_field(r['filesize'])]) + '\n')]
+    else:
+        # one /submit_videos video object per line, /submit_videos/bulk reads it as is
+        queries = [(None, query, {'cnid': contributor_id}, lambda r: json.dumps(dict(r)) + '\n')]
+    
+    filename = f'my_videos.{format}' + ('.gz' if gzip else '')
+    return StreamingResponse(await start_stream(stream_export(db, queries, compress=gzip)),
+        media_type='application/gzip' if gzip else ('text/tab-separated-values' if format == 'tsv' else 'application/x-ndjson'),
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.delete('/my_channels/{channelpath:str}')
 @limiter.limit('80/minute')
 async def delete_contributor_channel(request: Request, channelpath: str, db: databases.Database = Depends(get_database)):
@@ -542,9 +1508,6 @@ async def delete_contributor_channel(request: Request, channelpath: str, db: dat
     else:
         channel_id = chn_reg[1]
     
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -552,6 +1515,7 @@ async def delete_contributor_channel(request: Request, channelpath: str, db: dat
     await db.execute(query='DELETE FROM contributions_c WHERE channel_id = (SELECT id FROM channels WHERE channel_id = :chid) AND contributor_id = :cnid', values={
         'chid': channel_id,
         'cnid': contributor_id})
+    response_cache.invalidate([('channel', channel_id)])
     
     return JSONResponse({'success': True}, status_code=200)
 
@@ -566,25 +1530,20 @@ async def delete_contributor_video(request: Request, videopath: str, v: str = No
     else:
         video_id = vid_reg[1]
     
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
     
-    await db.execute(query='DELETE FROM contributions_v WHERE video_id = (SELECT id FROM videos WHERE video_id = :vid) AND contributor_id = :cnid', values={
-        'vid': video_id,
+    await db.execute(query='DELETE FROM contributions_v WHERE video_id = (SELECT id FROM videos WHERE video_key = :key) AND contributor_id = :cnid', values={
+        'key': video_id_to_int(video_id),
         'cnid': contributor_id})
+    response_cache.invalidate([('video', video_id)])
     
     return JSONResponse({'success': True}, status_code=200)
 
 @app.post('/delete_all')
 @limiter.limit('2/minute')
 async def delete_all_contributions(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -598,6 +1557,10 @@ async def delete_all_contributions(request: Request, db: databases.Database = De
     if not jsonDat.get('confirm') == True:
         return JSONResponse({'error': '`confirm` is not `true`'}, status_code=403)
     
+    # drop queued async submits first so they can't re-add contributions afterwards
+    await db.execute(query="DELETE FROM ingest_jobs WHERE contributor_id = :cnid AND status = 'queued'", values={
+        'cnid': contributor_id})
+    
     # delete videos
     await db.execute(query='DELETE FROM contributions_v WHERE contributor_id = :cnid', values={
         'cnid': contributor_id})
@@ -606,14 +1569,161 @@ async def delete_all_contributions(request: Request, db: databases.Database = De
     await db.execute(query='DELETE FROM contributions_c WHERE contributor_id = :cnid', values={
         'cnid': contributor_id})
     
+    # contributions can span any number of cached entities
+    response_cache.clear()
+    
+    return JSONResponse({'success': True}, status_code=200)
+
+@app.get('/wishlist')
+@limiter.limit('80/minute')
+async def fetch_wishlist(request: Request, db: databases.Database = Depends(get_database)):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    videos = await db.fetch_all(query='SELECT video_id, time_added FROM wishlist_v WHERE contributor_id = :cnid ORDER BY time_added', values={
+        'cnid': contributor_id})
+    channels = await db.fetch_all(query='SELECT channel_id, time_added FROM wishlist_c WHERE contributor_id = :cnid ORDER BY time_added', values={
+        'cnid': contributor_id})
+    
+    return JSONResponse({
+        'videos': [{'id': r['video_id'], 'time_added': r['time_added']} for r in videos],
+        'channels': [{'id': r['channel_id'], 'time_added': r['time_added']} for r in channels]
+        }, status_code=200)
+
+@app.post('/wishlist')
+@limiter.limit('30/minute')
+async def add_to_wishlist(request: Request, db: databases.Database = Depends(get_database)):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    # validate body
+    try:
+        jsonDat = await request.json()
+    except json.decoder.JSONDecodeError:
+        return JSONResponse({'error': 'malformed body'}, status_code=400)
+    if type(jsonDat) != dict or not set(jsonDat.keys()) <= {'videos', 'channels'} or not all(type(v) == list for v in jsonDat.values()):
+        return JSONResponse({'error': 'body must have `videos` and/or `channels` lists of ids'}, status_code=400)
+    
+    video_ids, channel_ids = [], []
+    for v in jsonDat.get('videos', []):
+        vid_reg = match_video_id.match(v) if type(v) == str else None
+        if not vid_reg:
+            return JSONResponse({'error': f'invalid video id {v}'}, status_code=400)
+        video_ids.append(vid_reg[1])
+    for c in jsonDat.get('channels', []):
+        chn_reg = match_channel_id.match(c) if type(c) == str else None
+        if not chn_reg:
+            return JSONResponse({'error': f'invalid channel id {c}'}, status_code=400)
+        channel_ids.append(chn_reg[1])
+    video_ids, channel_ids = list(dict.fromkeys(video_ids)), list(dict.fromkeys(channel_ids))
+    
+    count = await db.fetch_val(query='SELECT (SELECT count(*) FROM wishlist_v WHERE contributor_id = :cnid) + (SELECT count(*) FROM wishlist_c WHERE contributor_id = :cnid)', values={
+        'cnid': contributor_id})
+    if count + len(video_ids) + len(channel_ids) > config.get('wishlist_max_entries', 1000):
+        return JSONResponse({'error': f'wishlists are limited to {config.get("wishlist_max_entries", 1000)} videos/channels'}, status_code=403)
+    
+    # videos someone already has aren't wishlisted, the response lists them instead
+    keys = [video_id_to_int(v) for v in video_ids]
+    rows = await db.fetch_all(query='''
+        SELECT videos.video_id FROM videos JOIN video_holders ON video_holders.video_id = videos.id
+        WHERE videos.video_key = ANY(CAST(:keys AS BIGINT[])) AND video_holders.holders > 0''', values={'keys': keys})
+    held = {r['video_id'] for r in rows}
+    wished = [(k, v) for k, v in zip(keys, video_ids) if not v in held]
+    
+    ta = int(time.time())
+    added = await db.fetch_val(query='''
+        WITH inserted AS (
+            INSERT INTO wishlist_v (contributor_id, video_key, video_id, time_added)
+            SELECT :cnid, t.key, t.vid, :ta FROM unnest(CAST(:keys AS BIGINT[]), CAST(:vids AS CHAR(11)[])) AS t(key, vid)
+            ON CONFLICT DO NOTHING RETURNING 1
+        ) SELECT count(*) FROM inserted''', values={'cnid': contributor_id, 'ta': ta, 'keys': [k for k, v in wished], 'vids': [v for k, v in wished]})
+    added += await db.fetch_val(query='''
+        WITH inserted AS (
+            INSERT INTO wishlist_c (contributor_id, channel_id, time_added)
+            SELECT :cnid, t.cid, :ta FROM unnest(CAST(:cids AS CHAR(22)[])) AS t(cid)
+            ON CONFLICT DO NOTHING RETURNING 1
+        ) SELECT count(*) FROM inserted''', values={'cnid': contributor_id, 'ta': ta, 'cids': channel_ids})
+    
+    return JSONResponse({'success': True, 'added': added, 'held': [v for v in video_ids if v in held]}, status_code=200)
+
+@app.delete('/wishlist/{idpath:str}')
+@limiter.limit('80/minute')
+async def remove_from_wishlist(request: Request, idpath: str, db: databases.Database = Depends(get_database)):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    # video and channel ids differ in length, so one path takes either
+    if vid_reg := match_video_id.match(idpath):
+        await db.execute(query='DELETE FROM wishlist_v WHERE video_key = :key AND contributor_id = :cnid', values={
+            'key': video_id_to_int(vid_reg[1]), 'cnid': contributor_id})
+    elif chn_reg := match_channel_id.match(idpath):
+        await db.execute(query='DELETE FROM wishlist_c WHERE channel_id = :cid AND contributor_id = :cnid', values={
+            'cid': chn_reg[1], 'cnid': contributor_id})
+    else:
+        return JSONResponse({'error': 'invalid video or channel id'}, status_code=400)
+    
+    return JSONResponse({'success': True}, status_code=200)
+
+@app.get('/notifications')
+@limiter.limit('30/minute')
+async def fetch_notifications(request: Request, db: databases.Database = Depends(get_database), limit: int = 500):
+    # outbox for the discord bot, rows stay until acked through /notifications/ack
+    if not await verify_api_key(db, get_api_key(request), 'allow_create_user_api_keys'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    if limit > 1000 or limit < 1:
+        return JSONResponse({'error': '`limit` allowed range is 1-1000'}, status_code=400)
+    
+    # read only, rows are only removed through /notifications/ack (the triggers only queue matches that can be sent)
+    rows = await db.fetch_all(query='''
+        SELECT notifications.id, notifications.kind, contributors.discord_id,
+            videos.video_id, videos.title, channels.channel_id, channels.title AS channel_title
+        FROM notifications
+        JOIN contributors ON contributors.id = notifications.contributor_id
+        JOIN videos ON videos.id = notifications.video_id
+        LEFT JOIN channels ON channels.id = videos.channel_id
+        ORDER BY notifications.id LIMIT :limit''', values={'limit': limit})
+    
+    return JSONResponse({
+        'count': len(rows),
+        'notifications': [
+            {
+                'id': r['id'],
+                'kind': r['kind'],
+                'discord_id': r['discord_id'],
+                'video': {
+                    'id': r['video_id'],
+                    'title': r['title'],
+                    'channel_id': r['channel_id'],
+                    'channel_title': r['channel_title']
+                }
+            } for r in rows]
+        }, status_code=200)
+
+@app.post('/notifications/ack')
+@limiter.limit('30/minute')
+async def ack_notifications(request: Request, db: databases.Database = Depends(get_database)):
+    if not await verify_api_key(db, get_api_key(request), 'allow_create_user_api_keys'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    # validate body
+    try:
+        jsonDat = await request.json()
+    except json.decoder.JSONDecodeError:
+        return JSONResponse({'error': 'malformed body'}, status_code=400)
+    if type(jsonDat) != dict or type(jsonDat.get('ids')) != list or not all(type(i) == int for i in jsonDat['ids']):
+        return JSONResponse({'error': '`ids` must be a list of notification ids'}, status_code=400)
+    
+    await db.execute(query='DELETE FROM notifications WHERE id = ANY(CAST(:ids AS BIGINT[]))', values={'ids': jsonDat['ids']})
+    
     return JSONResponse({'success': True}, status_code=200)
 
 @app.post('/signup_nodiscord')
 @limiter.limit('5/minute')
 async def create_contributor(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     # check perms
     if not await verify_api_key(db, get_api_key(request), 'allow_create_user'):
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -659,6 +1769,7 @@ async def create_contributor(request: Request, db: databases.Database = Depends(
         INSERT INTO api_keys (application, api_key, allow_submit_contributions, allow_videos_query, allow_channelmaintainers_query, allow_channelvideos_query)
         VALUES (:application, :api_key, :allow_submit_contributions, TRUE, TRUE, TRUE) ON CONFLICT DO NOTHING''',
         values={'application': f'manually_added_{int(time.time())}', 'api_key': api_key, 'allow_submit_contributions': row.id})
+    api_key_cache.drop(api_key) # in case it was cached as unknown
     contributor['key'] = api_key
     
     return JSONResponse(contributor, status_code=200)
@@ -666,9 +1777,6 @@ async def create_contributor(request: Request, db: databases.Database = Depends(
 @app.post('/signup')
 @limiter.limit('2/minute')
 async def create_contributor(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     # check perms
     if not await verify_api_key(db, get_api_key(request), 'allow_create_user'):
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -715,9 +1823,6 @@ async def create_contributor(request: Request, db: databases.Database = Depends(
 @app.get('/authorize/{discord_id:str}')
 @limiter.limit('2/minute')
 async def authorize_contributor(request: Request, discord_id: int, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     # check perms
     if not await verify_api_key(db, get_api_key(request), 'allow_create_user_api_keys'):
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -739,6 +1844,7 @@ async def authorize_contributor(request: Request, discord_id: int, db: databases
     # fetch api_key
     row = await db.fetch_one(query='SELECT api_key FROM api_keys WHERE allow_submit_contributions = :cid', values={'cid': contributor_id})
     row = dict(row or {})
+    api_key_cache.drop(row.get('api_key')) # in case it was cached as unknown
     
     return JSONResponse({
         'key': row.get('api_key'),
@@ -752,9 +1858,6 @@ async def authorize_contributor(request: Request, discord_id: int, db: databases
 @app.post('/set_contact_info')
 @limiter.limit('2/minute')
 async def update_contact_info(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -774,14 +1877,14 @@ async def update_contact_info(request: Request, db: databases.Database = Depends
     # update contributor row
     await db.execute(query='UPDATE contributors SET alternative_contact_info = :contact_info WHERE id = :cnid', values={'cnid': contributor_id, 'contact_info': jsonDat['alternative_contact_info']})
     
+    # contact info is embedded in every cached payload the contributor appears in
+    response_cache.clear()
+    
     return JSONResponse({'success': True}, status_code=200)
 
 @app.post('/delete_account')
 @limiter.limit('2/minute')
 async def delete_contributor(request: Request, db: databases.Database = Depends(get_database)):
-    # assert db conn
-    await db.connect()
-    
     contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
     if type(contributor_id) != int:
         return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
@@ -795,6 +1898,15 @@ async def delete_contributor(request: Request, db: databases.Database = Depends(
     if not jsonDat.get('confirm') == True:
         return JSONResponse({'error': '`confirm` is not `true`'}, status_code=403)
     
+    # drop async submits first so queued ones can't re-add contributions afterwards
+    await db.execute(query='DELETE FROM ingest_jobs WHERE contributor_id = :cnid', values={
+        'cnid': contributor_id})
+    
+    # delete wishlists and pending notifications
+    for table in ['wishlist_v', 'wishlist_c', 'notifications']:
+        await db.execute(query=f'DELETE FROM {table} WHERE contributor_id = :cnid', values={
+            'cnid': contributor_id})
+    
     # delete videos
     await db.execute(query='DELETE FROM contributions_v WHERE contributor_id = :cnid', values={
         'cnid': contributor_id})
@@ -804,15 +1916,352 @@ async def delete_contributor(request: Request, db: databases.Database = Depends(
         'cnid': contributor_id})
     
     # delete api key
-    await db.execute(query='DELETE FROM api_keys WHERE allow_submit_contributions = :cnid', values={
+    rows = await db.fetch_all(query='DELETE FROM api_keys WHERE allow_submit_contributions = :cnid RETURNING api_key', values={
         'cnid': contributor_id})
+    for r in rows:
+        api_key_cache.drop(r['api_key'])
     
     # delete contributor
     await db.execute(query='DELETE FROM contributors WHERE id = :cnid', values={
         'cnid': contributor_id})
     
+    # contributions can span any number of cached entities
+    response_cache.clear()
+    
     return JSONResponse({'success': True}, status_code=200)
 
+SEARCH_MAX_RESULTS = 500
+
+@app.get('/search')
+@limiter.limit('30/minute')
+async def search_titles(request: Request, db: databases.Database = Depends(get_database), q: str = '', kind: str = 'all', limit: int = 25, cursor: str = None):
+    if not await verify_api_key(db, get_api_key(request), 'allow_videos_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    q = ' '.join(q.split())
+    if not 3 <= len(q) <= 200:
+        return JSONResponse({'error': '`q` must be 3-200 characters'}, status_code=400)
+    elif not kind in ['all', 'videos', 'channels']:
+        return JSONResponse({'error': '`kind` must be all, videos or channels'}, status_code=400)
+    elif limit > 100 or limit < 1:
+        return JSONResponse({'error': '`limit` allowed range is 1-100'}, status_code=400)
+    
+    # ranked results can't be keyset paginated, the cursor is an offset into the ranking and stops at SEARCH_MAX_RESULTS
+    offset = decode_cursor('search', cursor) if cursor else 0
+    if offset is None:
+        return JSONResponse({'error': 'invalid cursor'}, status_code=400)
+    
+    cache_key = ('search', q.lower(), kind, limit, offset)
+    payload = response_cache.get(cache_key)
+    if payload:
+        return JSONResponse(payload, status_code=200)
+    
+    # nearest neighbour scans of the titles_v/titles_c trigram gist indexes, `<%` matches q against any part of a title
+    # and `<<->` ranks by that word similarity, so partial and misspelled titles still match
+    # every title a video/channel was submitted with is searchable, duplicates are dropped keeping the best match
+    # ties are broken by id (then title) so offset pages of equally ranked results don't overlap or skip entries
+    wanted = min(offset + limit, SEARCH_MAX_RESULTS)
+    results = []
+    if kind in ['all', 'videos']:
+        rows = await db.fetch_all(query='''
+            SELECT videos.video_id AS id, videos.title, titles_v.title AS matched_title, channels.channel_id,
+                CAST(:q AS TEXT) <<-> titles_v.title AS distance
+            FROM titles_v JOIN videos ON videos.id = titles_v.video_id LEFT JOIN channels ON channels.id = videos.channel_id
+            WHERE CAST(:q AS TEXT) <% titles_v.title
+            AND EXISTS (SELECT 1 FROM contributions_v WHERE contributions_v.video_id = titles_v.video_id)
+            ORDER BY CAST(:q AS TEXT) <<-> titles_v.title, titles_v.video_id, titles_v.title LIMIT :n''', values={'q': q, 'n': wanted * 2})
+        results += [{'type': 'video', **dict(r)} for r in rows]
+    if kind in ['all', 'channels']:
+        rows = await db.fetch_all(query='''
+            SELECT channels.channel_id AS id, channels.title, titles_c.title AS matched_title,
+                CAST(:q AS TEXT) <<-> titles_c.title AS distance
+            FROM titles_c JOIN channels ON channels.id = titles_c.channel_id
+            WHERE CAST(:q AS TEXT) <% titles_c.title
+            ORDER BY CAST(:q AS TEXT) <<-> titles_c.title, titles_c.channel_id, titles_c.title LIMIT :n''', values={'q': q, 'n': wanted * 2})
+        results += [{'type': 'channel', **dict(r)} for r in rows]
+    
+    seen = set()
+    ranked = []
+    for r in sorted(results, key=lambda r: (r['distance'], r['type'], r['id'], r['matched_title'])):
+        if not (r['type'], r['id']) in seen:
+            seen.add((r['type'], r['id'])); ranked.append(r)
+    page = ranked[offset:wanted]
+    
+    payload = {
+        'count': len(page),
+        'nextCursor': encode_cursor('search', wanted) if len(ranked) > wanted and wanted < SEARCH_MAX_RESULTS else None,
+        'results': [
+            {
+                'type': r['type'],
+                'id': r['id'],
+                'title': r['title'],
+                'matched_title': r['matched_title'],
+                **({'channel_id': r['channel_id']} if r['type'] == 'video' else {}),
+                'score': round(1 - r['distance'], 4)
+            } for r in page]
+    }
+    response_cache.set(cache_key, payload)
+    
+    return JSONResponse(payload, status_code=200)
+
+@app.get('/stats')
+@limiter.limit('30/minute')
+async def fetch_stats(request: Request, db: databases.Database = Depends(get_database)):
+    if not await verify_api_key(db, get_api_key(request), 'allow_videos_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    payload = response_cache.get(('stats',))
+    if payload:
+        return JSONResponse(payload, status_code=200)
+    
+    # stats_* tables are kept current by triggers, every query here reads a handful of shard rows
+    # contributors who turned off allow_stats_queries aren't in any of the totals
+    totals = await db.fetch_one(query='''
+        SELECT coalesce(sum(videos), 0) AS videos, coalesce(sum(bytes), 0) AS bytes, coalesce(sum(contributors), 0) AS contributors FROM stats_global''')
+    formats = await db.fetch_all(query='''
+        SELECT formats.format_string, sum(stats_formats.videos) AS videos, sum(stats_formats.bytes) AS bytes FROM stats_formats
+        JOIN formats ON formats.id = stats_formats.format_id
+        GROUP BY formats.format_string HAVING sum(stats_formats.videos) > 0 ORDER BY 2 DESC LIMIT 20''')
+    
+    payload = {
+        'videos': int(totals['videos']),
+        'bytes': int(totals['bytes']),
+        'contributors': int(totals['contributors']),
+        'formats': [{'format_id': r['format_string'], 'videos': int(r['videos']), 'bytes': int(r['bytes'])} for r in formats]
+    }
+    response_cache.set(('stats',), payload)
+    
+    return JSONResponse(payload, status_code=200)
+
+@app.get('/channelstats/{channelpath:path}')
+@limiter.limit('80/minute')
+async def fetch_channel_stats(request: Request, channelpath: str, db: databases.Database = Depends(get_database)):
+    if not await verify_api_key(db, get_api_key(request), 'allow_channelvideos_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    # match channel id
+    chn_reg = match_channel_id.match(channelpath)
+    if not chn_reg:
+        return JSONResponse({'error': 'invalid channel id'}, status_code=400)
+    else:
+        channel_id = chn_reg[1]
+    
+    channel = await db.fetch_one(query='''
+        SELECT channels.title, coalesce(sum(stats_channels.videos), 0) AS videos, coalesce(sum(stats_channels.bytes), 0) AS bytes
+        FROM channels LEFT JOIN stats_channels ON stats_channels.channel_id = channels.id
+        WHERE channels.channel_id = :id GROUP BY channels.id''', values={'id': channel_id})
+    if not channel:
+        return JSONResponse({'error': 'channel not in db'}, status_code=404)
+    
+    return JSONResponse({
+        'channel': {
+            'id': channel_id,
+            'title': channel['title']
+        },
+        'videos': int(channel['videos']),
+        'bytes': int(channel['bytes'])
+        }, status_code=200)
+
+@app.get('/at_risk_videos/{channelpath:path}')
+@limiter.limit('80/minute')
+async def fetch_at_risk_videos(request: Request, channelpath: str, db: databases.Database = Depends(get_database), below: int = 2, limit: int = 500, cursor: str = None):
+    if not await verify_api_key(db, get_api_key(request), 'allow_channelvideos_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    if limit > 500 or limit < 1:
+        return JSONResponse({'error': '`limit` allowed range is 1-500'}, status_code=400)
+    elif below < 2:
+        return JSONResponse({'error': '`below` must be at least 2'}, status_code=400)
+    
+    # pages are ordered fewest holders first, the cursor packs (holders, video_id) of the last row
+    after = decode_cursor('at_risk_videos', cursor) if cursor else 0
+    if after is None:
+        return JSONResponse({'error': 'invalid cursor'}, status_code=400)
+    
+    # match channel id
+    chn_reg = match_channel_id.match(channelpath)
+    if not chn_reg:
+        return JSONResponse({'error': 'invalid channel id'}, status_code=400)
+    else:
+        channel_id = chn_reg[1]
+    
+    channel = await db.fetch_one(query='SELECT id, title FROM channels WHERE channel_id = :id', values={'id': channel_id})
+    if not channel:
+        return JSONResponse({'error': 'channel not in db'}, status_code=404)
+    
+    # range scan of video_holders_channel_id_idx, videos only held by contributors hiding from channel queries are skipped
+    rows = await db.fetch_all(query='''
+        SELECT video_holders.video_id AS id, video_holders.holders, videos.video_id, videos.title FROM video_holders
+        JOIN videos ON videos.id = video_holders.video_id
+        WHERE video_holders.channel_id = :cid AND video_holders.holders > 0 AND video_holders.holders < :below
+        AND (video_holders.holders, video_holders.video_id) > (:h, :after) AND video_holders.listed > 0
+        ORDER BY video_holders.holders, video_holders.video_id LIMIT :limit''', values={
+        'cid': channel['id'],
+        'below': below,
+        'h': after >> 32,
+        'after': after & 0xFFFFFFFF,
+        'limit': limit})
+    
+    return JSONResponse({
+        'count': len(rows),
+        'nextCursor': encode_cursor('at_risk_videos', rows[-1]['holders'] << 32 | rows[-1]['id']) if len(rows) == limit else None,
+        'channel': {
+            'id': channel_id,
+            'title': channel['title']
+        },
+        'videos': [{'id': r['video_id'], 'title': r['title'], 'holders': r['holders']} for r in rows]
+        }, status_code=200)
+
+@app.get('/at_risk_channels')
+@limiter.limit('30/minute')
+async def fetch_at_risk_channels(request: Request, db: databases.Database = Depends(get_database), limit: int = 100, cursor: str = None):
+    if not await verify_api_key(db, get_api_key(request), 'allow_channelvideos_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    if limit > 500 or limit < 1:
+        return JSONResponse({'error': '`limit` allowed range is 1-500'}, status_code=400)
+    
+    # pages are ordered most single copy videos first, the cursor packs (videos, channel_id) of the last row
+    before = decode_cursor('at_risk_channels', cursor) if cursor else (1 << 62)
+    if before is None:
+        return JSONResponse({'error': 'invalid cursor'}, status_code=400)
+    
+    # backward scan of channel_single_copies_videos_idx, single copies held by contributors hiding from channel queries aren't counted
+    rows = await db.fetch_all(query='''
+        SELECT channel_single_copies.channel_id AS id, channel_single_copies.videos, channels.channel_id, channels.title
+        FROM channel_single_copies JOIN channels ON channels.id = channel_single_copies.channel_id
+        WHERE channel_single_copies.videos > 0 AND (channel_single_copies.videos, channel_single_copies.channel_id) < (:v, :before)
+        ORDER BY channel_single_copies.videos DESC, channel_single_copies.channel_id DESC LIMIT :limit''', values={
+        'v': before >> 32,
+        'before': before & 0xFFFFFFFF,
+        'limit': limit})
+    
+    return JSONResponse({
+        'count': len(rows),
+        'nextCursor': encode_cursor('at_risk_channels', rows[-1]['videos'] << 32 | rows[-1]['id']) if len(rows) == limit else None,
+        'channels': [{'id': r['channel_id'], 'title': r['title'], 'single_copy_videos': r['videos']} for r in rows]
+        }, status_code=200)
+
+@app.get('/my_stats')
+@limiter.limit('80/minute')
+async def fetch_contributor_stats(request: Request, db: databases.Database = Depends(get_database)):
+    contributor_id = await verify_api_key(db, get_api_key(request), 'allow_submit_contributions')
+    if type(contributor_id) != int:
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    row = await db.fetch_one(query='SELECT videos, bytes, channels FROM stats_contributors WHERE contributor_id = :cnid', values={
+        'cnid': contributor_id})
+    
+    return JSONResponse(dict(row) if row else {'videos': 0, 'bytes': 0, 'channels': 0}, status_code=200)
+
+@app.get('/leaderboard')
+@limiter.limit('30/minute')
+async def fetch_leaderboard(request: Request, db: databases.Database = Depends(get_database), by: str = 'videos', limit: int = 25):
+    if not await verify_api_key(db, get_api_key(request), 'allow_videos_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    if not by in ['videos', 'bytes']:
+        return JSONResponse({'error': '`by` must be videos or bytes'}, status_code=400)
+    elif limit > 100 or limit < 1:
+        return JSONResponse({'error': '`limit` allowed range is 1-100'}, status_code=400)
+    
+    payload = response_cache.get(('leaderboard', by, limit))
+    if payload:
+        return JSONResponse(payload, status_code=200)
+    
+    # walks the stats_contributors_{by} index from the top, skipping contributors who opted out of stats
+    rows = await db.fetch_all(query=f'''
+        SELECT contributors.name, contributors.discord_id, contributors.alternative_contact_info,
+            stats_contributors.videos, stats_contributors.bytes, stats_contributors.channels
+        FROM stats_contributors JOIN contributors ON contributors.id = stats_contributors.contributor_id
+        WHERE contributors.allow_stats_queries AND stats_contributors.{by} > 0
+        ORDER BY stats_contributors.{by} DESC, stats_contributors.contributor_id LIMIT :limit''', values={'limit': limit})
+    
+    payload = {
+        'by': by,
+        'leaderboard': [
+            {
+                'rank': i + 1,
+                'videos': r['videos'],
+                'bytes': r['bytes'],
+                'channels': r['channels'],
+                'contributor': {
+                    'name': r['name'],
+                    'discord_id': r['discord_id'] if (not r['alternative_contact_info']) else None,
+                    'alternative_contact_info': r['alternative_contact_info']
+                }
+            } for i, r in enumerate(rows)]
+    }
+    response_cache.set(('leaderboard', by, limit), payload)
+    
+    return JSONResponse(payload, status_code=200)
+
+@app.get('/changes')
+@limiter.limit('60/minute')
+async def fetch_changes(request: Request, db: databases.Database = Depends(get_database), since: int = 0, limit: int = 1000):
+    # the feed has every contributor's contributions, including those who opted out of channel queries, so it's not a default permission
+    if not await verify_api_key(db, get_api_key(request), 'allow_changes_query'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    if not 0 < limit <= 10000:
+        return JSONResponse({'error': 'limit must be between 1 and 10000'}, status_code=400)
+    
+    await sequence_changes(db)
+    
+    # old changes are pruned, a mirror that fell further behind than that has to start over from a dump
+    oldest = await db.fetch_val(query='SELECT min(seq) FROM changes')
+    if oldest and since < oldest - 1:
+        return JSONResponse({'error': f'changes before seq {oldest} were pruned, reload from a dump', 'oldest': oldest}, status_code=410)
+    
+    rows = await db.fetch_all(query='''
+        SELECT seq, time_added, tbl, op, data FROM changes WHERE seq > :since
+        ORDER BY seq LIMIT :limit''', values={'since': since, 'limit': limit})
+    
+    return JSONResponse({
+        'count': len(rows),
+        'nextSince': rows[-1]['seq'] if rows else since,
+        'more': len(rows) == limit,
+        'changes': [
+            {
+                'seq': r['seq'],
+                'time': r['time_added'],
+                'table': r['tbl'],
+                'op': r['op'],
+                'data': json.loads(r['data']) if type(r['data']) == str else r['data']
+            } for r in rows]
+    }, status_code=200)
+
+@app.get('/cache_stats')
+@limiter.limit('10/minute')
+async def fetch_cache_stats(request: Request, db: databases.Database = Depends(get_database)):
+    # check perms
+    if not await verify_api_key(db, get_api_key(request), 'allow_create_user'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    return JSONResponse({
+        'response_cache': response_cache.stats(),
+        'api_key_cache': api_key_cache.stats()
+        }, status_code=200)
+
+@app.get('/pool_stats')
+@limiter.limit('10/minute')
+async def fetch_pool_stats(request: Request, db: databases.Database = Depends(get_database)):
+    # check perms
+    if not await verify_api_key(db, get_api_key(request), 'allow_create_user'):
+        return JSONResponse({'error': 'insufficient permissions'}, status_code=401)
+    
+    return JSONResponse(pool_stats(), status_code=200)
+
+@app.on_event('startup')
+async def startup_event():
+    await database.connect()
+    for i in range(config.get('ingest_workers', 1)):
+        ingest_tasks.append(asyncio.create_task(ingest_worker(database)))
+
 @app.on_event('shutdown')
 async def shutdown_event():
+    for task in ingest_tasks:
+        task.cancel()
+    await asyncio.gather(*ingest_tasks, return_exceptions=True)
+    ingest_tasks.clear()
     await database.disconnect()
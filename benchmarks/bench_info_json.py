@@ -0,0 +1,110 @@
+import argparse
+from itertools import islice
+import json
+from os.path import dirname, isfile, join, realpath
+import random
+import statistics
+import sys
+import tarfile
+import time
+import tracemalloc
+
+sys.path.insert(0, join(dirname(realpath(__file__)), '..'))
+from compile_videos import IJ_KEYS, extract_info_json, find_files, is_ij, simdjson
+
+# compares json.loads against compile_videos' selective extraction on info.jsons
+# pass a directory/tarball of real info.jsons, without one synthetic yt-dlp shaped files are generated
+id_chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+def random_id(k):
+    return ''.join(random.choices(id_chars, k=k))
+
+def make_format(i, video_id):
+    return {
+        'format_id': str(i), 'format_note': random.choice(['144p', '360p', '720p', '1080p', 'medium']), 'ext': random.choice(['mp4', 'webm', 'm4a']),
+        'protocol': 'https', 'acodec': 'none', 'vcodec': 'avc1.64001F', 'width': 1280, 'height': 720, 'fps': 30, 'tbr': 1234.5, 'filesize': random.randrange(1 << 30),
+        'url': f'https://rr1---sn-{random_id(8)}.googlevideo.com/videoplayback?expire=1700000000&id={video_id}&itag={i}&source=youtube&sig=' + random_id(600),
+        'http_headers': {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64)', 'Accept': 'text/html,application/xhtml+xml', 'Accept-Language': 'en-us,en;q=0.5'},
+        'fragments': [{'url': random_id(40), 'duration': 5.0} for _ in range(random.randrange(0, 20))]}
+
+def make_info_json(n_formats):
+    # keys in the order yt-dlp writes them, `format_id`/`filesize` come after the big arrays
+    video_id = random_id(11)
+    formats = [make_format(i, video_id) for i in range(n_formats)]
+    return json.dumps({
+        'id': video_id, 'title': f'benchmark video "{random_id(20)}" 🎵',
+        'formats': formats,
+        'thumbnails': [{'url': f'https://i.ytimg.com/vi/{video_id}/{random_id(12)}.jpg', 'preference': -i, 'id': str(i)} for i in range(40)],
+        'description': random_id(2000), 'channel_id': 'UC' + random_id(22), 'duration': 212, 'view_count': 1 << 30,
+        'automatic_captions': {random_id(2): [{'ext': ext, 'url': f'https://www.youtube.com/api/timedtext?v={video_id}&sig=' + random_id(300), 'name': 'English'}
+            for ext in ['json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt']] for _ in range(100)},
+        'uploader': 'benchmark channel', 'uploader_id': '@benchmark', 'availability': 'public', 'extractor': 'youtube', 'channel': 'benchmark channel',
+        'fulltitle': 'benchmark video', 'requested_formats': formats[-2:], 'format_id': f'{n_formats-1}+{n_formats-2}', 'filesize': None,
+        'heatmap': [{'start_time': i, 'end_time': i + 2.1, 'value': random.random()} for i in range(100)]}).encode('utf-8')
+
+def load_files(args):
+    if not args.in_path:
+        return [make_info_json(random.randrange(args.min_formats, args.max_formats)) for _ in range(args.files)]
+    elif isfile(args.in_path):
+        with tarfile.open(args.in_path, 'r') as tar:
+            return [tar.extractfile(m).read() for m in tar.getmembers() if m.isfile() and is_ij.match(m.name)][:args.files]
+    files = []
+    for entry in islice(find_files(args.in_path, is_ij), args.files):
+        with open(entry.path, 'rb') as f: files.append(f.read())
+    return files
+
+def bench(fn, files, runs):
+    # cpu seconds per run over every file
+    samples = []
+    for _ in range(runs):
+        start = time.process_time()
+        for fbin in files:
+            fn(fbin)
+        samples.append(time.process_time() - start)
+    return statistics.median(samples)
+
+def peak_memory(fn, fbin):
+    # python heap only, simdjson's own buffers are reused between files and about the size of the largest file
+    tracemalloc.start()
+    result = fn(fbin)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def main(args):
+    if not simdjson:
+        print('pysimdjson is not installed, compile_videos.py falls back to json.loads'); exit()
+    random.seed(args.seed)
+    
+    # outputs have to agree before timings mean anything, unreadable files are left out
+    files, fallbacks = [], 0
+    for fbin in load_files(args):
+        try: expected = {k: v for k, v in json.loads(fbin).items() if k in IJ_KEYS}
+        except Exception: continue
+        files.append(fbin)
+        extracted = extract_info_json(fbin)
+        if extracted is None:
+            fallbacks += 1; continue
+        assert extracted == expected, f'mismatch: {extracted} != {expected}'
+    total = sum(len(f) for f in files)
+    print(f'{len(files):,} info.jsons, {total/len(files)/1024:.0f}KB average')
+    
+    loads = bench(json.loads, files, args.runs)
+    extract = bench(extract_info_json, files, args.runs)
+    largest = max(files, key=len)
+    print(f'json.loads: {loads/len(files)*1e6:,.0f}us/file, {total/loads/(1 << 20):,.0f}MB/s, peak {peak_memory(json.loads, largest)/1024:,.0f}KB on the largest file')
+    print(f'extract_info_json: {extract/len(files)*1e6:,.0f}us/file, {total/extract/(1 << 20):,.0f}MB/s, peak {peak_memory(extract_info_json, largest)/1024:,.0f}KB on the largest file')
+    print(f'{loads/extract:.1f}x less cpu, {fallbacks} files fell back to json.loads')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('in_path', nargs='?', default=None, help='directory or tarball of info.jsons (synthetic files if not set)')
+    parser.add_argument('--files', type=int, default=200, help='info.jsons to load (default 200)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--min-formats', type=int, default=20, help='synthetic files only')
+    parser.add_argument('--max-formats', type=int, default=200, help='synthetic files only')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    main(args)
@@ -0,0 +1,77 @@
+import argparse
+import random
+import requests
+import statistics
+import sys
+import time
+
+# submits batches of random (fake!) videos and reports /submit_videos latency
+# only run this against a local/dev tracker, never the public api
+id_chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+def random_video_id():
+    return ''.join(random.choices(id_chars, k=10)) + random.choice('AEIMQUYcgkosw048')
+
+def random_channel_id():
+    return 'UC' + ''.join(random.choices(id_chars, k=21)) + random.choice('AQgw')
+
+def make_batch(args, channels):
+    batch = []
+    for _ in range(args.batch_size):
+        channel_id = random.choice(channels)
+        batch.append({
+            'id': random_video_id(),
+            'title': f'benchmark video {random.randrange(1 << 32)}',
+            'channel_id': channel_id,
+            'channel_title': f'benchmark channel {channel_id[-6:]}',
+            'format_id': random.choice(['22', '18', '137+140', '616-dash+251-dash', '248+251']),
+            'filesize': random.randrange(1 << 20, 1 << 31)})
+    return batch
+
+def submit(args, batch):
+    while True:
+        start = time.perf_counter()
+        resp = requests.post(args.api_root_url + '/submit_videos', headers={'Authorization': args.api_key}, json={'videos': batch})
+        elapsed = time.perf_counter() - start
+        if resp.status_code == 429:
+            print('429 ratelimiting.. retrying'); time.sleep(5); continue
+        elif resp.status_code != 200:
+            raise Exception(f'bad status {resp.status_code}: {resp.text}')
+        return elapsed
+
+def main(args):
+    random.seed(args.seed)
+    channels = [random_channel_id() for _ in range(args.channels)]
+    
+    latencies = {'new': [], 'resubmit': []}
+    for run in range(args.runs):
+        batch = make_batch(args, channels)
+        latencies['new'].append(submit(args, batch))
+        if args.resubmit:
+            latencies['resubmit'].append(submit(args, batch))
+        print(f'run {run+1}/{args.runs}: {latencies["new"][-1]*1000:.1f}ms')
+    
+    for kind, samples in latencies.items():
+        if not samples: continue
+        samples = sorted(samples)
+        p95 = samples[min(len(samples)-1, int(len(samples)*0.95))]
+        print(f'{kind} batches of {args.batch_size}: p50 {statistics.median(samples)*1000:.1f}ms, p95 {p95*1000:.1f}ms, mean {statistics.mean(samples)*1000:.1f}ms ({len(samples)} runs)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--api-key', help='dya tracker api key (of a throwaway contributor)', default=None)
+    parser.add_argument('--api-root-url', help='dya tracker api url', default='http://localhost:33892')
+    parser.add_argument('-n', '--runs', default=20, type=int, help='number of batches to submit')
+    parser.add_argument('-b', '--batch-size', default=500, type=int, help='videos per batch (api max is 500)')
+    parser.add_argument('-c', '--channels', default=50, type=int, help='number of distinct random channels videos are spread over')
+    parser.add_argument('-r', '--resubmit', action='store_true', help='also time resubmitting each batch (all rows already present)')
+    parser.add_argument('--seed', default=None, type=int, help='random seed')
+    if len(sys.argv)==1:
+        parser.print_help(sys.stderr); exit()
+    args = parser.parse_args()
+    
+    if not args.api_key:
+        parser.print_help(sys.stderr)
+        print('\napi key is a required arg'); exit()
+    
+    main(args)
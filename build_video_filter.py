@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import asyncpg
+import hashlib
+import json
+from os import replace
+from os.path import isfile, join, dirname, realpath
+import time
+from video_filter import VideoFilter
+
+# publishes video_filter.bin (see video_filter.py) and video_filter.json next to the db dumps, run it from cron e.g.
+#   */15 * * * * python build_video_filter.py -o /share/nginx_files/dya-tracker-backups/
+# runs are incremental (only contributions added since the last run are read), a full rebuild happens every
+# --rebuild-days, when the filter fills up, or with --full; only full rebuilds drop videos whose contributions were all deleted
+
+async def build(args):
+    with open(args.config, 'r') as f:
+        config = json.loads(f.read())
+    conn = await asyncpg.connect(host=config['host'], port=config['port'], user=config['user'], password=config['password'], database=config['table'])
+    
+    path = join(args.out_dir, 'video_filter.bin')
+    previous = VideoFilter.load(path) if isfile(path) else None
+    vf = previous
+    now = int(time.time())
+    if vf and (args.full or now - vf.full_built_at > args.rebuild_days * 86400 or vf.count > vf.capacity or vf.fp_rate != args.fp_rate):
+        vf = None
+    
+    added = 0
+    full = vf is None
+    async with conn.transaction():
+        if full:
+            total = await conn.fetchval('SELECT count(*) FROM videos WHERE EXISTS (SELECT 1 FROM contributions_v WHERE contributions_v.video_id = videos.id)')
+            vf = VideoFilter(total * args.headroom, args.fp_rate)
+            vf.version = previous.version if previous else 0
+            vf.full_built_at = now
+            query, params = 'SELECT video_key FROM videos WHERE EXISTS (SELECT 1 FROM contributions_v WHERE contributions_v.video_id = videos.id)', []
+            print(f'full rebuild, {total:,} videos')
+        else:
+            # overlap the previous run so contributions from transactions still open back then aren't missed
+            query, params = '''
+                SELECT DISTINCT videos.video_key FROM contributions_v JOIN videos ON videos.id = contributions_v.video_id
+                WHERE contributions_v.time_added >= $1''', [vf.built_at - args.overlap]
+            print(f'incremental update of version {vf.version}, {vf.count:,} videos')
+        
+        async for row in conn.cursor(query, *params, prefetch=10000):
+            if full or not row['video_key'] in vf:
+                vf.add(row['video_key']); added += 1
+    await conn.close()
+    
+    if added or full:
+        vf.version += 1
+    vf.built_at = now
+    vf.save(path)
+    
+    with open(path, 'rb') as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    meta = {
+        'version': vf.version,
+        'count': vf.count,
+        'capacity': vf.capacity,
+        'fp_rate': vf.estimated_fp_rate(),
+        'hashes': vf.hashes,
+        'bits': vf.bits,
+        'built_at': vf.built_at,
+        'full_built_at': vf.full_built_at,
+        'sha256': sha256}
+    with open(join(args.out_dir, 'video_filter.json.tmp'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(meta))
+    replace(join(args.out_dir, 'video_filter.json.tmp'), join(args.out_dir, 'video_filter.json'))
+    print(f'added {added:,} videos, version {vf.version}: {vf.count:,} videos, estimated false positive rate {meta["fp_rate"]:.4%}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--out-dir', help='directory to write video_filter.bin/.json to', default='./')
+    parser.add_argument('-c', '--config', help='db creds json', default=join(dirname(realpath(__file__)), 'pg_creds.json'))
+    parser.add_argument('-p', '--fp-rate', type=float, default=0.01, help='target false positive rate (default 0.01)')
+    parser.add_argument('--headroom', type=float, default=1.25, help='size full rebuilds for this many times the current video count (default 1.25)')
+    parser.add_argument('--rebuild-days', type=float, default=7, help='days between full rebuilds (default 7)')
+    parser.add_argument('--overlap', type=int, default=3600, help='seconds of overlap between incremental runs (default 3600)')
+    parser.add_argument('--full', action='store_true', help='force a full rebuild')
+    args = parser.parse_args()
+    
+    asyncio.run(build(args))
@@ -1,94 +1,275 @@
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from functools import partial
 import json
-from os import listdir, makedirs
-from os.path import isfile, isdir, split, splitext, join
+from os import cpu_count, makedirs, scandir
+from os.path import isdir, realpath, split, splitext, join
 import re
+import sqlite3
 import sys
 import tarfile
+from yt_ids import parse_video_id, parse_channel_id
+try:
+    import simdjson # optional (pip install pysimdjson), info.jsons are parsed ~10x faster with it
+except ImportError:
+    simdjson = None
+try:
+    import zstandard # optional (pip install zstandard), for .tar.zst
+except ImportError:
+    zstandard = None
 
 is_ij = re.compile(r'.+\.info\.json$', re.IGNORECASE)
-match_yt_channel_id = re.compile(r'^(?:UC)?([A-Za-z0-9_-]{21}[AQgw])$')
-match_yt_video_id = re.compile(r'^([A-Za-z0-9_-]{10}[AEIMQUYcgkosw048])$')
+# bump when parse_info_json's output changes, cached records are thrown away
+CACHE_VERSION = 1
+CACHE_SCHEMA = '''
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (source TEXT, path TEXT, size INTEGER, mtime INTEGER, record TEXT, PRIMARY KEY (source, path));
+'''
+is_tarball = re.compile(r'.+\.(tar|tar\.gz|tgz|tar\.xz|txz|tar\.bz2|tbz2?|tar\.zst|tzst)$', re.IGNORECASE)
 
 def strip_vals(string, chars='\t\n'):
     for c in chars:
         string = string.replace(c, '')
     return string
 
-def match_re(string, regex):
-    res = regex.match(string)
-    if res: return res[1]
+def list_dir(directory, regex=None):
+    # one directory's files (matching regex) and subdirectories, entry types come from scandir so nothing is stat'ed
+    files, dirs = [], []
+    with scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(): dirs.append(entry.path)
+            elif not entry.is_file(): print("WARNING: you shouldn't be seeing this", directory, entry.name)
+            elif not regex or regex.match(entry.name): files.append(entry)
+    return files, dirs
 
-def find_files(fdir, regex=None):
-    files = []
-    directories = [fdir]
-    # traverse directories looking for files
-    for directory in directories:
-        for f in listdir(directory):
-            if isfile(directory+"/"+f): files.append(directory+"/"+f)
-            elif isdir(directory+"/"+f): directories.append(directory+"/"+f)
-            else: print("WARNING: you shouldn't be seeing this", directory, f)
+def find_files(fdir, regex=None, threads=1):
+    # yield DirEntrys of files as directories are read, breadth first
+    # with threads > 1 the next directories are listed concurrently (for high latency/network storage), files come out in the same order
+    directories = deque([fdir])
+    if threads <= 1:
+        while directories:
+            files, dirs = list_dir(directories.popleft(), regex)
+            directories.extend(dirs)
+            yield from files
+        return
     
-    if regex: # filter by expression
-        files = [f for f in files if regex.match(f)]
+    with ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        while directories or pending:
+            while directories and len(pending) < threads * 2:
+                pending.append(pool.submit(list_dir, directories.popleft(), regex))
+            files, dirs = pending.popleft().result()
+            directories.extend(dirs)
+            yield from files
+
+# top level info.json keys parse_info_json reads
+IJ_KEYS = ('id', 'extractor', 'channel_id', 'uploader_id', 'availability', 'title', 'fulltitle', 'channel', 'uploader', 'format_id', 'filesize')
+ij_parser = simdjson.Parser() if simdjson else None
+
+def extract_info_json(fbin, keys=IJ_KEYS):
+    # returns a dict of only `keys` from an info.json's top level object, everything else (formats, thumbnails,
+    # captions, comments..) is only indexed by simdjson and never built into python objects
+    # returns None without simdjson or if the file is odd, use json.loads then
+    if not ij_parser: return None
+    doc = ij_parser.parse(fbin)
+    if not isinstance(doc, simdjson.Object): return None
+    found = {}
+    for key in keys:
+        if not key in doc: continue
+        found[key] = doc.get(key)
+        if isinstance(found[key], (simdjson.Object, simdjson.Array)): return None
+    return found
+
+def parse_info_json(args, fbin, file):
+    # returns (video, channel) parsed from one info.json, channel is None if the video has no channel id
+    # get json obj, only the keys used below are parsed unless the file is odd
+    try: jdat=extract_info_json(fbin)
+    except: jdat=None
+    if jdat is None:
+        try: jdat=json.loads(fbin)
+        except: print(f'error reading {file}'); return None
+    
+    # skip non-yt
+    if not jdat.get('extractor') == 'youtube':
+        print(f'non-youtube extractor "{jdat.get("extractor")}" from file {file}'); return None
     
-    return files
+    # ids
+    video_id = parse_video_id(jdat.get('id',''))
+    if not video_id: print(f'error extracting video id from {file}'); return None
+    try:
+        channel_id = parse_channel_id(jdat.get('channel_id') or '') or parse_channel_id(jdat.get('uploader_id') or '')
+    except Exception as e:
+        print(f'error parsing file {file}')
+        raise e
+    if not channel_id: print(f'error extracting channel id from video {video_id}, continuing anyway')
+    
+    # skip unlisted vids if set
+    if (not args.include_unlisted) and (jdat.get('availability', 'public') != 'public'):
+        print(f'skipping video {video_id}, unlisted video'); return None
+    
+    # titles
+    if args.exclude_titles: video_title = jdat.get('title') or jdat.get('fulltitle'); video_title = strip_vals(video_title)
+    else: video_title = None
+    channel_title = jdat.get('channel') or jdat.get('uploader')
+    if not channel_title: print(f'error extracting channel title from video {video_id}'); return None
+    
+    video = {'id': video_id, 'title': video_title, 'channel_id': 'UNSET_CHANNEL_ID', 'format_id': jdat.get('format_id'), 'filesize': jdat.get('filesize')}
+    channel = None
+    if channel_id:
+        channel_id = 'UC'+channel_id
+        channel = {'id': channel_id, 'title': channel_title}
+        video['channel_id'] = channel_id
+    return video, channel
+
+def parse_chunk(args, chunk):
+    # chunk is a list of (file, size, mtime, source), source being a file path, (offset, size) of an uncompressed tarball member or its bytes
+    # files are read here so workers don't wait on the parent for anything but the chunk itself
+    results = []
+    tarh = open(args.in_path, 'rb') if chunk and type(chunk[0][3]) == tuple else None
+    for file, size, mtime, source in chunk:
+        if type(source) == str:
+            with open(source, 'rb') as f: fbin = f.read()
+        elif tarh:
+            tarh.seek(source[0]); fbin = tarh.read(source[1])
+        else:
+            fbin = source
+        results.append((file, size, mtime, parse_info_json(args, fbin, file)))
+    if tarh: tarh.close()
+    return len(chunk), results
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk; chunk = []
+    if chunk: yield chunk
+
+def iter_tar_members(tar, f):
+    # members as they're read, TarFile would keep every TarInfo it has seen otherwise
+    while (member := tar.next()) is not None:
+        tar.members = []
+        if member.isfile():
+            yield member
+    tar.close()
+    if f is not sys.stdin.buffer: f.close()
+
+def list_info_jsons(args, skip=None):
+    # returns an iterator of chunks for parse_chunk
+    # files `skip(file, size, mtime)` is true for are left out (and tarball members not read)
+    if isdir(args.in_path):
+        # walked lazily, parsing starts with the first directory
+        files = find_files(args.in_path, is_ij, args.walk_threads)
+        if skip:
+            stats = ((e.path, st.st_size, st.st_mtime_ns) for e in files for st in [e.stat()])
+            return chunked(((f, size, mtime, f) for f, size, mtime in stats if not skip(f, size, mtime)), 100)
+        return chunked(((e.path, None, None, e.path) for e in files), 100)
+    
+    # tarballs are read as a stream so work starts right away and memory doesn't grow with the member count
+    f = sys.stdin.buffer if args.in_path == '-' else open(args.in_path, 'rb')
+    head = f.peek(512)
+    if head[:4] == b'\x28\xb5\x2f\xfd':
+        if not zstandard: print('pip install zstandard to read .tar.zst'); exit()
+        tar = tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(f), mode='r|')
+    elif f is not sys.stdin.buffer and head[257:262] == b'ustar':
+        # uncompressed file, workers read members straight from their offsets
+        tar = tarfile.open(fileobj=f, mode='r:')
+        return chunked(((m.name, m.size, m.mtime, (m.offset_data, m.size)) for m in iter_tar_members(tar, f)
+            if not (skip and skip(m.name, m.size, m.mtime))), 100)
+    else:
+        tar = tarfile.open(fileobj=f, mode='r|*')
+    
+    # compressed/piped tarballs can only be read in order, so contents are read here and shipped in small chunks
+    return chunked(((m.name, m.size, m.mtime, tar.extractfile(m).read()) for m in iter_tar_members(tar, f)
+        if not (skip and skip(m.name, m.size, m.mtime))), 10)
+
+def imap_bounded(pool, fn, tasks, window, ordered=True):
+    # like Pool.imap(_unordered), but only `window` tasks are submitted ahead so read file contents don't pile up
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        while len(pending) >= window:
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    pending.remove(f); yield f.result()
+    if ordered:
+        while pending:
+            yield pending.popleft().result()
+    else:
+        for f in as_completed(pending):
+            yield f.result()
+
+def open_cache(args):
+    # sqlite index of every info.json parsed so far, keyed by path (tarball member name) + size + mtime
+    # parse options are stored with it, changing them starts the index over
+    db = sqlite3.connect(args.cache)
+    db.executescript(CACHE_SCHEMA)
+    options = json.dumps([CACHE_VERSION, args.include_unlisted, args.exclude_titles])
+    if (db.execute("SELECT value FROM state WHERE key = 'options'").fetchone() or [None])[0] != options:
+        with db:
+            db.execute('DELETE FROM files')
+            db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('options', ?)", (options,))
+    return db
 
 def process_info_jsons(args):
     # process indir/tarball of IJs
-    isTarball = False
-    if isfile(args.in_path):
-        isTarball = True; tar = tarfile.open(args.in_path, 'r')
-        files = tar.getmembers()
-    else:
-        files = find_files(args.in_path, is_ij)
+    # with --cache, files whose path/size/mtime are in the index aren't read again, the tsv is rebuilt from the index in file order
+    cache, known, order = None, {}, []
+    if args.cache:
+        cache = open_cache(args)
+        source = '-' if args.in_path == '-' else realpath(args.in_path)
+        known = {r[0]: (r[1], r[2], r[3]) for r in cache.execute('SELECT path, size, mtime, record FROM files WHERE source = ?', (source,))}
+        print(f'{len(known)} files in cache')
     
-    # process/insert info-jsons in chunks of 100
+    def skip(file, size, mtime):
+        order.append(file)
+        return known.get(file, (None, None))[:2] == (size, mtime)
+    chunks = list_info_jsons(args, skip if cache else None)
+    
+    # with --jobs reading/parsing is fanned out over a process pool, results are merged here in file order
+    # (same output as a single process) or as they finish with --unordered
     videos = {}
     channels = {}
-    for fileChunk in (files[pos:pos + 100] for pos in range(0, len(files), 100)):
-        for file in fileChunk:
-            # get file bin
-            if type(file) == tarfile.TarInfo:
-                fbin = tar.extractfile(file).read()
-            else:
-                with open(file, 'rb') as f: fbin = f.read()
-            
-            # get json obj
-            try: jdat=json.loads(fbin)
-            except: print(f'error reading {file}'); continue
-            
-            # skip non-yt
-            if not jdat.get('extractor') == 'youtube':
-                print(f'non-youtube extractor "{jdat.get("extractor")}" from file {file}'); continue
-            
-            # ids
-            video_id = match_re(jdat.get('id',''), match_yt_video_id)
-            if not video_id: print(f'error extracting video id from {file}'); continue
-            try:
-                channel_id = match_re(jdat.get('channel_id') or '', match_yt_channel_id) or match_re(jdat.get('uploader_id') or '', match_yt_channel_id)
-            except Exception as e:
-                print(f'error parsing file {file}')
-                raise e
-            if not channel_id: print(f'error extracting channel id from video {video_id}, continuing anyway')
-            
-            # skip unlisted vids if set
-            if (not args.include_unlisted) and (jdat.get('availability', 'public') != 'public'):
-                print(f'skipping video {video_id}, unlisted video'); continue
-            
-            # titles
-            if args.exclude_titles: video_title = jdat.get('title') or jdat.get('fulltitle'); video_title = strip_vals(video_title)
-            else: video_title = None
-            channel_title = jdat.get('channel') or jdat.get('uploader')
-            if not channel_title: print(f'error extracting channel title from video {video_id}'); continue
-            
-            videos[video_id] = {'id': video_id, 'title': video_title, 'channel_id': 'UNSET_CHANNEL_ID', 'format_id': jdat.get('format_id'), 'filesize': jdat.get('filesize')}
-            if channel_id:
-                channel_id = 'UC'+channel_id
-                channels[channel_id] = {'id': channel_id, 'title': channel_title}
-                videos[video_id]['channel_id'] = channel_id
-        print(f'{len(videos)}/{len(files)}')
-    if isTarball: tar.close()
+    def merge(record):
+        video, channel = record
+        videos[video['id']] = video
+        if channel:
+            channels[channel['id']] = channel
+    
+    processed, printed = 0, 0
+    pool = ProcessPoolExecutor(args.jobs) if args.jobs > 1 else None
+    results = imap_bounded(pool, partial(parse_chunk, args), chunks, args.jobs * 4, not args.unordered) if pool else (parse_chunk(args, c) for c in chunks)
+    for count, parsed in results:
+        if cache:
+            with cache:
+                cache.executemany('INSERT OR REPLACE INTO files (source, path, size, mtime, record) VALUES (?, ?, ?, ?, ?)', [
+                    (source, file, size, mtime, json.dumps(record) if record else None) for file, size, mtime, record in parsed])
+            known.update({file: (size, mtime, record) for file, size, mtime, record in parsed})
+        else:
+            for file, size, mtime, record in parsed:
+                if record: merge(record)
+        processed += count
+        if processed - printed >= 100:
+            printed = processed
+            print(f'{processed} new/changed files parsed' if cache else f'{len(videos)} videos from {processed} files')
+    if pool: pool.shutdown()
+    
+    if cache:
+        for file in order:
+            record = known[file][2]
+            if record: merge(json.loads(record) if type(record) == str else record)
+        # drop files that are gone
+        gone = known.keys() - set(order)
+        with cache:
+            cache.executemany('DELETE FROM files WHERE source = ? AND path = ?', [(source, file) for file in gone])
+        cache.close()
+        print(f'{processed} files parsed, {len(order) - processed} from cache, {len(gone)} removed from cache')
     print(f'successfully processed {len(videos)} videos')
     return videos, channels
 
@@ -100,7 +281,7 @@ def process_download_archive(args):
             if not line: continue
             extractor, id = line.split()
             if extractor != 'youtube': print(f'skipping non-yt site {extractor}'); continue
-            if not match_yt_video_id.match(id): print(f'skipping invalid youtube video id {id}'); continue
+            if parse_video_id(id) != id: print(f'skipping invalid youtube video id {id}'); continue
             videos[id] = {'id': id}
     
     print(f'{len(videos)} videos processed')
@@ -112,7 +293,7 @@ def main(args):
     outfile = args.outfile or ('./channels.tsv' if args.channels else './videos.tsv') # default to videos/channels.tsv
     
     # compile infojsons tarfile/indir
-    if isdir(args.in_path) or splitext(args.in_path)[1] == '.tar':
+    if args.in_path == '-' or isdir(args.in_path) or is_tarball.match(args.in_path):
         videos, channels = process_info_jsons(args)
     elif splitext(args.in_path)[1] in ['.txt', '.db', '.archive']:
         print('\n\nWARNING! I would really prefer if you compiled data from infojsons instead 👉👈\nthe DB misses out on channel names/ids and video titles\n\n')
@@ -154,10 +335,14 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--channels', action='store_true', help='only dump list of channels (infojsons only)')
-    parser.add_argument('in_path', help='TAKES INDIR OF INFOJSONS, .tar OF INFOJSONS, OR DOWNLOAD ARCHIVE FILE')
+    parser.add_argument('in_path', help='TAKES INDIR OF INFOJSONS, .tar(.gz/.xz/.bz2/.zst) OF INFOJSONS (- TO READ ONE FROM STDIN), OR DOWNLOAD ARCHIVE FILE')
     parser.add_argument('-o', '--outfile', help='output videos/channels tsv', default=None)
     parser.add_argument('-u', '--include-unlisted', action='store_true', help='whether to collect unlisted/private/member-only videos (filters 2022+ infojsons only)')
     parser.add_argument('-t', '--exclude-titles', action='store_false', help='whether to collect video titles (infojsons only)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='read/parse infojsons with this many processes, 0 for one per core (default 1)')
+    parser.add_argument('--walk-threads', type=int, default=1, help='list this many directories at once when walking an indir (for network storage, default 1)')
+    parser.add_argument('--cache', default=None, help='sqlite index of parsed infojsons, reruns only parse new/changed files (e.g. ./compile_cache.sqlite)')
+    parser.add_argument('--unordered', action='store_true', help='with --jobs, merge results as they finish instead of in file order (faster, a video in several infojsons keeps whichever finished last)')
     if len(sys.argv)==1:
         parser.print_help(sys.stderr); exit()
     args = parser.parse_args()
@@ -165,5 +350,6 @@ if __name__ == '__main__':
     if not args.outfile:
         import sys; parser.print_help(sys.stderr)
         print('\noutfile is a required arg'); exit()
+    args.jobs = args.jobs or cpu_count()
     
     main(args)
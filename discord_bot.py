@@ -1,19 +1,20 @@
 import aiohttp
 import argparse
+import asyncio
 import discord
 from io import BytesIO
 import json
 from os.path import join, dirname, realpath
 import random
 import re
+from urllib.parse import quote
+from yt_ids import match_video_id as match_video, match_channel_id as match_channel
 
 localdir = dirname(realpath(__file__))
 
 if __name__ != '__main__':
     raise Exception('Not running as main!')
 
-match_video = re.compile(r'^(?:<)?(?:http(?:s)?://)?(?:www\.)?(?:youtu\.be/)?(?:youtube\.com/watch\?v=)?([A-Za-z0-9_-]{10}[AEIMQUYcgkosw048])(?:>)?$')
-match_channel = re.compile(r'^(?:<)?(?:http(?:s)?://)?(?:www\.)?(?:youtube\.com/channel/)?(?:UC)?([A-Za-z0-9_-]{21}[AQgw])(?:>)?$')
 
 parser = argparse.ArgumentParser()
 parser.add_argument('config', help='config file')
@@ -51,7 +52,7 @@ async def api_call(endpoint, session, config, value=''):
     status = None
     data = ''
     try:
-        async with session.get(config['dya_api_root']+endpoint+'/'+value, headers={'Authorization': config['dya_api_key']}) as response:
+        async with session.get(config['dya_api_root']+endpoint+('/'+value if value else ''), headers={'Authorization': config['dya_api_key']}) as response:
             return response.status, await response.text()
     except:
         return 'excepted', ''
@@ -85,6 +86,23 @@ def process_command(message):
         data = re.match(r'^channel(.*)', command_suffix)[1].strip().split(' ')
         if len(data) == 1: command.arguments['channel_id'] = data[0]
         else: command.type = 'command.invalidsyntax'
+    elif re.match(r'^search', command_suffix):
+        command.type = 'command.query_search'
+        command.arguments['query'] = re.match(r'^search(.*)', command_suffix)[1].strip()
+        if len(command.arguments['query']) < 3: command.type = 'command.invalidsyntax'
+    elif re.match(r'^wishlist', command_suffix):
+        command.type = 'command.user_wishlist'
+        data = [s for s in re.match(r'^wishlist(.*)', command_suffix)[1].strip().split(' ') if s]
+        if not data: command.arguments['action'] = 'list'
+        elif data[0] in ['add', 'remove'] and 1 < len(data) <= 51: command.arguments.update({'action': data[0], 'ids': data[1:]})
+        else: command.type = 'command.invalidsyntax'
+    elif re.match(r'^stats', command_suffix):
+        command.type = 'command.query_stats'
+    elif re.match(r'^leaderboard', command_suffix):
+        command.type = 'command.query_leaderboard'
+        data = re.match(r'^leaderboard(.*)', command_suffix)[1].strip()
+        if data in ['', 'videos', 'size']: command.arguments['by'] = 'bytes' if data == 'size' else 'videos'
+        else: command.type = 'command.invalidsyntax'
     elif re.match(r'^video', command_suffix):
         command.type = 'command.query_video'
         data = re.match(r'^video(.*)', command_suffix)[1].strip().split(' ')
@@ -187,6 +205,53 @@ async def query_video(command, config):
     
     return message, files
 
+async def query_search(command, config):
+    async with aiohttp.ClientSession() as session:
+        status, data = await api_call(f'search?q={quote(command.arguments["query"][:200])}&limit=10', session, config)
+    if status != 200:
+        return f'api error; `{status}`'
+    
+    data = json.loads(data)
+    if not data['results']:
+        return 'no matching videos or channels in db'
+    return 'Best matches:\n' + '\n'.join([
+        f'video `{r["id"]}` - `{(r["title"] or r["matched_title"])[:100]}`' if r['type'] == 'video' else
+        f'channel `UC{r["id"]}` - `{(r["title"] or r["matched_title"])[:100]}`'
+        for r in data['results']])
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1000: break
+        size /= 1000
+    else:
+        unit = 'PB'
+    return f'{size:,.1f} {unit}' if unit != 'B' else f'{size} B'
+
+async def query_stats(config):
+    async with aiohttp.ClientSession() as session:
+        status, data = await api_call('stats', session, config)
+    if status != 200:
+        return f'api error; `{status}`'
+    
+    data = json.loads(data)
+    message = f'`{data["videos"]:,}` videos (`{format_size(data["bytes"])}`) saved by `{data["contributors"]:,}` contributors'
+    if data['formats']:
+        message += '\nTop formats: ' + ', '.join([f'`{f["format_id"]}` ({f["videos"]:,})' for f in data['formats'][:5]])
+    return message
+
+async def query_leaderboard(command, config):
+    async with aiohttp.ClientSession() as session:
+        status, data = await api_call(f'leaderboard?by={command.arguments["by"]}&limit=10', session, config)
+    if status != 200:
+        return f'api error; `{status}`'
+    
+    data = json.loads(data)
+    if not data['leaderboard']:
+        return 'leaderboard is empty'
+    return f'Top contributors by {"size" if data["by"] == "bytes" else "videos"}:\n' + '\n'.join([
+        f'`{e["rank"]}.` {discord.utils.escape_markdown(e["contributor"]["name"])} - `{e["videos"]:,}` videos, `{format_size(e["bytes"])}`'
+        for e in data['leaderboard']])
+
 async def signup_user(command, config, user):
     contributor = {
         'name': user.name,
@@ -270,11 +335,119 @@ async def update_user_contact(command, config, user):
     
     return 'successfully updated contact info!'
 
+async def update_wishlist(command, config, user):
+    async with aiohttp.ClientSession() as session:
+        # pull user api key
+        status, data = await api_call('authorize', session, config, value = str(user.id))
+        if status == 403:
+            return f'you are not a registered user'
+        elif status != 200:
+            return f'api error; `{status}`'
+        headers = {'Authorization': json.loads(data)['key']}
+        
+        if command.arguments['action'] == 'list':
+            resp = await session.get(config['dya_api_root']+'wishlist', headers=headers)
+            if resp.status != 200:
+                return f'api error; `{resp.status}`'
+            data = await resp.json()
+            if not data['videos'] and not data['channels']:
+                return 'your wishlist is empty, add to it with `!tracker wishlist add {video/channel id}`'
+            return f'Your wishlist ({len(data["videos"])} videos, {len(data["channels"])} channels):\n' + ', '.join(
+                [f'`{v["id"]}`' for v in data['videos']] + [f'`UC{c["id"]}`' for c in data['channels']])[:1900]
+        
+        # sort ids into videos/channels
+        videos, channels = [], []
+        for i in command.arguments['ids']:
+            if match_video.match(i): videos.append(match_video.match(i)[1])
+            elif match_channel.match(i): channels.append(match_channel.match(i)[1])
+            else: return f'invalid video/channel id `{i}`'
+        
+        if command.arguments['action'] == 'remove':
+            for i in videos + channels:
+                resp = await session.delete(config['dya_api_root']+'wishlist/'+i, headers=headers)
+                if resp.status != 200:
+                    return f'api error; `{resp.status}`'
+            return 'removed from your wishlist'
+        
+        resp = await session.post(config['dya_api_root']+'wishlist', headers=headers, json={'videos': videos, 'channels': channels})
+        if resp.status == 403:
+            return (await resp.json())['error']
+        elif resp.status != 200:
+            return f'api error; `{resp.status}`'
+        data = await resp.json()
+    
+    message = f'added `{data["added"]}` to your wishlist, I will DM you when they are added to the tracker'
+    if data['held']:
+        message += '\nalready in the tracker (try `!tracker video {id}`): ' + ', '.join([f'`{v}`' for v in data['held']])
+    return message
+
+def format_notifications(notifications):
+    # one DM worth of lines per user, split to stay under discord's 2000 char message limit
+    lines = []
+    for n in notifications:
+        video = n['video']
+        title = (video['title'] or 'no title')[:100]
+        if n['kind'] == 'video':
+            lines.append(f'wishlisted video `{video["id"]}` - `{title}` was added to the tracker')
+        else:
+            lines.append(f'new video from wishlisted channel `UC{video["channel_id"]}` - `{(video["channel_title"] or "no title")[:100]}`: `{video["id"]}` - `{title}`')
+    messages = ['Wishlist matches (`!tracker video {id}` for who has them):']
+    for line in lines:
+        if len(messages[-1]) + len(line) + 1 > 1900:
+            messages.append('')
+        messages[-1] += '\n' + line
+    return messages
+
+async def send_notifications(client, config, batch=500):
+    async with aiohttp.ClientSession() as session:
+        while True:
+            status, data = await api_call(f'notifications?limit={batch}', session, config)
+            if status != 200:
+                print(f'fetching notifications failed; {status}'); return
+            data = json.loads(data)
+            
+            # group by user, every user gets their matches from this batch in one DM
+            users = {}
+            for n in data['notifications']:
+                users.setdefault(n['discord_id'], []).append(n)
+            
+            acked = []
+            for discord_id, notifications in users.items():
+                try:
+                    user = await client.fetch_user(int(discord_id))
+                    for message in format_notifications(notifications):
+                        await user.send(message)
+                except (discord.NotFound, discord.Forbidden):
+                    pass # account gone or DMs closed, retrying won't help
+                except discord.HTTPException as e:
+                    print(f'notifying {discord_id} failed; {e}'); continue # left unacked, retried next round
+                acked += [n['id'] for n in notifications]
+            
+            if acked:
+                resp = await session.post(config['dya_api_root']+'notifications/ack', headers={'Authorization': config['dya_api_key']}, json={'ids': acked})
+                if resp.status != 200:
+                    print(f'acking notifications failed; {resp.status}'); return
+            if data['count'] < batch:
+                return
+
 class scdb(discord.Client):
     global permissions
+    async def setup_hook(self):
+        self.notifier = asyncio.create_task(self.drain_notifications())
+    
     async def on_ready(self):
         print(f'connected to discord as {self.user}')
     
+    async def drain_notifications(self):
+        # DM wishlist matches from the api's outbox
+        await self.wait_until_ready()
+        while not self.is_closed():
+            try:
+                await send_notifications(self, config)
+            except Exception as e:
+                print(f'sending notifications failed; {e}')
+            await asyncio.sleep(config.get('notification_interval', 60))
+    
     async def on_message(self, message):
         if message.author.bot or (not message.guild):
             return
@@ -293,6 +466,18 @@ class scdb(discord.Client):
         elif command.type == 'command.query_video':
             response, files = await query_video(command, config)
             await message.reply(response, files=files)
+        elif command.type == 'command.query_search':
+            response = await query_search(command, config)
+            await message.reply(response)
+        elif command.type == 'command.user_wishlist':
+            response = await update_wishlist(command, config, message.author)
+            await message.reply(response)
+        elif command.type == 'command.query_stats':
+            response = await query_stats(config)
+            await message.reply(response)
+        elif command.type == 'command.query_leaderboard':
+            response = await query_leaderboard(command, config)
+            await message.reply(response)
         elif command.type == 'command.user_delete':
             response = await delete_user(config, message.author)
             await message.reply(response)
@@ -2,21 +2,14 @@ import argparse
 import json
 from os import makedirs
 from os.path import isfile, isdir, split
-import re
 import requests
 import sys
 import time
-
-match_yt_channel_id = re.compile(r'^(?:UC)?([A-Za-z0-9_-]{21}[AQgw])$')
-match_yt_video_id = re.compile(r'^([A-Za-z0-9_-]{10}[AEIMQUYcgkosw048])$')
+from yt_ids import parse_video_id, parse_channel_id
 
 def echo_msg(msg, fh):
     fh.write(f'{msg}\n'); print(msg)
 
-def match_re(string, regex):
-    res = regex.match(string)
-    if res: return res[1]
-
 def insert_maintained_channels(channels, args, logh, chunksize=500):
     channel_ids = list(channels.keys())
     for i in range(0, len(channel_ids), chunksize):
@@ -120,6 +113,9 @@ def main(args):
                     row = parse_line(line, fields)
                     if row.get('include') == 'n' or (not row.get('channel_id')) or row.get('channel_id') == 'UNSET_CHANNEL_ID':
                         echo_msg(f'skipping channel {row.get("channel_id")} ({row.get("title")})', logh); skipped_channels.update({row.get('channel_id')}); continue
+                    elif not parse_channel_id(row['channel_id']):
+                        # the api rejects a whole chunk over one bad id
+                        echo_msg(f'skipping invalid channel id {row["channel_id"]}', logh); skipped_channels.update({row['channel_id']}); continue
                     
                     channels[row['channel_id']] = {
                         't': cast_str_as_val(row.get('title')),
@@ -130,6 +126,8 @@ def main(args):
                     if row.get('include') == 'n' or (not row.get('video_id')) or ((not row.get('channel_id')) if not args.x else False):
                         echo_msg(f'skipping video {row.get("video_id")} ({row.get("title") or "no title"})', logh); continue
                         continue
+                    elif not parse_video_id(row['video_id']):
+                        echo_msg(f'skipping invalid video id {row["video_id"]}', logh); continue
                     
                     videos[row['video_id']] = {
                         't': cast_str_as_val(row.get('title')),
@@ -0,0 +1,12 @@
+/* composite indexes backing cursor pagination on /channelvideos, /my_videos and /my_channels */
+/* run against an existing db: psql -d dya_tracker -f migrations/001_keyset_pagination_indexes.sql */
+
+CREATE INDEX CONCURRENTLY contributions_c_contributor_id_idx ON contributions_c (contributor_id, channel_id);
+
+ALTER INDEX contributions_contributor_id_idx RENAME TO contributions_contributor_id_old_idx;
+CREATE INDEX CONCURRENTLY contributions_contributor_id_idx ON contributions_v (contributor_id, video_id);
+DROP INDEX contributions_contributor_id_old_idx;
+
+ALTER INDEX videos_channel_id_idx RENAME TO videos_channel_id_old_idx;
+CREATE INDEX CONCURRENTLY videos_channel_id_idx ON videos (channel_id, id);
+DROP INDEX videos_channel_id_old_idx;
@@ -0,0 +1,23 @@
+/* denormalized current title on videos/channels, replaces the ORDER BY time_added DESC LIMIT 1 subqueries */
+/* run against an existing db: psql -d dya_tracker -f migrations/002_current_titles.sql */
+
+ALTER TABLE videos ADD COLUMN title TEXT;
+ALTER TABLE channels ADD COLUMN title TEXT;
+GRANT UPDATE ON channels TO dya_tracker_api;
+
+ALTER INDEX titles_v_id_idx RENAME TO titles_v_id_old_idx;
+CREATE INDEX titles_v_id_idx ON titles_v (video_id, time_added);
+DROP INDEX titles_v_id_old_idx;
+
+ALTER INDEX titles_c_id_idx RENAME TO titles_c_id_old_idx;
+CREATE INDEX titles_c_id_idx ON titles_c (channel_id, time_added);
+DROP INDEX titles_c_id_old_idx;
+
+/* one-off backfill */
+UPDATE videos SET title = latest.title FROM (
+    SELECT DISTINCT ON (video_id) video_id, title FROM titles_v ORDER BY video_id, time_added DESC
+) latest WHERE videos.id = latest.video_id;
+
+UPDATE channels SET title = latest.title FROM (
+    SELECT DISTINCT ON (channel_id) channel_id, title FROM titles_c ORDER BY channel_id, time_added DESC
+) latest WHERE channels.id = latest.channel_id;
@@ -0,0 +1,20 @@
+/* durable queue for async submits (?async=true), drained by the api's ingest workers */
+/* run against an existing db: psql -d dya_tracker -f migrations/003_ingest_jobs.sql */
+
+CREATE TABLE ingest_jobs (
+	id BIGSERIAL PRIMARY KEY,
+	contributor_id INT NOT NULL,
+	kind TEXT NOT NULL, /* videos or channels */
+	status TEXT NOT NULL DEFAULT 'queued', /* queued, done or failed */
+	items JSONB, /* validated submit items, cleared once merged */
+	item_count INT NOT NULL,
+	errors JSONB, /* per-item validation errors */
+	error TEXT,
+	time_added INT NOT NULL,
+	time_finished INT
+);
+CREATE INDEX ingest_jobs_queued_idx ON ingest_jobs (id) WHERE status = 'queued';
+CREATE INDEX ingest_jobs_contributor_id_idx ON ingest_jobs (contributor_id);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON ingest_jobs TO dya_tracker_api;
+GRANT UPDATE ON ingest_jobs_id_seq TO dya_tracker_api;
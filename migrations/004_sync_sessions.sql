@@ -0,0 +1,22 @@
+/* staging tables for /sync_videos manifests */
+/* run against an existing db: psql -d dya_tracker -f migrations/004_sync_sessions.sql */
+
+CREATE TABLE sync_sessions (
+	id BIGSERIAL PRIMARY KEY,
+	contributor_id INT NOT NULL,
+	time_added INT NOT NULL
+);
+
+CREATE UNLOGGED TABLE sync_manifests (
+	session_id BIGINT NOT NULL,
+	vid CHAR(11) NOT NULL,
+	cid CHAR(22),
+	title TEXT,
+	ctitle TEXT,
+	fs TEXT,
+	size BIGINT
+);
+CREATE INDEX sync_manifests_session_id_idx ON sync_manifests (session_id, vid);
+
+GRANT SELECT, INSERT, DELETE ON sync_sessions, sync_manifests TO dya_tracker_api;
+GRANT UPDATE ON sync_sessions_id_seq TO dya_tracker_api;
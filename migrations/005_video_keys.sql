@@ -0,0 +1,12 @@
+/* packed 64-bit video ids (see yt_ids.py), lookups and joins on videos go through video_key instead of video_id */
+/* run against an existing db: psql -d dya_tracker -f migrations/005_video_keys.sql */
+/* adding the stored column rewrites videos (exclusive lock for the duration), run it in a quiet window */
+
+/* base64url video id -> the same signed 64-bit int as yt_ids.video_id_to_int */
+CREATE FUNCTION video_id_key(vid TEXT) RETURNS BIGINT IMMUTABLE PARALLEL SAFE LANGUAGE SQL AS $$
+	SELECT ('x' || encode(decode(translate(vid, '-_', '+/') || '=', 'base64'), 'hex'))::bit(64)::bigint
+$$;
+
+ALTER TABLE videos ADD COLUMN video_key BIGINT GENERATED ALWAYS AS (video_id_key(video_id)) STORED;
+CREATE UNIQUE INDEX CONCURRENTLY videos_video_key_idx ON videos (video_key);
+ANALYZE videos;
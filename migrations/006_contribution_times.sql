@@ -0,0 +1,7 @@
+/* insert time on contributions_v, lets build_video_filter.py update the published filter incrementally */
+/* run against an existing db: psql -d dya_tracker -f migrations/006_contribution_times.sql */
+
+/* existing rows stay null (no table rewrite), only new rows get the default */
+ALTER TABLE contributions_v ADD COLUMN time_added INT;
+ALTER TABLE contributions_v ALTER COLUMN time_added SET DEFAULT CAST(extract(epoch FROM now()) AS INT);
+CREATE INDEX CONCURRENTLY contributions_v_time_added_idx ON contributions_v (time_added);
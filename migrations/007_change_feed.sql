@@ -0,0 +1,105 @@
+/* change feed for mirrors (GET /changes), triggers log every insert/delete on the contribution, title and contributor tables */
+/* run against an existing db: psql -d dya_tracker -f migrations/007_change_feed.sql */
+/* rows written before this migration aren't in the feed, mirrors start from a dump taken after it */
+
+CREATE TABLE changes (
+	id BIGSERIAL PRIMARY KEY,
+	seq BIGINT UNIQUE, /* commit ordered position in the feed, assigned by the api when the feed is read */
+	time_added INT NOT NULL,
+	tbl TEXT NOT NULL,
+	op CHAR(1) NOT NULL, /* i(nsert), u(pdate) or d(elete) */
+	data JSONB NOT NULL /* row with natural ids (video/channel ids, format strings) instead of serial ids */
+);
+CREATE INDEX changes_pending_idx ON changes (id) WHERE seq IS NULL;
+CREATE INDEX changes_time_added_idx ON changes (time_added);
+CREATE SEQUENCE changes_seq;
+
+/* statement level triggers, one insert into changes per statement no matter how many rows it touched */
+CREATE FUNCTION log_video_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO changes (time_added, tbl, op, data)
+	SELECT CAST(extract(epoch FROM now()) AS INT), 'videos', 'i', jsonb_build_object(
+		'video_id', n.video_id, 'channel_id', channels.channel_id)
+	FROM new_rows n LEFT JOIN channels ON channels.id = n.channel_id ORDER BY n.id;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_contributions_v_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_v', 'i', jsonb_build_object(
+			'video_id', videos.video_id, 'contributor_id', n.contributor_id, 'format', formats.format_string, 'filesize', n.filesize)
+		FROM new_rows n JOIN videos ON videos.id = n.video_id LEFT JOIN formats ON formats.id = n.format_id ORDER BY n.video_id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_v', 'd', jsonb_build_object(
+			'video_id', videos.video_id, 'contributor_id', o.contributor_id)
+		FROM old_rows o JOIN videos ON videos.id = o.video_id ORDER BY o.video_id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_contributions_c_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_c', 'i', jsonb_build_object(
+			'channel_id', channels.channel_id, 'contributor_id', n.contributor_id, 'note', n.note)
+		FROM new_rows n JOIN channels ON channels.id = n.channel_id ORDER BY n.channel_id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_c', 'd', jsonb_build_object(
+			'channel_id', channels.channel_id, 'contributor_id', o.contributor_id)
+		FROM old_rows o JOIN channels ON channels.id = o.channel_id ORDER BY o.channel_id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_titles_v_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO changes (time_added, tbl, op, data)
+	SELECT CAST(extract(epoch FROM now()) AS INT), 'titles_v', 'i', jsonb_build_object(
+		'video_id', videos.video_id, 'contributor_id', n.contributor_id, 'title', n.title, 'time_added', n.time_added)
+	FROM new_rows n JOIN videos ON videos.id = n.video_id ORDER BY n.video_id;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_titles_c_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO changes (time_added, tbl, op, data)
+	SELECT CAST(extract(epoch FROM now()) AS INT), 'titles_c', 'i', jsonb_build_object(
+		'channel_id', channels.channel_id, 'contributor_id', n.contributor_id, 'title', n.title, 'time_added', n.time_added)
+	FROM new_rows n JOIN channels ON channels.id = n.channel_id ORDER BY n.channel_id;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_contributors_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributors', 'd', jsonb_build_object('id', o.id)
+		FROM old_rows o ORDER BY o.id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributors', lower(left(TG_OP, 1)), jsonb_build_object(
+			'id', n.id, 'name', n.name, 'discord_id', n.discord_id, 'alternative_contact_info', n.alternative_contact_info,
+			'allow_channel_queries', n.allow_channel_queries, 'allow_stats_queries', n.allow_stats_queries)
+		FROM new_rows n ORDER BY n.id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER videos_insert_changes AFTER INSERT ON videos REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_video_changes();
+CREATE TRIGGER contributions_v_insert_changes AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_v_changes();
+CREATE TRIGGER contributions_v_delete_changes AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_v_changes();
+CREATE TRIGGER contributions_c_insert_changes AFTER INSERT ON contributions_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_c_changes();
+CREATE TRIGGER contributions_c_delete_changes AFTER DELETE ON contributions_c REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_c_changes();
+CREATE TRIGGER titles_v_insert_changes AFTER INSERT ON titles_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_titles_v_changes();
+CREATE TRIGGER titles_c_insert_changes AFTER INSERT ON titles_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_titles_c_changes();
+CREATE TRIGGER contributors_insert_changes AFTER INSERT ON contributors REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributors_changes();
+CREATE TRIGGER contributors_update_changes AFTER UPDATE ON contributors REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributors_changes();
+CREATE TRIGGER contributors_delete_changes AFTER DELETE ON contributors REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributors_changes();
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON changes TO dya_tracker_api;
+GRANT UPDATE ON changes_id_seq, changes_seq TO dya_tracker_api;
@@ -0,0 +1,135 @@
+/* trigger maintained totals for /stats, /my_stats and /leaderboard */
+/* run against an existing db: psql -d dya_tracker -f migrations/008_stats.sql */
+/* contribution writes are blocked while the totals are backfilled so none are counted twice or missed */
+
+BEGIN;
+LOCK TABLE contributions_v, contributions_c, contributors IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE stats_contributors (
+	contributor_id INT PRIMARY KEY,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	channels BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX stats_contributors_videos_idx ON stats_contributors (videos DESC, contributor_id);
+CREATE INDEX stats_contributors_bytes_idx ON stats_contributors (bytes DESC, contributor_id);
+
+CREATE TABLE stats_global (
+	shard SMALLINT PRIMARY KEY,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE stats_channels (
+	channel_id INT NOT NULL,
+	shard SMALLINT NOT NULL,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	PRIMARY KEY (channel_id, shard)
+);
+
+CREATE TABLE stats_formats (
+	format_id INT NOT NULL,
+	shard SMALLINT NOT NULL,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	PRIMARY KEY (format_id, shard)
+);
+
+/* add (direction 1) or remove (direction -1) a set of contributions_v rows from the totals, every upsert goes in key order */
+/* totals_only skips the per contributor rows and the allow_stats_queries check (used when that flag is toggled) */
+CREATE FUNCTION apply_video_stats(direction INT, changed contributions_v[], totals_only BOOL DEFAULT FALSE) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+	IF NOT totals_only THEN
+		INSERT INTO stats_contributors (contributor_id, videos, bytes)
+		SELECT c.contributor_id, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+		GROUP BY 1 ORDER BY 1
+		ON CONFLICT (contributor_id) DO UPDATE SET videos = stats_contributors.videos + EXCLUDED.videos, bytes = stats_contributors.bytes + EXCLUDED.bytes;
+	END IF;
+	
+	INSERT INTO stats_global (shard, videos, bytes)
+	SELECT c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id WHERE totals_only OR contributors.allow_stats_queries
+	GROUP BY 1 ORDER BY 1
+	ON CONFLICT (shard) DO UPDATE SET videos = stats_global.videos + EXCLUDED.videos, bytes = stats_global.bytes + EXCLUDED.bytes;
+	
+	INSERT INTO stats_channels (channel_id, shard, videos, bytes)
+	SELECT videos.channel_id, c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id JOIN videos ON videos.id = c.video_id
+	WHERE (totals_only OR contributors.allow_stats_queries) AND videos.channel_id IS NOT NULL
+	GROUP BY 1, 2 ORDER BY 1, 2
+	ON CONFLICT (channel_id, shard) DO UPDATE SET videos = stats_channels.videos + EXCLUDED.videos, bytes = stats_channels.bytes + EXCLUDED.bytes;
+	
+	INSERT INTO stats_formats (format_id, shard, videos, bytes)
+	SELECT c.format_id, c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id
+	WHERE (totals_only OR contributors.allow_stats_queries) AND c.format_id IS NOT NULL
+	GROUP BY 1, 2 ORDER BY 1, 2
+	ON CONFLICT (format_id, shard) DO UPDATE SET videos = stats_formats.videos + EXCLUDED.videos, bytes = stats_formats.bytes + EXCLUDED.bytes;
+END $$;
+
+CREATE FUNCTION update_contributions_v_stats() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM apply_video_stats(1, ARRAY(SELECT CAST(n AS contributions_v) FROM new_rows n));
+	ELSE
+		PERFORM apply_video_stats(-1, ARRAY(SELECT CAST(o AS contributions_v) FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION update_contributions_c_stats() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO stats_contributors (contributor_id, channels) SELECT n.contributor_id, count(*) FROM new_rows n
+		GROUP BY 1 ORDER BY 1 ON CONFLICT (contributor_id) DO UPDATE SET channels = stats_contributors.channels + EXCLUDED.channels;
+	ELSE
+		INSERT INTO stats_contributors (contributor_id, channels) SELECT o.contributor_id, -count(*) FROM old_rows o
+		GROUP BY 1 ORDER BY 1 ON CONFLICT (contributor_id) DO UPDATE SET channels = stats_contributors.channels + EXCLUDED.channels;
+	END IF;
+	RETURN NULL;
+END $$;
+
+/* row level, allow_stats_queries only changes by hand; moves that contributor's contributions in or out of the totals */
+CREATE FUNCTION update_contributor_stats() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		DELETE FROM stats_contributors WHERE contributor_id = OLD.id;
+	ELSIF NEW.allow_stats_queries IS DISTINCT FROM OLD.allow_stats_queries THEN
+		PERFORM apply_video_stats(CASE WHEN NEW.allow_stats_queries THEN 1 ELSE -1 END,
+			ARRAY(SELECT c FROM contributions_v c WHERE c.contributor_id = NEW.id), TRUE);
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_stats AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_v_stats();
+CREATE TRIGGER contributions_v_delete_stats AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_v_stats();
+CREATE TRIGGER contributions_c_insert_stats AFTER INSERT ON contributions_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_c_stats();
+CREATE TRIGGER contributions_c_delete_stats AFTER DELETE ON contributions_c REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_c_stats();
+CREATE TRIGGER contributors_stats AFTER UPDATE OF allow_stats_queries OR DELETE ON contributors FOR EACH ROW EXECUTE FUNCTION update_contributor_stats();
+
+INSERT INTO stats_contributors (contributor_id, videos, bytes, channels)
+SELECT contributors.id,
+	(SELECT count(*) FROM contributions_v WHERE contributions_v.contributor_id = contributors.id),
+	(SELECT coalesce(sum(filesize), 0) FROM contributions_v WHERE contributions_v.contributor_id = contributors.id),
+	(SELECT count(*) FROM contributions_c WHERE contributions_c.contributor_id = contributors.id)
+FROM contributors;
+
+INSERT INTO stats_global (shard, videos, bytes)
+SELECT c.contributor_id % 16, count(*), coalesce(sum(c.filesize), 0) FROM contributions_v c
+JOIN contributors ON contributors.id = c.contributor_id WHERE contributors.allow_stats_queries GROUP BY 1;
+
+INSERT INTO stats_channels (channel_id, shard, videos, bytes)
+SELECT videos.channel_id, c.contributor_id % 16, count(*), coalesce(sum(c.filesize), 0) FROM contributions_v c
+JOIN contributors ON contributors.id = c.contributor_id JOIN videos ON videos.id = c.video_id
+WHERE contributors.allow_stats_queries AND videos.channel_id IS NOT NULL GROUP BY 1, 2;
+
+INSERT INTO stats_formats (format_id, shard, videos, bytes)
+SELECT c.format_id, c.contributor_id % 16, count(*), coalesce(sum(c.filesize), 0) FROM contributions_v c
+JOIN contributors ON contributors.id = c.contributor_id
+WHERE contributors.allow_stats_queries AND c.format_id IS NOT NULL GROUP BY 1, 2;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON stats_contributors, stats_global, stats_channels, stats_formats TO dya_tracker_api;
+COMMIT;
+
+ANALYZE stats_contributors, stats_global, stats_channels, stats_formats;
@@ -0,0 +1,61 @@
+/* replication counts for /at_risk_videos and /at_risk_channels */
+/* run against an existing db: psql -d dya_tracker -f migrations/009_video_holders.sql */
+/* contribution writes are blocked while the counts are backfilled */
+
+BEGIN;
+LOCK TABLE contributions_v IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE video_holders (
+	video_id INT PRIMARY KEY,
+	channel_id INT,
+	holders INT NOT NULL DEFAULT 0
+);
+CREATE INDEX video_holders_channel_id_idx ON video_holders (channel_id, holders, video_id);
+
+CREATE TABLE channel_single_copies (
+	channel_id INT PRIMARY KEY,
+	videos INT NOT NULL DEFAULT 0 /* videos of the channel held by exactly one contributor */
+);
+CREATE INDEX channel_single_copies_videos_idx ON channel_single_copies (videos, channel_id);
+
+/* add (direction 1) or remove (direction -1) holders, rows are upserted in video_id order so concurrent submits can't deadlock */
+CREATE FUNCTION apply_video_holders(direction INT, video_ids INT[]) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+	WITH delta AS (
+		SELECT videos.id, videos.channel_id, direction * count(*) AS n FROM unnest(video_ids) d(video_id)
+		JOIN videos ON videos.id = d.video_id GROUP BY videos.id
+	), changed AS (
+		INSERT INTO video_holders (video_id, channel_id, holders) SELECT id, channel_id, n FROM delta ORDER BY id
+		ON CONFLICT (video_id) DO UPDATE SET holders = video_holders.holders + EXCLUDED.holders
+		RETURNING video_id, channel_id, holders
+	)
+	INSERT INTO channel_single_copies (channel_id, videos)
+	SELECT changed.channel_id, sum(CAST(changed.holders = 1 AS INT) - CAST(changed.holders - delta.n = 1 AS INT)) FROM changed
+	JOIN delta ON delta.id = changed.video_id WHERE changed.channel_id IS NOT NULL
+	GROUP BY 1 HAVING sum(CAST(changed.holders = 1 AS INT) - CAST(changed.holders - delta.n = 1 AS INT)) <> 0 ORDER BY 1
+	ON CONFLICT (channel_id) DO UPDATE SET videos = channel_single_copies.videos + EXCLUDED.videos;
+END $$;
+
+CREATE FUNCTION update_video_holders() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM apply_video_holders(1, ARRAY(SELECT n.video_id FROM new_rows n));
+	ELSE
+		PERFORM apply_video_holders(-1, ARRAY(SELECT o.video_id FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_holders AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_video_holders();
+CREATE TRIGGER contributions_v_delete_holders AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_video_holders();
+
+INSERT INTO video_holders (video_id, channel_id, holders)
+SELECT videos.id, videos.channel_id, count(*) FROM contributions_v JOIN videos ON videos.id = contributions_v.video_id GROUP BY videos.id;
+
+INSERT INTO channel_single_copies (channel_id, videos)
+SELECT channel_id, count(*) FROM video_holders WHERE holders = 1 AND channel_id IS NOT NULL GROUP BY 1;
+
+GRANT SELECT, INSERT, UPDATE ON video_holders, channel_single_copies TO dya_tracker_api;
+COMMIT;
+
+ANALYZE video_holders, channel_single_copies;
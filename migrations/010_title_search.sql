@@ -0,0 +1,12 @@
+/* trigram indexes for GET /search, titles_v/titles_c are insert only so the submit paths keep them current */
+/* run against an existing db: psql -d dya_tracker -f migrations/010_title_search.sql (needs the postgresql contrib package) */
+/* CONCURRENTLY can't run inside a transaction, run this file without -1 */
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+/* gist (not gin) so `ORDER BY q <<-> title LIMIT n` is a nearest neighbour index scan instead of ranking every match */
+CREATE INDEX CONCURRENTLY titles_v_title_trgm_idx ON titles_v USING gist (title gist_trgm_ops(siglen=64));
+CREATE INDEX CONCURRENTLY titles_c_title_trgm_idx ON titles_c USING gist (title gist_trgm_ops(siglen=64));
+
+/* the default word similarity cutoff (0.6) drops most misspelled queries */
+ALTER ROLE dya_tracker_api SET pg_trgm.word_similarity_threshold = 0.4;
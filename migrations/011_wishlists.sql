@@ -0,0 +1,61 @@
+/* video/channel wishlists and the notifications outbox the discord bot drains */
+/* run against an existing db: psql -d dya_tracker -f migrations/011_wishlists.sql */
+
+CREATE TABLE wishlist_v (
+	contributor_id INT NOT NULL,
+	video_key BIGINT NOT NULL, /* video_id_key() of the wished video, it doesn't have to be in videos yet */
+	video_id CHAR(11) NOT NULL,
+	time_added INT NOT NULL,
+	UNIQUE (video_key, contributor_id)
+);
+CREATE INDEX wishlist_v_contributor_id_idx ON wishlist_v (contributor_id);
+
+CREATE TABLE wishlist_c (
+	contributor_id INT NOT NULL,
+	channel_id CHAR(22) NOT NULL,
+	time_added INT NOT NULL,
+	UNIQUE (channel_id, contributor_id)
+);
+CREATE INDEX wishlist_c_contributor_id_idx ON wishlist_c (contributor_id);
+
+CREATE TABLE notifications (
+	id BIGSERIAL PRIMARY KEY,
+	contributor_id INT NOT NULL,
+	kind TEXT NOT NULL, /* video (a wished video was contributed) or channel (a new video of a wished channel) */
+	video_id INT NOT NULL, /* id of row in videos table */
+	time_added INT NOT NULL
+);
+CREATE INDEX notifications_contributor_id_idx ON notifications (contributor_id);
+
+/* a wished video is taken off the wishlist once anyone contributes it, only contributors with a discord id get notified (the bot DMs them) */
+CREATE FUNCTION match_video_wishlist() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	WITH matched AS (
+		DELETE FROM wishlist_v USING new_rows n JOIN videos ON videos.id = n.video_id
+		WHERE wishlist_v.video_key = videos.video_key
+		RETURNING wishlist_v.contributor_id, videos.id AS video_id, n.contributor_id AS holder_id
+	)
+	INSERT INTO notifications (contributor_id, kind, video_id, time_added)
+	SELECT DISTINCT matched.contributor_id, 'video', matched.video_id, CAST(extract(epoch FROM now()) AS INT) FROM matched
+	JOIN contributors ON contributors.id = matched.contributor_id
+	WHERE matched.holder_id <> matched.contributor_id AND contributors.discord_id IS NOT NULL;
+	RETURN NULL;
+END $$;
+
+/* wished channels stay on the wishlist, every video of theirs new to the tracker is a match */
+CREATE FUNCTION match_channel_wishlist() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO notifications (contributor_id, kind, video_id, time_added)
+	SELECT wishlist_c.contributor_id, 'channel', n.id, CAST(extract(epoch FROM now()) AS INT) FROM new_rows n
+	JOIN channels ON channels.id = n.channel_id
+	JOIN wishlist_c ON wishlist_c.channel_id = channels.channel_id
+	JOIN contributors ON contributors.id = wishlist_c.contributor_id
+	WHERE contributors.discord_id IS NOT NULL;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_wishlist AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION match_video_wishlist();
+CREATE TRIGGER videos_insert_wishlist AFTER INSERT ON videos REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION match_channel_wishlist();
+
+GRANT SELECT, INSERT, DELETE ON wishlist_v, wishlist_c, notifications TO dya_tracker_api;
+GRANT UPDATE ON notifications_id_seq TO dya_tracker_api;
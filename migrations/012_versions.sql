@@ -0,0 +1,73 @@
+/* per video/channel versions for ETags and If-None-Match on /video, /channelvideos and /channelmaintainers */
+/* run against an existing db: psql -d dya_tracker -f migrations/012_versions.sql */
+/* entities without a version row yet report version 0, the first change after this migration gives them one */
+
+CREATE SEQUENCE versions_seq;
+
+CREATE TABLE video_versions (
+	video_id INT PRIMARY KEY,
+	version BIGINT NOT NULL
+);
+
+CREATE TABLE channel_versions (
+	channel_id INT PRIMARY KEY,
+	version BIGINT NOT NULL
+);
+
+/* contributor names/contact info/flags show up in every payload, any contributor change moves this one epoch instead */
+CREATE TABLE contributors_epoch (
+	epoch BIGINT NOT NULL
+);
+INSERT INTO contributors_epoch (epoch) VALUES (0);
+
+/* bump the given videos, their channels and the given channels, in id order so concurrent submits can't deadlock */
+CREATE FUNCTION bump_versions(video_ids INT[], channel_ids INT[]) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO video_versions (video_id, version)
+	SELECT v.id, nextval('versions_seq') FROM (SELECT DISTINCT unnest(video_ids) AS id ORDER BY 1) v
+	ON CONFLICT (video_id) DO UPDATE SET version = EXCLUDED.version;
+	
+	INSERT INTO channel_versions (channel_id, version)
+	SELECT c.id, nextval('versions_seq') FROM (
+		SELECT channel_id AS id FROM videos WHERE id = ANY(video_ids) AND channel_id IS NOT NULL
+		UNION SELECT unnest(channel_ids) ORDER BY 1
+	) c
+	ON CONFLICT (channel_id) DO UPDATE SET version = EXCLUDED.version;
+END $$;
+
+CREATE FUNCTION bump_video_versions() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM bump_versions(ARRAY(SELECT n.video_id FROM new_rows n), '{}');
+	ELSE
+		PERFORM bump_versions(ARRAY(SELECT o.video_id FROM old_rows o), '{}');
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION bump_channel_versions() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM bump_versions('{}', ARRAY(SELECT n.channel_id FROM new_rows n));
+	ELSE
+		PERFORM bump_versions('{}', ARRAY(SELECT o.channel_id FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION bump_contributors_epoch() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	UPDATE contributors_epoch SET epoch = nextval('versions_seq');
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_versions AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_video_versions();
+CREATE TRIGGER contributions_v_delete_versions AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_video_versions();
+CREATE TRIGGER titles_v_insert_versions AFTER INSERT ON titles_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_video_versions();
+CREATE TRIGGER contributions_c_insert_versions AFTER INSERT ON contributions_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_channel_versions();
+CREATE TRIGGER contributions_c_delete_versions AFTER DELETE ON contributions_c REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_channel_versions();
+CREATE TRIGGER titles_c_insert_versions AFTER INSERT ON titles_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_channel_versions();
+CREATE TRIGGER contributors_update_versions AFTER UPDATE OR DELETE ON contributors FOR EACH STATEMENT EXECUTE FUNCTION bump_contributors_epoch();
+
+GRANT SELECT, INSERT, UPDATE ON video_versions, channel_versions, contributors_epoch TO dya_tracker_api;
+GRANT UPDATE ON versions_seq TO dya_tracker_api;
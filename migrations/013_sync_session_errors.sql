@@ -0,0 +1,8 @@
+/* /sync_videos sessions remember invalid/excluded lines of every chunk, a session with invalid lines isn't applied */
+/* run against an existing db: psql -d dya_tracker -f migrations/013_sync_session_errors.sql */
+
+ALTER TABLE sync_sessions ADD COLUMN invalid INT NOT NULL DEFAULT 0;
+ALTER TABLE sync_sessions ADD COLUMN excluded INT NOT NULL DEFAULT 0;
+ALTER TABLE sync_sessions ADD COLUMN errors JSONB NOT NULL DEFAULT '[]'; /* first 100 validation errors */
+
+GRANT UPDATE ON sync_sessions TO dya_tracker_api;
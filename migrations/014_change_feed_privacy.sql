@@ -0,0 +1,27 @@
+/* the change feed links every contribution to its contributor (channel listings too), so /changes gets its own permission */
+/* run against an existing db: psql -d dya_tracker -f migrations/014_change_feed_privacy.sql */
+/* keys aren't granted it by default, give it to trusted mirrors: UPDATE api_keys SET allow_changes_query = TRUE WHERE api_key = '...' */
+
+ALTER TABLE api_keys ADD COLUMN allow_changes_query BOOL DEFAULT FALSE;
+
+/* discord ids of contributors with alternative contact info stay hidden, same as the rest of the api */
+CREATE OR REPLACE FUNCTION log_contributors_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributors', 'd', jsonb_build_object('id', o.id)
+		FROM old_rows o ORDER BY o.id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributors', lower(left(TG_OP, 1)), jsonb_build_object(
+			'id', n.id, 'name', n.name, 'discord_id', CASE WHEN n.alternative_contact_info IS NULL THEN n.discord_id END,
+			'alternative_contact_info', n.alternative_contact_info,
+			'allow_channel_queries', n.allow_channel_queries, 'allow_stats_queries', n.allow_stats_queries)
+		FROM new_rows n ORDER BY n.id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+/* scrub the ones already in the feed */
+UPDATE changes SET data = jsonb_set(data, '{discord_id}', 'null')
+WHERE tbl = 'contributors' AND data ? 'discord_id' AND data->>'alternative_contact_info' IS NOT NULL;
@@ -0,0 +1,5 @@
+/* every videos lookup/join goes through video_key now (005), the unique index on the CHAR(11) video_id is dead weight */
+/* run against an existing db: psql -d dya_tracker -f migrations/015_drop_video_id_unique.sql */
+/* video_key is a lossless packing of a valid video_id (see yt_ids.py), so its unique index still keeps video ids unique */
+
+ALTER TABLE videos DROP CONSTRAINT videos_video_id_key;
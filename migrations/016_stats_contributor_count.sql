@@ -0,0 +1,64 @@
+/* stats_global keeps the contributor count GET /stats shows, instead of counting stats_contributors rows on every miss */
+/* run against an existing db: psql -d dya_tracker -f migrations/016_stats_contributor_count.sql */
+/* contribution writes are blocked while the count is backfilled so no contributor is counted twice or missed */
+
+BEGIN;
+LOCK TABLE contributions_v, contributors IN SHARE ROW EXCLUSIVE MODE;
+
+ALTER TABLE stats_global ADD COLUMN contributors BIGINT NOT NULL DEFAULT 0; /* contributors with at least one video */
+
+/* add (direction 1) or remove (direction -1) a set of contributions_v rows from the totals, every upsert goes in key order */
+/* totals_only skips the per contributor rows and the allow_stats_queries check (used when that flag is toggled) */
+CREATE OR REPLACE FUNCTION apply_video_stats(direction INT, changed contributions_v[], totals_only BOOL DEFAULT FALSE) RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+	crossed INT[]; /* contributors moving in (id) or out (-id) of stats_global.contributors */
+BEGIN
+	IF NOT totals_only THEN
+		/* a contributor is counted while their video count is above 0 */
+		WITH delta AS (
+			SELECT c.contributor_id, direction * count(*) AS videos, direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) AS bytes
+			FROM unnest(changed) c GROUP BY 1
+		), upserted AS (
+			INSERT INTO stats_contributors (contributor_id, videos, bytes) SELECT * FROM delta ORDER BY 1
+			ON CONFLICT (contributor_id) DO UPDATE SET videos = stats_contributors.videos + EXCLUDED.videos, bytes = stats_contributors.bytes + EXCLUDED.bytes
+			RETURNING contributor_id, videos
+		)
+		SELECT ARRAY(SELECT CASE WHEN u.videos > 0 THEN u.contributor_id ELSE -u.contributor_id END FROM upserted u
+			JOIN delta ON delta.contributor_id = u.contributor_id WHERE (u.videos > 0) <> (u.videos - delta.videos > 0)) INTO crossed;
+	ELSE
+		/* the flag was toggled, changed holds all of one contributor's videos */
+		crossed := ARRAY(SELECT DISTINCT direction * c.contributor_id FROM unnest(changed) c);
+	END IF;
+	
+	INSERT INTO stats_global (shard, videos, bytes, contributors)
+	SELECT t.shard, sum(t.videos), sum(t.bytes), sum(t.contributors) FROM (
+		SELECT c.contributor_id % 16 AS shard, direction * count(*) AS videos, direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) AS bytes, 0 AS contributors
+		FROM unnest(changed) c JOIN contributors ON contributors.id = c.contributor_id WHERE totals_only OR contributors.allow_stats_queries GROUP BY 1
+		UNION ALL
+		SELECT abs(x) % 16, 0, 0, sign(x) FROM unnest(crossed) x
+		JOIN contributors ON contributors.id = abs(x) WHERE totals_only OR contributors.allow_stats_queries
+	) t GROUP BY 1 ORDER BY 1
+	ON CONFLICT (shard) DO UPDATE SET videos = stats_global.videos + EXCLUDED.videos, bytes = stats_global.bytes + EXCLUDED.bytes,
+		contributors = stats_global.contributors + EXCLUDED.contributors;
+	
+	INSERT INTO stats_channels (channel_id, shard, videos, bytes)
+	SELECT videos.channel_id, c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id JOIN videos ON videos.id = c.video_id
+	WHERE (totals_only OR contributors.allow_stats_queries) AND videos.channel_id IS NOT NULL
+	GROUP BY 1, 2 ORDER BY 1, 2
+	ON CONFLICT (channel_id, shard) DO UPDATE SET videos = stats_channels.videos + EXCLUDED.videos, bytes = stats_channels.bytes + EXCLUDED.bytes;
+	
+	INSERT INTO stats_formats (format_id, shard, videos, bytes)
+	SELECT c.format_id, c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id
+	WHERE (totals_only OR contributors.allow_stats_queries) AND c.format_id IS NOT NULL
+	GROUP BY 1, 2 ORDER BY 1, 2
+	ON CONFLICT (format_id, shard) DO UPDATE SET videos = stats_formats.videos + EXCLUDED.videos, bytes = stats_formats.bytes + EXCLUDED.bytes;
+END $$;
+
+INSERT INTO stats_global (shard, contributors)
+SELECT stats_contributors.contributor_id % 16, count(*) FROM stats_contributors
+JOIN contributors ON contributors.id = stats_contributors.contributor_id
+WHERE stats_contributors.videos > 0 AND contributors.allow_stats_queries GROUP BY 1
+ON CONFLICT (shard) DO UPDATE SET contributors = EXCLUDED.contributors;
+COMMIT;
@@ -0,0 +1,17 @@
+/* /sync_videos stages channel lines with the session instead of merging their titles straight away, */
+/* and staged rows go with their session (ON DELETE CASCADE) so cleanup is a single DELETE */
+/* run against an existing db: psql -d dya_tracker -f migrations/017_sync_staging_cascade.sql */
+
+BEGIN;
+DELETE FROM sync_manifests WHERE NOT EXISTS (SELECT 1 FROM sync_sessions WHERE sync_sessions.id = sync_manifests.session_id);
+ALTER TABLE sync_manifests ADD FOREIGN KEY (session_id) REFERENCES sync_sessions ON DELETE CASCADE;
+
+CREATE UNLOGGED TABLE sync_manifest_channels (
+	session_id BIGINT NOT NULL REFERENCES sync_sessions ON DELETE CASCADE,
+	cid CHAR(22) NOT NULL,
+	ctitle TEXT
+);
+CREATE INDEX sync_manifest_channels_session_id_idx ON sync_manifest_channels (session_id);
+
+GRANT SELECT, INSERT, DELETE ON sync_manifest_channels TO dya_tracker_api;
+COMMIT;
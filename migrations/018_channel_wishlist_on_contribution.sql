@@ -0,0 +1,38 @@
+/* channel wishlist matches are made when a channel-queryable contributor other than the wisher first holds the video, */
+/* instead of on every new video and filtered (and deleted) later by GET /notifications, which now only reads */
+/* run against an existing db: psql -d dya_tracker -f migrations/018_channel_wishlist_on_contribution.sql */
+
+BEGIN;
+DROP TRIGGER videos_insert_wishlist ON videos;
+DROP FUNCTION match_channel_wishlist();
+
+/* wished channels stay on the wishlist, a video of theirs matches once someone other than the wisher who shows up in channel */
+/* queries (the /channelvideos rule) holds it, so the wisher's own uploads and opted-out holders never reach the outbox */
+CREATE FUNCTION match_channel_wishlist() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO notifications (contributor_id, kind, video_id, time_added)
+	SELECT DISTINCT wishlist_c.contributor_id, 'channel', n.video_id, CAST(extract(epoch FROM now()) AS INT) FROM new_rows n
+	JOIN contributors holder ON holder.id = n.contributor_id
+	JOIN videos ON videos.id = n.video_id
+	JOIN channels ON channels.id = videos.channel_id
+	JOIN wishlist_c ON wishlist_c.channel_id = channels.channel_id
+	JOIN contributors ON contributors.id = wishlist_c.contributor_id
+	WHERE holder.allow_channel_queries IS TRUE AND n.contributor_id <> wishlist_c.contributor_id AND contributors.discord_id IS NOT NULL
+	/* only the first such holder, later copies of a video the wisher could already find don't match again */
+	AND NOT EXISTS (
+		SELECT 1 FROM contributions_v c JOIN contributors h ON h.id = c.contributor_id
+		WHERE c.video_id = n.video_id AND c.contributor_id <> wishlist_c.contributor_id AND h.allow_channel_queries IS TRUE
+		AND NOT EXISTS (SELECT 1 FROM new_rows n2 WHERE n2.video_id = c.video_id AND n2.contributor_id = c.contributor_id)
+	);
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_channel_wishlist AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION match_channel_wishlist();
+
+/* queued matches the old drain would have dropped */
+DELETE FROM notifications WHERE kind = 'channel' AND NOT EXISTS (
+	SELECT 1 FROM contributions_v JOIN contributors ON contributors.id = contributions_v.contributor_id
+	WHERE contributions_v.video_id = notifications.video_id
+	AND contributions_v.contributor_id <> notifications.contributor_id AND contributors.allow_channel_queries IS TRUE
+);
+COMMIT;
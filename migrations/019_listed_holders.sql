@@ -0,0 +1,77 @@
+/* /at_risk_channels counts only single copies whose holder allows channel queries, like /at_risk_videos and /channelvideos */
+/* run against an existing db: psql -d dya_tracker -f migrations/019_listed_holders.sql */
+/* contribution writes and contributor flag changes are blocked while the counts are backfilled */
+
+BEGIN;
+LOCK TABLE contributions_v IN SHARE ROW EXCLUSIVE MODE;
+LOCK TABLE contributors IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER contributions_v_insert_holders ON contributions_v;
+DROP TRIGGER contributions_v_delete_holders ON contributions_v;
+DROP FUNCTION update_video_holders();
+DROP FUNCTION apply_video_holders(INT, INT[]);
+
+ALTER TABLE video_holders ADD COLUMN listed INT NOT NULL DEFAULT 0;
+
+/* add (direction 1) or remove (direction -1) holders, rows are upserted in video_id order so concurrent submits can't deadlock */
+/* listed_only is set when a contributor's allow_channel_queries changed, changed then holds all of their videos */
+CREATE FUNCTION apply_video_holders(direction INT, changed contributions_v[], listed_only BOOL DEFAULT FALSE) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+	WITH delta AS (
+		SELECT videos.id, videos.channel_id, CASE WHEN listed_only THEN 0 ELSE direction * count(*) END AS n,
+			direction * count(*) FILTER (WHERE listed_only OR contributors.allow_channel_queries IS TRUE) AS l
+		FROM unnest(changed) c JOIN videos ON videos.id = c.video_id
+		LEFT JOIN contributors ON contributors.id = c.contributor_id GROUP BY videos.id
+	), upserted AS (
+		INSERT INTO video_holders (video_id, channel_id, holders, listed) SELECT id, channel_id, n, l FROM delta ORDER BY id
+		ON CONFLICT (video_id) DO UPDATE SET holders = video_holders.holders + EXCLUDED.holders, listed = video_holders.listed + EXCLUDED.listed
+		RETURNING video_id, channel_id, holders, listed
+	), crossed AS (
+		SELECT u.channel_id, CAST(u.holders = 1 AND u.listed = 1 AS INT) - CAST(u.holders - delta.n = 1 AND u.listed - delta.l = 1 AS INT) AS d
+		FROM upserted u JOIN delta ON delta.id = u.video_id WHERE u.channel_id IS NOT NULL
+	)
+	INSERT INTO channel_single_copies (channel_id, videos)
+	SELECT channel_id, sum(d) FROM crossed GROUP BY 1 HAVING sum(d) <> 0 ORDER BY 1
+	ON CONFLICT (channel_id) DO UPDATE SET videos = channel_single_copies.videos + EXCLUDED.videos;
+END $$;
+
+CREATE FUNCTION update_video_holders() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM apply_video_holders(1, ARRAY(SELECT CAST(n AS contributions_v) FROM new_rows n));
+	ELSE
+		PERFORM apply_video_holders(-1, ARRAY(SELECT CAST(o AS contributions_v) FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+/* a deleted contributor stops being listed, contributions left behind by them count as unlisted when they go */
+CREATE FUNCTION update_contributor_holders() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		IF OLD.allow_channel_queries THEN
+			PERFORM apply_video_holders(-1, ARRAY(SELECT c FROM contributions_v c WHERE c.contributor_id = OLD.id), TRUE);
+		END IF;
+	ELSIF NEW.allow_channel_queries IS DISTINCT FROM OLD.allow_channel_queries THEN
+		PERFORM apply_video_holders(CASE WHEN NEW.allow_channel_queries THEN 1 ELSE -1 END,
+			ARRAY(SELECT c FROM contributions_v c WHERE c.contributor_id = NEW.id), TRUE);
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_holders AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_video_holders();
+CREATE TRIGGER contributions_v_delete_holders AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_video_holders();
+CREATE TRIGGER contributors_holders AFTER UPDATE OF allow_channel_queries OR DELETE ON contributors FOR EACH ROW EXECUTE FUNCTION update_contributor_holders();
+
+UPDATE video_holders SET listed = l.n FROM (
+	SELECT contributions_v.video_id, count(*) AS n FROM contributions_v
+	JOIN contributors ON contributors.id = contributions_v.contributor_id WHERE contributors.allow_channel_queries GROUP BY 1
+) l WHERE l.video_id = video_holders.video_id;
+
+UPDATE channel_single_copies SET videos = 0;
+INSERT INTO channel_single_copies (channel_id, videos)
+SELECT channel_id, count(*) FROM video_holders WHERE holders = 1 AND listed = 1 AND channel_id IS NOT NULL GROUP BY 1
+ON CONFLICT (channel_id) DO UPDATE SET videos = EXCLUDED.videos;
+COMMIT;
+
+ANALYZE video_holders, channel_single_copies;
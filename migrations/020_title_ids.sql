@@ -0,0 +1,18 @@
+/* insertion order ids on titles_v/titles_c, the current title pick breaks time_added ties on them */
+/* run against an existing db: psql -d dya_tracker -f migrations/020_title_ids.sql */
+/* rewrites both tables, existing rows are numbered in physical order */
+
+BEGIN;
+ALTER TABLE titles_c ADD COLUMN id BIGSERIAL;
+ALTER TABLE titles_v ADD COLUMN id BIGSERIAL;
+GRANT UPDATE ON titles_c_id_seq, titles_v_id_seq TO dya_tracker_api;
+
+/* recompute current titles that had a tie, with the new order */
+UPDATE videos SET title = latest.title FROM (
+    SELECT DISTINCT ON (video_id) video_id, title FROM titles_v ORDER BY video_id, time_added DESC, id DESC
+) latest WHERE videos.id = latest.video_id AND videos.title IS DISTINCT FROM latest.title;
+
+UPDATE channels SET title = latest.title FROM (
+    SELECT DISTINCT ON (channel_id) channel_id, title FROM titles_c ORDER BY channel_id, time_added DESC, id DESC
+) latest WHERE channels.id = latest.channel_id AND channels.title IS DISTINCT FROM latest.title;
+COMMIT;
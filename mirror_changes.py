@@ -0,0 +1,113 @@
+import argparse
+import requests
+import sqlite3
+import sys
+import time
+
+# reference consumer for GET /api/changes, keeps a local sqlite copy of the tracker's contributions up to date
+# every change is applied idempotently (insert if missing, delete if present), so replaying a page is harmless
+# and a mirror can be seeded from a dump and then started from any seq taken before the dump
+# the key needs allow_changes_query (not given by default), the feed carries contributors who opted out of channel queries
+# so a mirror has to honour allow_channel_queries before serving channel listings from its copy
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE IF NOT EXISTS videos (video_id TEXT PRIMARY KEY, channel_id TEXT);
+CREATE TABLE IF NOT EXISTS contributions_v (video_id TEXT, contributor_id INTEGER, format TEXT, filesize INTEGER, PRIMARY KEY (video_id, contributor_id));
+CREATE INDEX IF NOT EXISTS contributions_v_contributor_id_idx ON contributions_v (contributor_id);
+CREATE TABLE IF NOT EXISTS contributions_c (channel_id TEXT, contributor_id INTEGER, note TEXT, PRIMARY KEY (channel_id, contributor_id));
+CREATE TABLE IF NOT EXISTS titles_v (video_id TEXT, contributor_id INTEGER, title TEXT, time_added INTEGER, UNIQUE (video_id, title));
+CREATE TABLE IF NOT EXISTS titles_c (channel_id TEXT, contributor_id INTEGER, title TEXT, time_added INTEGER, UNIQUE (channel_id, title));
+CREATE TABLE IF NOT EXISTS contributors (id INTEGER PRIMARY KEY, name TEXT, discord_id TEXT, alternative_contact_info TEXT, allow_channel_queries INTEGER, allow_stats_queries INTEGER);
+'''
+
+def apply_change(db, change):
+    d = change['data']
+    table, op = change['table'], change['op']
+    if table == 'videos':
+        db.execute('INSERT OR IGNORE INTO videos (video_id, channel_id) VALUES (?, ?)', (d['video_id'], d['channel_id']))
+    elif table == 'contributions_v' and op == 'i':
+        db.execute('INSERT OR IGNORE INTO contributions_v (video_id, contributor_id, format, filesize) VALUES (?, ?, ?, ?)', (d['video_id'], d['contributor_id'], d['format'], d['filesize']))
+    elif table == 'contributions_v':
+        db.execute('DELETE FROM contributions_v WHERE video_id = ? AND contributor_id = ?', (d['video_id'], d['contributor_id']))
+    elif table == 'contributions_c' and op == 'i':
+        db.execute('INSERT OR IGNORE INTO contributions_c (channel_id, contributor_id, note) VALUES (?, ?, ?)', (d['channel_id'], d['contributor_id'], d['note']))
+    elif table == 'contributions_c':
+        db.execute('DELETE FROM contributions_c WHERE channel_id = ? AND contributor_id = ?', (d['channel_id'], d['contributor_id']))
+    elif table == 'titles_v':
+        db.execute('INSERT OR IGNORE INTO titles_v (video_id, contributor_id, title, time_added) VALUES (?, ?, ?, ?)', (d['video_id'], d['contributor_id'], d['title'], d['time_added']))
+    elif table == 'titles_c':
+        db.execute('INSERT OR IGNORE INTO titles_c (channel_id, contributor_id, title, time_added) VALUES (?, ?, ?, ?)', (d['channel_id'], d['contributor_id'], d['title'], d['time_added']))
+    elif table == 'contributors' and op == 'd':
+        db.execute('DELETE FROM contributors WHERE id = ?', (d['id'],))
+    elif table == 'contributors':
+        db.execute('INSERT OR REPLACE INTO contributors (id, name, discord_id, alternative_contact_info, allow_channel_queries, allow_stats_queries) VALUES (?, ?, ?, ?, ?, ?)', (
+            d['id'], d['name'], d['discord_id'], d['alternative_contact_info'], d['allow_channel_queries'], d['allow_stats_queries']))
+    else:
+        print(f'skipping unknown change {table}/{op}')
+
+def fetch_page(args, since):
+    while True:
+        try:
+            resp = requests.get(args.api_root_url + '/changes', headers={'Authorization': args.api_key}, params={'since': since, 'limit': args.limit})
+            status = resp.status_code
+        except Exception as e:
+            status = str(e)
+        
+        if status == 200:
+            return resp.json()
+        elif status == 401:
+            raise Exception('invalid api key passed')
+        elif status == 410:
+            raise Exception(f'{resp.json()["error"]}, or pass --since to skip ahead')
+        elif status == 429:
+            print('429 ratelimiting.. retrying')
+            time.sleep(5)
+        else:
+            print(f'bad status {status}.. retrying')
+            time.sleep(1)
+
+def main(args):
+    db = sqlite3.connect(args.db)
+    db.executescript(SCHEMA)
+    if args.since is not None:
+        with db:
+            db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('since', ?)", (args.since,))
+    
+    while True:
+        since = (db.execute("SELECT value FROM state WHERE key = 'since'").fetchone() or [0])[0]
+        page = fetch_page(args, since)
+        
+        # a page and its position are committed together, an interrupted run resumes where it stopped
+        with db:
+            for change in page['changes']:
+                apply_change(db, change)
+            db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('since', ?)", (page['nextSince'],))
+        if page['count']:
+            print(f'applied {page["count"]:,} changes, now at seq {page["nextSince"]:,}')
+        
+        if page['more']:
+            continue
+        elif not args.follow:
+            break
+        time.sleep(args.interval)
+    db.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--api-key', help='dya tracker api key', default=None)
+    parser.add_argument('-d', '--db', help='local sqlite mirror', default='./dya_tracker_mirror.sqlite')
+    parser.add_argument('--api-root-url', help='dya tracker api url', default='https://dya-t-api.strangled.net/api')
+    parser.add_argument('--since', type=int, default=None, help='start from this seq instead of the last applied one')
+    parser.add_argument('--limit', type=int, default=10000, help='changes per request (max 10000)')
+    parser.add_argument('-f', '--follow', action='store_true', help='keep polling for new changes')
+    parser.add_argument('--interval', type=int, default=60, help='seconds between polls with --follow')
+    if len(sys.argv)==1:
+        parser.print_help(sys.stderr); exit()
+    args = parser.parse_args()
+    
+    if not args.api_key:
+        parser.print_help(sys.stderr)
+        print('\napi key is a required arg'); exit()
+    
+    main(args)
@@ -3,6 +3,8 @@ CREATE DATABASE dya_tracker;
 /* psql connect to db */
 \c dya_tracker
 
+CREATE EXTENSION pg_trgm; /* title search */
+
 CREATE TABLE contributors (
     id SERIAL PRIMARY KEY,
 	allow_channel_queries BOOL NOT NULL,
@@ -24,45 +26,106 @@ CREATE TABLE contributions_c (
     UNIQUE(channel_id, contributor_id)
 );
 CREATE INDEX contributions_channel_id_idx ON contributions_c (channel_id);
+CREATE INDEX contributions_c_contributor_id_idx ON contributions_c (contributor_id, channel_id);
 
 CREATE TABLE contributions_v (
     video_id INT NOT NULL,
     contributor_id INT NOT NULL,
 	format_id INT,
 	filesize BIGINT,
+	time_added INT DEFAULT CAST(extract(epoch FROM now()) AS INT), /* null for rows older than migration 006 */
     UNIQUE(video_id, contributor_id)
 );
-CREATE INDEX contributions_contributor_id_idx ON contributions_v (contributor_id);
+CREATE INDEX contributions_contributor_id_idx ON contributions_v (contributor_id, video_id);
+CREATE INDEX contributions_v_time_added_idx ON contributions_v (time_added);
 
 CREATE TABLE titles_c (
+	id BIGSERIAL, /* insertion order, breaks time_added ties when picking the current title */
 	time_added INT,
 	channel_id INT,
 	contributor_id INT,
 	title TEXT,
 	UNIQUE (channel_id, title)
 );
-CREATE INDEX titles_c_id_idx ON titles_c (channel_id);
+CREATE INDEX titles_c_id_idx ON titles_c (channel_id, time_added);
+CREATE INDEX titles_c_title_trgm_idx ON titles_c USING gist (title gist_trgm_ops(siglen=64)); /* GET /search, nearest neighbour scans */
 
 CREATE TABLE titles_v (
+	id BIGSERIAL, /* insertion order, breaks time_added ties when picking the current title */
 	time_added INT,
 	video_id INT,
 	contributor_id INT,
 	title TEXT,
 	UNIQUE (video_id, title)
 );
-CREATE INDEX titles_v_id_idx ON titles_v (video_id);
+CREATE INDEX titles_v_id_idx ON titles_v (video_id, time_added);
+CREATE INDEX titles_v_title_trgm_idx ON titles_v USING gist (title gist_trgm_ops(siglen=64)); /* GET /search, nearest neighbour scans */
 
 CREATE TABLE channels (
     id SERIAL PRIMARY KEY NOT NULL,
-    channel_id CHAR(22) UNIQUE NOT NULL
+    channel_id CHAR(22) UNIQUE NOT NULL,
+    title TEXT /* latest titles_c title, kept current by the api */
 );
 
+/* base64url video id -> the same signed 64-bit int as yt_ids.video_id_to_int */
+CREATE FUNCTION video_id_key(vid TEXT) RETURNS BIGINT IMMUTABLE PARALLEL SAFE LANGUAGE SQL AS $$
+	SELECT ('x' || encode(decode(translate(vid, '-_', '+/') || '=', 'base64'), 'hex'))::bit(64)::bigint
+$$;
+
 CREATE TABLE videos (
     id SERIAL PRIMARY KEY NOT NULL,
-    video_id CHAR(11) UNIQUE NOT NULL,
-    channel_id INT /* id of row in channels table */
+    video_id CHAR(11) NOT NULL, /* unique through video_key */
+    channel_id INT, /* id of row in channels table */
+    title TEXT, /* latest titles_v title, kept current by the api */
+    video_key BIGINT GENERATED ALWAYS AS (video_id_key(video_id)) STORED /* packed video_id, the only lookup index (8 byte keys vs 12) */
+);
+CREATE INDEX videos_channel_id_idx ON videos (channel_id, id);
+CREATE UNIQUE INDEX videos_video_key_idx ON videos (video_key);
+
+/* async submits (?async=true), merged by the api's ingest workers */
+CREATE TABLE ingest_jobs (
+	id BIGSERIAL PRIMARY KEY,
+	contributor_id INT NOT NULL,
+	kind TEXT NOT NULL, /* videos or channels */
+	status TEXT NOT NULL DEFAULT 'queued', /* queued, done or failed */
+	items JSONB, /* validated submit items, cleared once merged */
+	item_count INT NOT NULL,
+	errors JSONB, /* per-item validation errors */
+	error TEXT,
+	time_added INT NOT NULL,
+	time_finished INT
+);
+CREATE INDEX ingest_jobs_queued_idx ON ingest_jobs (id) WHERE status = 'queued';
+CREATE INDEX ingest_jobs_contributor_id_idx ON ingest_jobs (contributor_id);
+
+/* /sync_videos manifests, staged per session (one streamed call or several chunked calls) until the diff is applied */
+CREATE TABLE sync_sessions (
+	id BIGSERIAL PRIMARY KEY,
+	contributor_id INT NOT NULL,
+	time_added INT NOT NULL,
+	invalid INT NOT NULL DEFAULT 0, /* invalid/excluded lines over every chunk, a session with invalid lines isn't applied */
+	excluded INT NOT NULL DEFAULT 0,
+	errors JSONB NOT NULL DEFAULT '[]' /* first 100 validation errors */
+);
+
+CREATE UNLOGGED TABLE sync_manifests (
+	session_id BIGINT NOT NULL REFERENCES sync_sessions ON DELETE CASCADE,
+	vid CHAR(11) NOT NULL,
+	cid CHAR(22),
+	title TEXT,
+	ctitle TEXT,
+	fs TEXT,
+	size BIGINT
+);
+CREATE INDEX sync_manifests_session_id_idx ON sync_manifests (session_id, vid);
+
+/* channel lines of a manifest, their titles are merged when the diff is applied */
+CREATE UNLOGGED TABLE sync_manifest_channels (
+	session_id BIGINT NOT NULL REFERENCES sync_sessions ON DELETE CASCADE,
+	cid CHAR(22) NOT NULL,
+	ctitle TEXT
 );
-CREATE INDEX videos_channel_id_idx ON videos (channel_id);
+CREATE INDEX sync_manifest_channels_session_id_idx ON sync_manifest_channels (session_id);
 
 CREATE TABLE api_keys(
 	application TEXT,
@@ -72,15 +135,458 @@ CREATE TABLE api_keys(
 	allow_channelvideos_query BOOL DEFAULT FALSE,
 	allow_submit_contributions INT DEFAULT NULL UNIQUE,
 	allow_create_user BOOL DEFAULT FALSE,
-	allow_create_user_api_keys BOOL DEFAULT FALSE
+	allow_create_user_api_keys BOOL DEFAULT FALSE,
+	allow_changes_query BOOL DEFAULT FALSE /* GET /changes, links contributions to contributors so it's only given to trusted mirrors */
+);
+
+/* change feed for mirrors (GET /changes), filled by triggers on the tables above */
+CREATE TABLE changes (
+	id BIGSERIAL PRIMARY KEY,
+	seq BIGINT UNIQUE, /* commit ordered position in the feed, assigned by the api when the feed is read */
+	time_added INT NOT NULL,
+	tbl TEXT NOT NULL,
+	op CHAR(1) NOT NULL, /* i(nsert), u(pdate) or d(elete) */
+	data JSONB NOT NULL /* row with natural ids (video/channel ids, format strings) instead of serial ids */
+);
+CREATE INDEX changes_pending_idx ON changes (id) WHERE seq IS NULL;
+CREATE INDEX changes_time_added_idx ON changes (time_added);
+CREATE SEQUENCE changes_seq;
+
+/* statement level triggers, one insert into changes per statement no matter how many rows it touched */
+CREATE FUNCTION log_video_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO changes (time_added, tbl, op, data)
+	SELECT CAST(extract(epoch FROM now()) AS INT), 'videos', 'i', jsonb_build_object(
+		'video_id', n.video_id, 'channel_id', channels.channel_id)
+	FROM new_rows n LEFT JOIN channels ON channels.id = n.channel_id ORDER BY n.id;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_contributions_v_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_v', 'i', jsonb_build_object(
+			'video_id', videos.video_id, 'contributor_id', n.contributor_id, 'format', formats.format_string, 'filesize', n.filesize)
+		FROM new_rows n JOIN videos ON videos.id = n.video_id LEFT JOIN formats ON formats.id = n.format_id ORDER BY n.video_id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_v', 'd', jsonb_build_object(
+			'video_id', videos.video_id, 'contributor_id', o.contributor_id)
+		FROM old_rows o JOIN videos ON videos.id = o.video_id ORDER BY o.video_id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_contributions_c_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_c', 'i', jsonb_build_object(
+			'channel_id', channels.channel_id, 'contributor_id', n.contributor_id, 'note', n.note)
+		FROM new_rows n JOIN channels ON channels.id = n.channel_id ORDER BY n.channel_id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributions_c', 'd', jsonb_build_object(
+			'channel_id', channels.channel_id, 'contributor_id', o.contributor_id)
+		FROM old_rows o JOIN channels ON channels.id = o.channel_id ORDER BY o.channel_id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_titles_v_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO changes (time_added, tbl, op, data)
+	SELECT CAST(extract(epoch FROM now()) AS INT), 'titles_v', 'i', jsonb_build_object(
+		'video_id', videos.video_id, 'contributor_id', n.contributor_id, 'title', n.title, 'time_added', n.time_added)
+	FROM new_rows n JOIN videos ON videos.id = n.video_id ORDER BY n.video_id;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_titles_c_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO changes (time_added, tbl, op, data)
+	SELECT CAST(extract(epoch FROM now()) AS INT), 'titles_c', 'i', jsonb_build_object(
+		'channel_id', channels.channel_id, 'contributor_id', n.contributor_id, 'title', n.title, 'time_added', n.time_added)
+	FROM new_rows n JOIN channels ON channels.id = n.channel_id ORDER BY n.channel_id;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION log_contributors_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributors', 'd', jsonb_build_object('id', o.id)
+		FROM old_rows o ORDER BY o.id;
+	ELSE
+		INSERT INTO changes (time_added, tbl, op, data)
+		SELECT CAST(extract(epoch FROM now()) AS INT), 'contributors', lower(left(TG_OP, 1)), jsonb_build_object(
+			'id', n.id, 'name', n.name, 'discord_id', CASE WHEN n.alternative_contact_info IS NULL THEN n.discord_id END,
+			'alternative_contact_info', n.alternative_contact_info,
+			'allow_channel_queries', n.allow_channel_queries, 'allow_stats_queries', n.allow_stats_queries)
+		FROM new_rows n ORDER BY n.id;
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER videos_insert_changes AFTER INSERT ON videos REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_video_changes();
+CREATE TRIGGER contributions_v_insert_changes AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_v_changes();
+CREATE TRIGGER contributions_v_delete_changes AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_v_changes();
+CREATE TRIGGER contributions_c_insert_changes AFTER INSERT ON contributions_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_c_changes();
+CREATE TRIGGER contributions_c_delete_changes AFTER DELETE ON contributions_c REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributions_c_changes();
+CREATE TRIGGER titles_v_insert_changes AFTER INSERT ON titles_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_titles_v_changes();
+CREATE TRIGGER titles_c_insert_changes AFTER INSERT ON titles_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_titles_c_changes();
+CREATE TRIGGER contributors_insert_changes AFTER INSERT ON contributors REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributors_changes();
+CREATE TRIGGER contributors_update_changes AFTER UPDATE ON contributors REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributors_changes();
+CREATE TRIGGER contributors_delete_changes AFTER DELETE ON contributors REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_contributors_changes();
+
+/* running totals for /stats and /leaderboard, kept current by triggers on contributions_v/contributions_c so reads never scan contributions */
+/* per contributor rows always count; global/channel/format totals only count contributors with allow_stats_queries */
+/* totals are split into 16 shards by contributor_id % 16 so concurrent submits from different contributors don't queue on one row */
+CREATE TABLE stats_contributors (
+	contributor_id INT PRIMARY KEY,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	channels BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX stats_contributors_videos_idx ON stats_contributors (videos DESC, contributor_id);
+CREATE INDEX stats_contributors_bytes_idx ON stats_contributors (bytes DESC, contributor_id);
+
+CREATE TABLE stats_global (
+	shard SMALLINT PRIMARY KEY,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	contributors BIGINT NOT NULL DEFAULT 0 /* contributors with at least one video */
+);
+
+CREATE TABLE stats_channels (
+	channel_id INT NOT NULL,
+	shard SMALLINT NOT NULL,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	PRIMARY KEY (channel_id, shard)
+);
+
+CREATE TABLE stats_formats (
+	format_id INT NOT NULL,
+	shard SMALLINT NOT NULL,
+	videos BIGINT NOT NULL DEFAULT 0,
+	bytes BIGINT NOT NULL DEFAULT 0,
+	PRIMARY KEY (format_id, shard)
+);
+
+/* add (direction 1) or remove (direction -1) a set of contributions_v rows from the totals, every upsert goes in key order */
+/* totals_only skips the per contributor rows and the allow_stats_queries check (used when that flag is toggled) */
+CREATE FUNCTION apply_video_stats(direction INT, changed contributions_v[], totals_only BOOL DEFAULT FALSE) RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+	crossed INT[]; /* contributors moving in (id) or out (-id) of stats_global.contributors */
+BEGIN
+	IF NOT totals_only THEN
+		/* a contributor is counted while their video count is above 0 */
+		WITH delta AS (
+			SELECT c.contributor_id, direction * count(*) AS videos, direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) AS bytes
+			FROM unnest(changed) c GROUP BY 1
+		), upserted AS (
+			INSERT INTO stats_contributors (contributor_id, videos, bytes) SELECT * FROM delta ORDER BY 1
+			ON CONFLICT (contributor_id) DO UPDATE SET videos = stats_contributors.videos + EXCLUDED.videos, bytes = stats_contributors.bytes + EXCLUDED.bytes
+			RETURNING contributor_id, videos
+		)
+		SELECT ARRAY(SELECT CASE WHEN u.videos > 0 THEN u.contributor_id ELSE -u.contributor_id END FROM upserted u
+			JOIN delta ON delta.contributor_id = u.contributor_id WHERE (u.videos > 0) <> (u.videos - delta.videos > 0)) INTO crossed;
+	ELSE
+		/* the flag was toggled, changed holds all of one contributor's videos */
+		crossed := ARRAY(SELECT DISTINCT direction * c.contributor_id FROM unnest(changed) c);
+	END IF;
+	
+	INSERT INTO stats_global (shard, videos, bytes, contributors)
+	SELECT t.shard, sum(t.videos), sum(t.bytes), sum(t.contributors) FROM (
+		SELECT c.contributor_id % 16 AS shard, direction * count(*) AS videos, direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) AS bytes, 0 AS contributors
+		FROM unnest(changed) c JOIN contributors ON contributors.id = c.contributor_id WHERE totals_only OR contributors.allow_stats_queries GROUP BY 1
+		UNION ALL
+		SELECT abs(x) % 16, 0, 0, sign(x) FROM unnest(crossed) x
+		JOIN contributors ON contributors.id = abs(x) WHERE totals_only OR contributors.allow_stats_queries
+	) t GROUP BY 1 ORDER BY 1
+	ON CONFLICT (shard) DO UPDATE SET videos = stats_global.videos + EXCLUDED.videos, bytes = stats_global.bytes + EXCLUDED.bytes,
+		contributors = stats_global.contributors + EXCLUDED.contributors;
+	
+	INSERT INTO stats_channels (channel_id, shard, videos, bytes)
+	SELECT videos.channel_id, c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id JOIN videos ON videos.id = c.video_id
+	WHERE (totals_only OR contributors.allow_stats_queries) AND videos.channel_id IS NOT NULL
+	GROUP BY 1, 2 ORDER BY 1, 2
+	ON CONFLICT (channel_id, shard) DO UPDATE SET videos = stats_channels.videos + EXCLUDED.videos, bytes = stats_channels.bytes + EXCLUDED.bytes;
+	
+	INSERT INTO stats_formats (format_id, shard, videos, bytes)
+	SELECT c.format_id, c.contributor_id % 16, direction * count(*), direction * CAST(sum(coalesce(c.filesize, 0)) AS BIGINT) FROM unnest(changed) c
+	JOIN contributors ON contributors.id = c.contributor_id
+	WHERE (totals_only OR contributors.allow_stats_queries) AND c.format_id IS NOT NULL
+	GROUP BY 1, 2 ORDER BY 1, 2
+	ON CONFLICT (format_id, shard) DO UPDATE SET videos = stats_formats.videos + EXCLUDED.videos, bytes = stats_formats.bytes + EXCLUDED.bytes;
+END $$;
+
+CREATE FUNCTION update_contributions_v_stats() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM apply_video_stats(1, ARRAY(SELECT CAST(n AS contributions_v) FROM new_rows n));
+	ELSE
+		PERFORM apply_video_stats(-1, ARRAY(SELECT CAST(o AS contributions_v) FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION update_contributions_c_stats() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO stats_contributors (contributor_id, channels) SELECT n.contributor_id, count(*) FROM new_rows n
+		GROUP BY 1 ORDER BY 1 ON CONFLICT (contributor_id) DO UPDATE SET channels = stats_contributors.channels + EXCLUDED.channels;
+	ELSE
+		INSERT INTO stats_contributors (contributor_id, channels) SELECT o.contributor_id, -count(*) FROM old_rows o
+		GROUP BY 1 ORDER BY 1 ON CONFLICT (contributor_id) DO UPDATE SET channels = stats_contributors.channels + EXCLUDED.channels;
+	END IF;
+	RETURN NULL;
+END $$;
+
+/* row level, allow_stats_queries only changes by hand; moves that contributor's contributions in or out of the totals */
+CREATE FUNCTION update_contributor_stats() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		DELETE FROM stats_contributors WHERE contributor_id = OLD.id;
+	ELSIF NEW.allow_stats_queries IS DISTINCT FROM OLD.allow_stats_queries THEN
+		PERFORM apply_video_stats(CASE WHEN NEW.allow_stats_queries THEN 1 ELSE -1 END,
+			ARRAY(SELECT c FROM contributions_v c WHERE c.contributor_id = NEW.id), TRUE);
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_stats AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_v_stats();
+CREATE TRIGGER contributions_v_delete_stats AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_v_stats();
+CREATE TRIGGER contributions_c_insert_stats AFTER INSERT ON contributions_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_c_stats();
+CREATE TRIGGER contributions_c_delete_stats AFTER DELETE ON contributions_c REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_contributions_c_stats();
+CREATE TRIGGER contributors_stats AFTER UPDATE OF allow_stats_queries OR DELETE ON contributors FOR EACH ROW EXECUTE FUNCTION update_contributor_stats();
+
+/* per video holder counts and per channel counts of videos with a single holder, kept current by triggers on contributions_v */
+/* separate narrow tables instead of columns on videos/channels, every contribution rewrites a row here */
+CREATE TABLE video_holders (
+	video_id INT PRIMARY KEY,
+	channel_id INT,
+	holders INT NOT NULL DEFAULT 0,
+	listed INT NOT NULL DEFAULT 0 /* holders that allow channel queries, videos with none are hidden from the at risk endpoints */
+);
+CREATE INDEX video_holders_channel_id_idx ON video_holders (channel_id, holders, video_id);
+
+CREATE TABLE channel_single_copies (
+	channel_id INT PRIMARY KEY,
+	videos INT NOT NULL DEFAULT 0 /* videos of the channel held by exactly one contributor, who allows channel queries */
+);
+CREATE INDEX channel_single_copies_videos_idx ON channel_single_copies (videos, channel_id);
+
+/* add (direction 1) or remove (direction -1) holders, rows are upserted in video_id order so concurrent submits can't deadlock */
+/* listed_only is set when a contributor's allow_channel_queries changed, changed then holds all of their videos */
+CREATE FUNCTION apply_video_holders(direction INT, changed contributions_v[], listed_only BOOL DEFAULT FALSE) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+	WITH delta AS (
+		SELECT videos.id, videos.channel_id, CASE WHEN listed_only THEN 0 ELSE direction * count(*) END AS n,
+			direction * count(*) FILTER (WHERE listed_only OR contributors.allow_channel_queries IS TRUE) AS l
+		FROM unnest(changed) c JOIN videos ON videos.id = c.video_id
+		LEFT JOIN contributors ON contributors.id = c.contributor_id GROUP BY videos.id
+	), upserted AS (
+		INSERT INTO video_holders (video_id, channel_id, holders, listed) SELECT id, channel_id, n, l FROM delta ORDER BY id
+		ON CONFLICT (video_id) DO UPDATE SET holders = video_holders.holders + EXCLUDED.holders, listed = video_holders.listed + EXCLUDED.listed
+		RETURNING video_id, channel_id, holders, listed
+	), crossed AS (
+		SELECT u.channel_id, CAST(u.holders = 1 AND u.listed = 1 AS INT) - CAST(u.holders - delta.n = 1 AND u.listed - delta.l = 1 AS INT) AS d
+		FROM upserted u JOIN delta ON delta.id = u.video_id WHERE u.channel_id IS NOT NULL
+	)
+	INSERT INTO channel_single_copies (channel_id, videos)
+	SELECT channel_id, sum(d) FROM crossed GROUP BY 1 HAVING sum(d) <> 0 ORDER BY 1
+	ON CONFLICT (channel_id) DO UPDATE SET videos = channel_single_copies.videos + EXCLUDED.videos;
+END $$;
+
+CREATE FUNCTION update_video_holders() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM apply_video_holders(1, ARRAY(SELECT CAST(n AS contributions_v) FROM new_rows n));
+	ELSE
+		PERFORM apply_video_holders(-1, ARRAY(SELECT CAST(o AS contributions_v) FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+/* a deleted contributor stops being listed, contributions left behind by them count as unlisted when they go */
+CREATE FUNCTION update_contributor_holders() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		IF OLD.allow_channel_queries THEN
+			PERFORM apply_video_holders(-1, ARRAY(SELECT c FROM contributions_v c WHERE c.contributor_id = OLD.id), TRUE);
+		END IF;
+	ELSIF NEW.allow_channel_queries IS DISTINCT FROM OLD.allow_channel_queries THEN
+		PERFORM apply_video_holders(CASE WHEN NEW.allow_channel_queries THEN 1 ELSE -1 END,
+			ARRAY(SELECT c FROM contributions_v c WHERE c.contributor_id = NEW.id), TRUE);
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_holders AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_video_holders();
+CREATE TRIGGER contributions_v_delete_holders AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_video_holders();
+CREATE TRIGGER contributors_holders AFTER UPDATE OF allow_channel_queries OR DELETE ON contributors FOR EACH ROW EXECUTE FUNCTION update_contributor_holders();
+
+/* wishlists (/wishlist), matched against new rows by triggers so the cost follows the number of new contributions, not wishlist size */
+/* matches go to the notifications outbox, the discord bot drains it through /notifications */
+CREATE TABLE wishlist_v (
+	contributor_id INT NOT NULL,
+	video_key BIGINT NOT NULL, /* video_id_key() of the wished video, it doesn't have to be in videos yet */
+	video_id CHAR(11) NOT NULL,
+	time_added INT NOT NULL,
+	UNIQUE (video_key, contributor_id)
+);
+CREATE INDEX wishlist_v_contributor_id_idx ON wishlist_v (contributor_id);
+
+CREATE TABLE wishlist_c (
+	contributor_id INT NOT NULL,
+	channel_id CHAR(22) NOT NULL,
+	time_added INT NOT NULL,
+	UNIQUE (channel_id, contributor_id)
+);
+CREATE INDEX wishlist_c_contributor_id_idx ON wishlist_c (contributor_id);
+
+CREATE TABLE notifications (
+	id BIGSERIAL PRIMARY KEY,
+	contributor_id INT NOT NULL,
+	kind TEXT NOT NULL, /* video (a wished video was contributed) or channel (a video of a wished channel became available) */
+	video_id INT NOT NULL, /* id of row in videos table */
+	time_added INT NOT NULL
 );
+CREATE INDEX notifications_contributor_id_idx ON notifications (contributor_id);
+
+/* a wished video is taken off the wishlist once anyone contributes it, only contributors with a discord id get notified (the bot DMs them) */
+CREATE FUNCTION match_video_wishlist() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	WITH matched AS (
+		DELETE FROM wishlist_v USING new_rows n JOIN videos ON videos.id = n.video_id
+		WHERE wishlist_v.video_key = videos.video_key
+		RETURNING wishlist_v.contributor_id, videos.id AS video_id, n.contributor_id AS holder_id
+	)
+	INSERT INTO notifications (contributor_id, kind, video_id, time_added)
+	SELECT DISTINCT matched.contributor_id, 'video', matched.video_id, CAST(extract(epoch FROM now()) AS INT) FROM matched
+	JOIN contributors ON contributors.id = matched.contributor_id
+	WHERE matched.holder_id <> matched.contributor_id AND contributors.discord_id IS NOT NULL;
+	RETURN NULL;
+END $$;
+
+/* wished channels stay on the wishlist, a video of theirs matches once someone other than the wisher who shows up in channel */
+/* queries (the /channelvideos rule) holds it, so the wisher's own uploads and opted-out holders never reach the outbox */
+CREATE FUNCTION match_channel_wishlist() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO notifications (contributor_id, kind, video_id, time_added)
+	SELECT DISTINCT wishlist_c.contributor_id, 'channel', n.video_id, CAST(extract(epoch FROM now()) AS INT) FROM new_rows n
+	JOIN contributors holder ON holder.id = n.contributor_id
+	JOIN videos ON videos.id = n.video_id
+	JOIN channels ON channels.id = videos.channel_id
+	JOIN wishlist_c ON wishlist_c.channel_id = channels.channel_id
+	JOIN contributors ON contributors.id = wishlist_c.contributor_id
+	WHERE holder.allow_channel_queries IS TRUE AND n.contributor_id <> wishlist_c.contributor_id AND contributors.discord_id IS NOT NULL
+	/* only the first such holder, later copies of a video the wisher could already find don't match again */
+	AND NOT EXISTS (
+		SELECT 1 FROM contributions_v c JOIN contributors h ON h.id = c.contributor_id
+		WHERE c.video_id = n.video_id AND c.contributor_id <> wishlist_c.contributor_id AND h.allow_channel_queries IS TRUE
+		AND NOT EXISTS (SELECT 1 FROM new_rows n2 WHERE n2.video_id = c.video_id AND n2.contributor_id = c.contributor_id)
+	);
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_wishlist AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION match_video_wishlist();
+CREATE TRIGGER contributions_v_insert_channel_wishlist AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION match_channel_wishlist();
+
+/* versions for ETags on /video and /channel* responses, bumped by triggers whenever a contribution or title of the entity changes */
+/* every bump takes a fresh versions_seq value, so a version never repeats even if an entity goes back to an earlier state */
+CREATE SEQUENCE versions_seq;
+
+CREATE TABLE video_versions (
+	video_id INT PRIMARY KEY,
+	version BIGINT NOT NULL
+);
+
+CREATE TABLE channel_versions (
+	channel_id INT PRIMARY KEY,
+	version BIGINT NOT NULL
+);
+
+/* contributor names/contact info/flags show up in every payload, any contributor change moves this one epoch instead */
+CREATE TABLE contributors_epoch (
+	epoch BIGINT NOT NULL
+);
+INSERT INTO contributors_epoch (epoch) VALUES (0);
+
+/* bump the given videos, their channels and the given channels, in id order so concurrent submits can't deadlock */
+CREATE FUNCTION bump_versions(video_ids INT[], channel_ids INT[]) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO video_versions (video_id, version)
+	SELECT v.id, nextval('versions_seq') FROM (SELECT DISTINCT unnest(video_ids) AS id ORDER BY 1) v
+	ON CONFLICT (video_id) DO UPDATE SET version = EXCLUDED.version;
+	
+	INSERT INTO channel_versions (channel_id, version)
+	SELECT c.id, nextval('versions_seq') FROM (
+		SELECT channel_id AS id FROM videos WHERE id = ANY(video_ids) AND channel_id IS NOT NULL
+		UNION SELECT unnest(channel_ids) ORDER BY 1
+	) c
+	ON CONFLICT (channel_id) DO UPDATE SET version = EXCLUDED.version;
+END $$;
+
+CREATE FUNCTION bump_video_versions() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM bump_versions(ARRAY(SELECT n.video_id FROM new_rows n), '{}');
+	ELSE
+		PERFORM bump_versions(ARRAY(SELECT o.video_id FROM old_rows o), '{}');
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION bump_channel_versions() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM bump_versions('{}', ARRAY(SELECT n.channel_id FROM new_rows n));
+	ELSE
+		PERFORM bump_versions('{}', ARRAY(SELECT o.channel_id FROM old_rows o));
+	END IF;
+	RETURN NULL;
+END $$;
+
+CREATE FUNCTION bump_contributors_epoch() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+	UPDATE contributors_epoch SET epoch = nextval('versions_seq');
+	RETURN NULL;
+END $$;
+
+CREATE TRIGGER contributions_v_insert_versions AFTER INSERT ON contributions_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_video_versions();
+CREATE TRIGGER contributions_v_delete_versions AFTER DELETE ON contributions_v REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_video_versions();
+CREATE TRIGGER titles_v_insert_versions AFTER INSERT ON titles_v REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_video_versions();
+CREATE TRIGGER contributions_c_insert_versions AFTER INSERT ON contributions_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_channel_versions();
+CREATE TRIGGER contributions_c_delete_versions AFTER DELETE ON contributions_c REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_channel_versions();
+CREATE TRIGGER titles_c_insert_versions AFTER INSERT ON titles_c REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_channel_versions();
+CREATE TRIGGER contributors_update_versions AFTER UPDATE OR DELETE ON contributors FOR EACH STATEMENT EXECUTE FUNCTION bump_contributors_epoch();
 
 CREATE USER dya_tracker_api;
 GRANT SELECT ON channels, videos, contributions_c, contributions_v, titles_c, titles_v, contributors, formats, api_keys TO dya_tracker_api;
 GRANT INSERT ON channels, videos, contributions_c, contributions_v, titles_c, titles_v, contributors, formats, api_keys TO dya_tracker_api;
-GRANT UPDATE ON videos, titles_c, titles_v, contributors, contributions_c, contributions_v TO dya_tracker_api;
-GRANT UPDATE ON channels_id_seq, videos_id_seq, contributors_id_seq, formats_id_seq TO dya_tracker_api;
+GRANT UPDATE ON channels, videos, titles_c, titles_v, contributors, contributions_c, contributions_v TO dya_tracker_api;
+GRANT UPDATE ON channels_id_seq, videos_id_seq, contributors_id_seq, formats_id_seq, titles_c_id_seq, titles_v_id_seq TO dya_tracker_api;
 GRANT DELETE ON contributions_c, contributions_v, contributors, api_keys TO dya_tracker_api;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ingest_jobs TO dya_tracker_api;
+GRANT UPDATE ON ingest_jobs_id_seq TO dya_tracker_api;
+GRANT SELECT, INSERT, DELETE ON sync_sessions, sync_manifests, sync_manifest_channels TO dya_tracker_api;
+GRANT UPDATE ON sync_sessions TO dya_tracker_api;
+GRANT UPDATE ON sync_sessions_id_seq TO dya_tracker_api;
+GRANT SELECT, INSERT, UPDATE, DELETE ON changes TO dya_tracker_api;
+GRANT UPDATE ON changes_id_seq, changes_seq TO dya_tracker_api;
+GRANT SELECT, INSERT, UPDATE, DELETE ON stats_contributors, stats_global, stats_channels, stats_formats TO dya_tracker_api;
+GRANT SELECT, INSERT, UPDATE ON video_holders, channel_single_copies TO dya_tracker_api;
+GRANT SELECT, INSERT, DELETE ON wishlist_v, wishlist_c, notifications TO dya_tracker_api;
+GRANT UPDATE ON notifications_id_seq TO dya_tracker_api;
+GRANT SELECT, INSERT, UPDATE ON video_versions, channel_versions, contributors_epoch TO dya_tracker_api;
+GRANT UPDATE ON versions_seq TO dya_tracker_api;
+
+ALTER ROLE dya_tracker_api SET pg_trgm.word_similarity_threshold = 0.4; /* default 0.6 drops most misspelled search queries */
 
 
 ALTER USER dya_tracker_api WITH PASSWORD 'default_password';
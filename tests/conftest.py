@@ -0,0 +1,28 @@
+import asyncio
+import os
+from os.path import dirname, join, realpath
+import sys
+
+import pytest
+
+sys.path.insert(0, join(dirname(realpath(__file__)), '..'))
+
+# db tests run against a database loaded from schema.sql, e.g. DYA_TEST_DB=postgresql://postgres@localhost/dya_tracker
+# every test runs inside a transaction that's rolled back, so an existing database is left as it was
+@pytest.fixture
+def run_db():
+    url = os.environ.get('DYA_TEST_DB')
+    if not url:
+        pytest.skip('DYA_TEST_DB not set')
+    import databases
+    
+    def run(test):
+        async def wrapped():
+            db = databases.Database(url, force_rollback=True)
+            await db.connect()
+            try:
+                return await test(db)
+            finally:
+                await db.disconnect()
+        return asyncio.run(wrapped())
+    return run
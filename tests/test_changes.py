@@ -0,0 +1,46 @@
+import time
+
+import api
+
+def insert_change(db, age, seq=None):
+    return db.execute(query='''
+        INSERT INTO changes (time_added, tbl, op, data, seq) VALUES (:t, 'videos', 'i', '{}', :seq)''', values={
+        't': int(time.time()) - age, 'seq': seq})
+
+def test_prune_changes_without_readers(run_db):
+    # nobody ever read the feed, so none of the rows have a seq yet
+    async def test(db):
+        await db.execute(query='DELETE FROM changes')
+        for _ in range(3):
+            await insert_change(db, 3600 * 24 * 40)
+        await insert_change(db, 60)
+        
+        await api.prune_changes(db, 3600 * 24 * 30)
+        rows = await db.fetch_all(query='SELECT seq, time_added FROM changes')
+        assert len(rows) == 1
+        assert rows[0]['seq'] is not None and rows[0]['time_added'] > time.time() - 3600
+    run_db(test)
+
+def test_prune_changes_keeps_newest(run_db):
+    # min(seq) is what tells a mirror it fell behind, so the newest row survives even if it's past retention
+    async def test(db):
+        await db.execute(query='DELETE FROM changes')
+        for _ in range(3):
+            await insert_change(db, 3600 * 24 * 40)
+        
+        await api.prune_changes(db, 3600 * 24 * 30)
+        await api.prune_changes(db, 3600 * 24 * 30)
+        seqs = await db.fetch_all(query='SELECT seq FROM changes')
+        assert len(seqs) == 1 and seqs[0]['seq'] is not None
+    run_db(test)
+
+def test_sequence_changes_batches(run_db, monkeypatch):
+    async def test(db):
+        await db.execute(query='DELETE FROM changes')
+        for _ in range(5):
+            await insert_change(db, 0)
+        monkeypatch.setattr(api, 'CHANGES_SEQUENCE_BATCH', 2)
+        assert [await api.sequence_changes(db) for _ in range(4)] == [2, 2, 1, 0]
+        seqs = [r['seq'] for r in await db.fetch_all(query='SELECT seq FROM changes ORDER BY id')]
+        assert seqs == sorted(seqs) and len(set(seqs)) == 5
+    run_db(test)
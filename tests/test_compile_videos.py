@@ -0,0 +1,119 @@
+import argparse
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+import compile_videos
+
+def info_json(video_id, channel_id='UCuAXFkgsw1L7xaCfnd5JJOw', **extra):
+    return {'id': video_id, 'extractor': 'youtube', 'channel_id': channel_id, 'title': f'title {video_id}', 'channel': 'chan',
+        'format_id': '22', 'filesize': 1000, 'formats': [{'format_id': '18'}], 'thumbnails': [], **extra}
+
+INFO_JSONS = {
+    'a/dQw4w9WgXcQ.info.json': info_json('dQw4w9WgXcQ'),
+    'a/b/AAAAAAAAAAA.info.json': info_json('AAAAAAAAAAA', availability='unlisted'),
+    'c/__________w.info.json': info_json('__________w', channel_id=None, uploader_id='UC_____________________w', channel=None, uploader='up'),
+    'c/notes.txt': 'not an info.json',
+    'c/vimeo.info.json': {**info_json('dQw4w9WgXcQ'), 'extractor': 'vimeo'},
+}
+
+def make_args(in_path, **kwargs):
+    return argparse.Namespace(**{'in_path': in_path, 'include_unlisted': False, 'exclude_titles': True, 'jobs': 1, 'walk_threads': 1,
+        'cache': None, 'unordered': False, 'channels': False, 'outfile': None, **kwargs})
+
+def write_tree(root, files=INFO_JSONS):
+    for name, content in files.items():
+        os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(content if type(content) == str else json.dumps(content))
+
+def write_tar(path, mode, files=INFO_JSONS):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, content in files.items():
+            data = (content if type(content) == str else json.dumps(content)).encode()
+            member = tarfile.TarInfo(name); member.size = len(data); member.mtime = 1700000000
+            tar.addfile(member, io.BytesIO(data))
+    data = buf.getvalue()
+    if mode == 'gz':
+        import gzip; data = gzip.compress(data)
+    elif mode == 'zst':
+        zstandard = pytest.importorskip('zstandard'); data = zstandard.ZstdCompressor().compress(data)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+EXPECTED_VIDEOS = {
+    'dQw4w9WgXcQ': {'id': 'dQw4w9WgXcQ', 'title': 'title dQw4w9WgXcQ', 'channel_id': 'UCuAXFkgsw1L7xaCfnd5JJOw', 'format_id': '22', 'filesize': 1000},
+    '__________w': {'id': '__________w', 'title': 'title __________w', 'channel_id': 'UC_____________________w', 'format_id': '22', 'filesize': 1000},
+}
+EXPECTED_CHANNELS = {
+    'UCuAXFkgsw1L7xaCfnd5JJOw': {'id': 'UCuAXFkgsw1L7xaCfnd5JJOw', 'title': 'chan'},
+    'UC_____________________w': {'id': 'UC_____________________w', 'title': 'up'},
+}
+
+def test_extract_info_json():
+    pytest.importorskip('simdjson')
+    fbin = json.dumps(info_json('dQw4w9WgXcQ')).encode()
+    assert compile_videos.extract_info_json(fbin) == {k: v for k, v in json.loads(fbin).items() if k in compile_videos.IJ_KEYS}
+    # a nested value in a key that's read means the file is odd, the caller falls back to json.loads
+    assert compile_videos.extract_info_json(json.dumps({**info_json('dQw4w9WgXcQ'), 'title': ['x']}).encode()) is None
+    assert compile_videos.extract_info_json(b'[1, 2]') is None
+
+def test_parse_info_json_without_simdjson(monkeypatch):
+    fbin = json.dumps(info_json('dQw4w9WgXcQ')).encode()
+    parsed = compile_videos.parse_info_json(make_args('.'), fbin, 'x.info.json')
+    monkeypatch.setattr(compile_videos, 'ij_parser', None)
+    assert compile_videos.parse_info_json(make_args('.'), fbin, 'x.info.json') == parsed
+    assert parsed == (EXPECTED_VIDEOS['dQw4w9WgXcQ'], EXPECTED_CHANNELS['UCuAXFkgsw1L7xaCfnd5JJOw'])
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_find_files(tmp_path, threads):
+    write_tree(str(tmp_path))
+    found = [os.path.relpath(e.path, tmp_path) for e in compile_videos.find_files(str(tmp_path), compile_videos.is_ij, threads)]
+    # breadth first, the same order with or without threads
+    assert sorted(found) == sorted(n for n in INFO_JSONS if n.endswith('.info.json'))
+    assert found.index('a/b/AAAAAAAAAAA.info.json') == len(found) - 1
+
+@pytest.mark.parametrize('jobs, walk_threads, unordered', [(1, 1, False), (2, 2, False), (2, 1, True)])
+def test_process_dir(tmp_path, jobs, walk_threads, unordered):
+    write_tree(str(tmp_path / 'in'))
+    videos, channels = compile_videos.process_info_jsons(make_args(str(tmp_path / 'in'), jobs=jobs, walk_threads=walk_threads, unordered=unordered))
+    assert videos == EXPECTED_VIDEOS and channels == EXPECTED_CHANNELS
+
+def test_include_unlisted(tmp_path):
+    write_tree(str(tmp_path / 'in'))
+    videos, _ = compile_videos.process_info_jsons(make_args(str(tmp_path / 'in'), include_unlisted=True))
+    assert set(videos) == set(EXPECTED_VIDEOS) | {'AAAAAAAAAAA'}
+
+@pytest.mark.parametrize('mode, name', [('', 'in.tar'), ('gz', 'in.tar.gz'), ('zst', 'in.tar.zst')])
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_process_tarball(tmp_path, mode, name, jobs):
+    # uncompressed tarballs are read from member offsets by the workers, compressed ones streamed by the parent
+    write_tar(str(tmp_path / name), mode)
+    videos, channels = compile_videos.process_info_jsons(make_args(str(tmp_path / name), jobs=jobs))
+    assert videos == EXPECTED_VIDEOS and channels == EXPECTED_CHANNELS
+
+def test_cache(tmp_path, capsys):
+    write_tree(str(tmp_path / 'in'))
+    args = make_args(str(tmp_path / 'in'), cache=str(tmp_path / 'cache.sqlite'))
+    assert compile_videos.process_info_jsons(args) == (EXPECTED_VIDEOS, EXPECTED_CHANNELS)
+    assert '4 files parsed, 0 from cache' in capsys.readouterr().out
+    
+    # unchanged files come from the cache, changed and new ones are parsed again, removed ones leave it
+    assert compile_videos.process_info_jsons(args) == (EXPECTED_VIDEOS, EXPECTED_CHANNELS)
+    assert '0 files parsed, 4 from cache' in capsys.readouterr().out
+    
+    changed = info_json('dQw4w9WgXcQ', title='new title')
+    write_tree(str(tmp_path / 'in'), {'a/dQw4w9WgXcQ.info.json': json.dumps(changed) + ' ', 'c/AAAAAAAAAAQ.info.json': info_json('AAAAAAAAAAQ')})
+    os.remove(str(tmp_path / 'in/c/__________w.info.json'))
+    videos, channels = compile_videos.process_info_jsons(args)
+    assert videos['dQw4w9WgXcQ']['title'] == 'new title'
+    assert set(videos) == {'dQw4w9WgXcQ', 'AAAAAAAAAAQ'} and set(channels) == {'UCuAXFkgsw1L7xaCfnd5JJOw'}
+    assert '2 files parsed, 2 from cache, 1 removed from cache' in capsys.readouterr().out
+    
+    # different parse options start the index over
+    compile_videos.process_info_jsons(make_args(str(tmp_path / 'in'), cache=str(tmp_path / 'cache.sqlite'), include_unlisted=True))
+    assert '4 files parsed, 0 from cache' in capsys.readouterr().out
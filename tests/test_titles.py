@@ -0,0 +1,26 @@
+import api
+
+def test_refresh_video_titles_breaks_ties_by_id(run_db):
+    # titles submitted in the same second: the one added last is current, whatever order the plan reads them in
+    async def test(db):
+        vid = await db.fetch_val(query="INSERT INTO videos (video_id) VALUES ('aaaaaaaaaaA') RETURNING id")
+        for title in ['a', 'c', 'b']:
+            await db.execute(query='''
+                INSERT INTO titles_v (time_added, video_id, contributor_id, title) VALUES (1000, :vid, NULL, :title)''', values={
+                'vid': vid, 'title': title})
+        
+        await api.refresh_video_titles(db, [vid])
+        assert await db.fetch_val(query='SELECT title FROM videos WHERE id = :vid', values={'vid': vid}) == 'b'
+    run_db(test)
+
+def test_refresh_channel_titles_breaks_ties_by_id(run_db):
+    async def test(db):
+        cid = await db.fetch_val(query="INSERT INTO channels (channel_id) VALUES ('aaaaaaaaaaaaaaaaaaaaaA') RETURNING id")
+        for title in ['a', 'c', 'b']:
+            await db.execute(query='''
+                INSERT INTO titles_c (time_added, channel_id, contributor_id, title) VALUES (1000, :cid, NULL, :title)''', values={
+                'cid': cid, 'title': title})
+        
+        await api.refresh_channel_titles(db, [cid])
+        assert await db.fetch_val(query='SELECT title FROM channels WHERE id = :cid', values={'cid': cid}) == 'b'
+    run_db(test)
@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+
+import pytest
+
+import api
+
+class FakeRequest:
+    # just the part of starlette's Request iter_upload_lines reads
+    def __init__(self, chunks):
+        self.chunks = chunks
+    
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+def read_lines(chunks, **kwargs):
+    async def collect():
+        return [line async for line in api.iter_upload_lines(FakeRequest(chunks), **kwargs)]
+    return asyncio.run(collect())
+
+def split_every(body, n):
+    return [body[i:i + n] for i in range(0, len(body), n)]
+
+BODY = b'{"id": "dQw4w9WgXcQ"}\n{"id": "aaaaaaaaaaA"}\r\n\nlast line'
+LINES = [b'{"id": "dQw4w9WgXcQ"}', b'{"id": "aaaaaaaaaaA"}\r', b'', b'last line']
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1 << 16])
+def test_plain_lines(size):
+    assert read_lines(split_every(BODY, size)) == LINES
+
+@pytest.mark.parametrize('size', [1, 2, 5, 1 << 16])
+def test_gzip_lines(size):
+    assert read_lines(split_every(gzip.compress(BODY), size)) == LINES
+
+def test_concatenated_gzip_members():
+    # `cat a.gz b.gz`, the second member starts in the middle of a chunk
+    body = gzip.compress(b'a\nb') + gzip.compress(b'c\nd\n')
+    assert read_lines(split_every(body, 13)) == [b'a', b'bc', b'd', b'']
+
+def test_short_bodies():
+    assert read_lines([]) == [b'']
+    assert read_lines([b'x']) == [b'x']
+    assert read_lines([b'', b'\x1f', b'']) == [b'\x1f']
+
+def test_truncated_gzip():
+    with pytest.raises(ValueError, match='truncated'):
+        read_lines([gzip.compress(BODY)[:-10]])
+
+def test_line_limit():
+    with pytest.raises(ValueError, match='line longer'):
+        read_lines([b'x' * 100, b'x' * 100], max_line=150)
+    # lines at the limit are fine, and so is a gzip bomb of short lines
+    assert len(read_lines(split_every(gzip.compress(b'x' * 64 + b'\n' * 100000), 1000), max_line=64)) == 100001
+
+def test_parse_submitted_video():
+    video, error = api.parse_submitted_video({
+        'id': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'title': 't', 'channel_id': 'UCuAXFkgsw1L7xaCfnd5JJOw',
+        'channel_title': 'c', 'filesize': '123', 'format_id': '22'})
+    assert error is None
+    assert video == {'id': 'dQw4w9WgXcQ', 'title': 't', 'channel_id': 'uAXFkgsw1L7xaCfnd5JJOw', 'channel_title': 'c',
+        'filesize': 123, 'format_id': '22'}
+
+def test_parse_submitted_video_empty_fields():
+    # empty strings are stored as nulls, and a channel title without a channel id is dropped
+    video, error = api.parse_submitted_video({'id': 'dQw4w9WgXcQ', 'title': '', 'channel_title': 'c', 'filesize': 0})
+    assert error is None
+    assert video == {'id': 'dQw4w9WgXcQ', 'title': None, 'channel_id': None, 'channel_title': None, 'filesize': None, 'format_id': None}
+
+@pytest.mark.parametrize('item, error', [
+    ('dQw4w9WgXcQ', 'missing `id`'),
+    ({'title': 't'}, 'missing `id`'),
+    ({'id': 123}, 'invalid video id'),
+    ({'id': 'dQw4w9WgXcR'}, 'invalid video id'),
+    ({'id': 'dQw4w9WgXcQ', 'channel_id': 'UCnotachannel'}, 'invalid channel id'),
+    ({'id': 'dQw4w9WgXcQ', 'filesize': '12a'}, 'filesize'),
+    ({'id': 'dQw4w9WgXcQ', 'filesize': 1.5}, 'filesize'),
+    ({'id': 'dQw4w9WgXcQ', 'title': 5}, 'title should be str'),
+    ({'id': 'dQw4w9WgXcQ', 'format_id': 'a\x00b'}, 'null character'),
+])
+def test_parse_submitted_video_errors(item, error):
+    video, message = api.parse_submitted_video(item, 3)
+    assert video is None and error in message
+
+def test_cursor_round_trip():
+    for last_id in [0, 1, 123456789, (5 << 32) | 77]:
+        assert api.decode_cursor('videos', api.encode_cursor('videos', last_id)) == last_id
+    assert '=' not in api.encode_cursor('videos', 1)
+
+@pytest.mark.parametrize('cursor', ['', '!!!', 'bm9wZQ', api.encode_cursor('channels', 5)])
+def test_cursor_rejected(cursor):
+    # garbage, no separator, and a token from another endpoint
+    assert api.decode_cursor('videos', cursor) is None
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from video_filter import VideoFilter
+import yt_ids
+from test_yt_ids import random_video_id
+
+def test_no_false_negatives():
+    random.seed(3)
+    held = [random_video_id() for _ in range(5000)]
+    vf = VideoFilter(len(held))
+    vf.update(held[:2500])
+    vf.update(yt_ids.video_id_to_int(v) for v in held[2500:])
+    assert vf.count == len(held)
+    assert all(v in vf for v in held)
+    assert all(yt_ids.video_id_to_int(v) in vf for v in held)
+    assert vf.check(held) == held
+
+def test_false_positive_rate():
+    random.seed(4)
+    vf = VideoFilter(10000, 0.01)
+    vf.update(random_video_id() for _ in range(10000))
+    others = [random_video_id() for _ in range(20000)]
+    rate = len(vf.check(others)) / len(others)
+    # at capacity the rate should sit around the target, the estimate should agree with it
+    assert rate < 0.02
+    assert abs(vf.estimated_fp_rate() - 0.01) < 0.005
+
+def test_invalid_ids_miss():
+    vf = VideoFilter(10)
+    vf.add('dQw4w9WgXcQ')
+    assert 'https://youtu.be/dQw4w9WgXcQ' not in vf
+    assert 'nope' not in vf
+    with pytest.raises(ValueError):
+        vf.add('nope')
+
+def test_serialization(tmp_path):
+    random.seed(5)
+    held = [random_video_id() for _ in range(1000)]
+    vf = VideoFilter(2000, 0.001)
+    vf.update(held)
+    vf.version, vf.built_at, vf.full_built_at = 7, 1700000000, 1690000000
+    
+    path = str(tmp_path / 'video_filter.bin')
+    vf.save(path)
+    loaded = VideoFilter.load(path)
+    assert (loaded.hashes, loaded.bits, loaded.count, loaded.capacity, loaded.version, loaded.built_at, loaded.full_built_at, loaded.fp_rate) == (
+        vf.hashes, vf.bits, vf.count, vf.capacity, 7, 1700000000, 1690000000, 0.001)
+    assert loaded.data == vf.data and loaded.check(held) == held
+    
+    buf = vf.to_bytes()
+    with pytest.raises(ValueError, match='not a video filter'):
+        VideoFilter.from_bytes(b'NOTAVF' + buf[6:])
+    with pytest.raises(ValueError, match='truncated'):
+        VideoFilter.from_bytes(buf[:-1])
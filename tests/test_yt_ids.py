@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+import yt_ids
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+def random_video_id():
+    return ''.join(random.choice(ALPHABET) for _ in range(10)) + random.choice('AEIMQUYcgkosw048')
+
+def random_channel_id():
+    return 'UC' + ''.join(random.choice(ALPHABET) for _ in range(21)) + random.choice('AQgw')
+
+def test_parse_ids():
+    assert yt_ids.parse_video_id('https://youtu.be/dQw4w9WgXcQ') == 'dQw4w9WgXcQ'
+    assert yt_ids.parse_video_id('<https://www.youtube.com/watch?v=dQw4w9WgXcQ>') == 'dQw4w9WgXcQ'
+    assert yt_ids.parse_channel_id('https://www.youtube.com/channel/UCuAXFkgsw1L7xaCfnd5JJOw') == 'uAXFkgsw1L7xaCfnd5JJOw'
+    assert yt_ids.parse_channel_id('uAXFkgsw1L7xaCfnd5JJOw') == 'uAXFkgsw1L7xaCfnd5JJOw'
+    # the last char carries 4 (videos) or 2 (channels) bits, anything else can't be a real id
+    for bad in ['dQw4w9WgXcR', 'dQw4w9WgXc', 'dQw4w9WgXcQQ', None, 5]:
+        assert yt_ids.parse_video_id(bad) is None
+    for bad in ['UCuAXFkgsw1L7xaCfnd5JJOx', 'UCuAXFkgsw1L7xaCfnd5JJO', None]:
+        assert yt_ids.parse_channel_id(bad) is None
+
+def test_video_id_round_trip():
+    random.seed(1)
+    for video_id in ['AAAAAAAAAAA', '__________w', 'dQw4w9WgXcQ'] + [random_video_id() for _ in range(1000)]:
+        n = yt_ids.video_id_to_int(video_id)
+        assert -(1 << 63) <= n < 1 << 63
+        assert yt_ids.int_to_video_id(n) == video_id
+
+def test_video_id_order_is_signed():
+    # ids from the second half of the alphabet are negative, like the postgres BIGINT keys
+    assert yt_ids.video_id_to_int('AAAAAAAAAAA') == 0
+    assert yt_ids.video_id_to_int('gAAAAAAAAAA') == -(1 << 63)
+
+def test_channel_id_round_trip():
+    random.seed(2)
+    for channel_id in ['UCAAAAAAAAAAAAAAAAAAAAAA', 'UC_____________________w'] + [random_channel_id() for _ in range(1000)]:
+        n = yt_ids.channel_id_to_int(channel_id)
+        assert 0 <= n < 1 << 128
+        assert n == yt_ids.channel_id_to_int(channel_id[2:])
+        assert yt_ids.int_to_channel_id(n, 'UC') == channel_id
+        assert yt_ids.int_to_channel_id(n) == channel_id[2:]
+
+@pytest.mark.parametrize('video_id', ['https://youtu.be/dQw4w9WgXcQ', 'dQw4w9WgXcR', ''])
+def test_video_id_to_int_rejects(video_id):
+    # urls parse, but only bare ids pack
+    with pytest.raises(ValueError):
+        yt_ids.video_id_to_int(video_id)
+
+@pytest.mark.parametrize('channel_id', ['https://www.youtube.com/channel/UCuAXFkgsw1L7xaCfnd5JJOw', 'XXuAXFkgsw1L7xaCfnd5JJOw', 'UCuAXFkgsw1L7xaCfnd5JJOx'])
+def test_channel_id_to_int_rejects(channel_id):
+    with pytest.raises(ValueError):
+        yt_ids.channel_id_to_int(channel_id)
+
+def test_pack_video_ids():
+    video_ids = ['dQw4w9WgXcQ', 'AAAAAAAAAAA', '__________w']
+    packed = yt_ids.pack_video_ids(video_ids)
+    assert packed.typecode == 'q' and len(packed.tobytes()) == 8 * len(video_ids)
+    assert yt_ids.unpack_video_ids(packed) == video_ids
+    with pytest.raises(ValueError):
+        yt_ids.pack_video_ids(video_ids + ['nope'])
+    assert yt_ids.unpack_video_ids(yt_ids.pack_video_ids(['nope'] + video_ids, skip_invalid=True)) == video_ids
+
+def test_pack_channel_ids():
+    channel_ids = ['UCuAXFkgsw1L7xaCfnd5JJOw', 'UCAAAAAAAAAAAAAAAAAAAAAA', 'UC_____________________w']
+    packed = yt_ids.pack_channel_ids(channel_ids)
+    assert packed.typecode == 'Q' and len(packed.tobytes()) == 16 * len(channel_ids)
+    assert yt_ids.unpack_channel_ids(packed, 'UC') == channel_ids
+    with pytest.raises(ValueError):
+        yt_ids.pack_channel_ids(channel_ids + ['nope'])
+    assert yt_ids.unpack_channel_ids(yt_ids.pack_channel_ids(['nope'] + channel_ids, skip_invalid=True), 'UC') == channel_ids
@@ -0,0 +1,101 @@
+from math import ceil, exp, log
+import os
+import struct
+from yt_ids import video_id_to_int
+
+# bloom filter over every video id the tracker holds, published next to the db dumps by build_video_filter.py
+# a miss means no contributor has the video, a hit means someone probably does (false positive rate is in the header)
+# usage:
+#   vf = VideoFilter.fetch('https://dya-t-api.strangled.net/dumps/video_filter.bin')  # or VideoFilter.load(path)
+#   'dQw4w9WgXcQ' in vf
+#   held = vf.check(list_of_ids)
+
+MAGIC = b'DYAVF1'
+HEADER = struct.Struct('<6sBQQQQQQd') # magic, hashes, bits, count, capacity, version, built_at, full_built_at, fp_rate
+MASK = 0xFFFFFFFFFFFFFFFF
+
+def mix64(n):
+    # splitmix64 finalizer
+    n = (n ^ (n >> 30)) * 0xBF58476D1CE4E5B9 & MASK
+    n = (n ^ (n >> 27)) * 0x94D049BB133111EB & MASK
+    return n ^ (n >> 31)
+
+class VideoFilter:
+    def __init__(self, capacity, fp_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.bits = ceil(-capacity * log(fp_rate) / log(2) ** 2 / 8) * 8
+        self.hashes = max(1, round(self.bits / capacity * log(2)))
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.count = 0
+        self.version = 0
+        self.built_at = 0
+        self.full_built_at = 0
+        self.data = bytearray(self.bits // 8)
+    
+    def positions(self, key):
+        # double hashing, key is a packed video id
+        h1 = mix64(key & MASK)
+        h2 = mix64((key ^ 0x9E3779B97F4A7C15) & MASK) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+    
+    def add(self, video_id):
+        # video id string or packed int (yt_ids.video_id_to_int)
+        key = video_id_to_int(video_id) if type(video_id) == str else video_id
+        data = self.data
+        for p in self.positions(key):
+            data[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+    
+    def update(self, video_ids):
+        for video_id in video_ids:
+            self.add(video_id)
+    
+    def __contains__(self, video_id):
+        if type(video_id) == str:
+            try:
+                video_id = video_id_to_int(video_id)
+            except ValueError:
+                return False
+        data = self.data
+        return all(data[p >> 3] & (1 << (p & 7)) for p in self.positions(video_id))
+    
+    def check(self, video_ids):
+        # the ids from video_ids that are probably held by someone
+        return [v for v in video_ids if v in self]
+    
+    def estimated_fp_rate(self):
+        return (1 - exp(-self.hashes * self.count / self.bits)) ** self.hashes
+    
+    def to_bytes(self):
+        return HEADER.pack(MAGIC, self.hashes, self.bits, self.count, self.capacity, self.version, self.built_at, self.full_built_at, self.fp_rate) + bytes(self.data)
+    
+    @classmethod
+    def from_bytes(cls, buf):
+        magic, hashes, bits, count, capacity, version, built_at, full_built_at, fp_rate = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError('not a video filter file')
+        if len(buf) - HEADER.size != bits // 8:
+            raise ValueError('truncated video filter file')
+        vf = cls.__new__(cls)
+        vf.hashes, vf.bits, vf.count, vf.capacity, vf.version, vf.built_at, vf.full_built_at, vf.fp_rate = hashes, bits, count, capacity, version, built_at, full_built_at, fp_rate
+        vf.data = bytearray(buf[HEADER.size:])
+        return vf
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+    
+    @classmethod
+    def fetch(cls, url):
+        import requests
+        resp = requests.get(url, timeout=300)
+        resp.raise_for_status()
+        return cls.from_bytes(resp.content)
+    
+    def save(self, path):
+        # written to a temp file and renamed so readers never see a half written filter
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,69 @@
+from array import array
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import re
+
+# youtube ids are base64url: a video id is 11 chars (64 bits, the last char only carries 4 bits),
+# a channel id is `UC` + 22 chars (128 bits, the last char only carries 2 bits)
+# so both pack losslessly into fixed width ints, videos into a signed 64-bit int (postgres BIGINT / array 'q')
+
+match_video_id = re.compile(r'^(?:<)?(?:http(?:s)?://)?(?:www\.)?(?:youtu\.be/)?(?:youtube\.com/watch\?v=)?([A-Za-z0-9_-]{10}[AEIMQUYcgkosw048])(?:>)?$')
+match_channel_id = re.compile(r'^(?:<)?(?:http(?:s)?://)?(?:www\.)?(?:youtube\.com/channel/)?(?:UC)?([A-Za-z0-9_-]{21}[AQgw])(?:>)?$')
+
+def parse_video_id(string):
+    # video id from an id or url, None if invalid
+    res = match_video_id.match(string) if type(string) == str else None
+    if res: return res[1]
+
+def parse_channel_id(string):
+    # channel id (without `UC` prefix) from an id or url, None if invalid
+    res = match_channel_id.match(string) if type(string) == str else None
+    if res: return res[1]
+
+def video_id_to_int(video_id):
+    if not parse_video_id(video_id) == video_id:
+        raise ValueError(f'invalid video id {video_id}')
+    return int.from_bytes(urlsafe_b64decode(video_id + '='), 'big', signed=True)
+
+def int_to_video_id(n):
+    return urlsafe_b64encode(n.to_bytes(8, 'big', signed=True)).decode('ascii')[:11]
+
+def channel_id_to_int(channel_id):
+    # unsigned 128-bit int, accepts ids with or without `UC`
+    c_id = parse_channel_id(channel_id)
+    if not c_id or not channel_id.endswith(c_id) or len(channel_id) - len(c_id) not in [0, 2]:
+        raise ValueError(f'invalid channel id {channel_id}')
+    return int.from_bytes(urlsafe_b64decode(c_id + '=='), 'big')
+
+def int_to_channel_id(n, prefix=''):
+    # pass prefix='UC' for the full youtube channel id
+    return prefix + urlsafe_b64encode(n.to_bytes(16, 'big')).decode('ascii')[:22]
+
+# batch versions, invalid ids raise ValueError unless skip_invalid is set (invalid ids are then dropped)
+
+def pack_video_ids(video_ids, skip_invalid=False):
+    # -> array('q'), 8 bytes per id
+    packed = array('q')
+    for video_id in video_ids:
+        try:
+            packed.append(video_id_to_int(video_id))
+        except ValueError:
+            if not skip_invalid: raise
+    return packed
+
+def unpack_video_ids(packed):
+    return [int_to_video_id(n) for n in packed]
+
+def pack_channel_ids(channel_ids, skip_invalid=False):
+    # -> array('Q') of (high, low) 64-bit halves, 16 bytes per id
+    packed = array('Q')
+    for channel_id in channel_ids:
+        try:
+            n = channel_id_to_int(channel_id)
+        except ValueError:
+            if not skip_invalid: raise
+            continue
+        packed.append(n >> 64); packed.append(n & 0xFFFFFFFFFFFFFFFF)
+    return packed
+
+def unpack_channel_ids(packed, prefix=''):
+    return [int_to_channel_id((packed[i] << 64) | packed[i + 1], prefix) for i in range(0, len(packed), 2)]